@@ -65,6 +65,8 @@ app.config['RAZORPAY_KEY_SECRET'] = os.environ.get('RAZORPAY_KEY_SECRET')
 # Import models
 with app.app_context():
     import models
+    # Registers the session hooks that keep the market statistics in step with results
+    import services.stats_service
 
     # Create all tables
     db.create_all()
@@ -21,6 +21,10 @@ class Config:
     TRAINING_DAYS = 60
     MODEL_REFRESH_HOURS = 6
     PREDICTION_CONFIDENCE_THRESHOLD = 0.7
+    MAX_INCREMENTAL_UPDATES = 7  # Full retrain after this many incremental updates
+    MODEL_RETENTION_VERSIONS = 3  # Model bundles kept per market (plus the current one)
+    TUNING_DAYS = 365  # History used for walk-forward hyperparameter search
+    TRAINING_CPU_BUDGET = int(os.environ.get("TRAINING_CPU_BUDGET", os.cpu_count() or 1))
     
     # Result Fetch Settings
     FETCH_INTERVAL_MINUTES = 15
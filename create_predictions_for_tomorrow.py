@@ -1,7 +1,8 @@
 import datetime
 from app import app, db
 from models import Result, Prediction
-import random
+from ml.predictor import prediction_rng
+from ml.patti_table import random_pattis
 import logging
 
 # Setup logging
@@ -10,24 +11,27 @@ logger = logging.getLogger(__name__)
 
 def generate_random_predictions(market, date):
     """Generate random predictions for a market on a specific date"""
+    # Seeded per (market, date) so reruns produce the same prediction
+    rng = prediction_rng(market, date)
+    
     # Generate 2 random digits for open
-    open_digits = [str(random.randint(0, 9)) for _ in range(2)]
+    open_digits = [str(d) for d in rng.integers(0, 10, size=2)]
     
     # Generate 2 random digits for close
-    close_digits = [str(random.randint(0, 9)) for _ in range(2)]
+    close_digits = [str(d) for d in rng.integers(0, 10, size=2)]
     
     # Generate 10 random jodis
     jodi_list = []
     while len(jodi_list) < 10:
-        jodi = f"{random.randint(0, 9)}{random.randint(0, 9)}"
+        jodi = f"{rng.integers(0, 10)}{rng.integers(0, 10)}"
         if jodi not in jodi_list:
             jodi_list.append(jodi)
     
-    # Generate 4 random pattis
-    patti_list = [str(random.randint(100, 999)) for _ in range(4)]
+    # Generate 4 random valid pattis
+    patti_list = random_pattis(rng, 4)
     
     # Calculate confidence score
-    confidence_score = round(random.uniform(0.7, 0.9), 2)
+    confidence_score = round(float(rng.uniform(0.7, 0.9)), 2)
     
     return {
         'date': date,
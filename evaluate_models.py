@@ -0,0 +1,29 @@
+import sys
+from app import app
+from services.prediction_service import analyze_feature_importance_for_all_markets, evaluate_models_for_all_markets
+
+def main():
+    """Score the current ML models and write the evaluation reports"""
+    # Usage: python evaluate_models.py [--plots] [--importance] [market ...]
+    flags = ('--plots', '--importance')
+    plots = '--plots' in sys.argv[1:]
+    importance = '--importance' in sys.argv[1:]
+    markets = [arg for arg in sys.argv[1:] if arg not in flags] or None
+    
+    print("Starting ML model evaluation...")
+    
+    with app.app_context():
+        summary = evaluate_models_for_all_markets(markets, plots=plots)
+        if importance:
+            _, ablation_df = analyze_feature_importance_for_all_markets(markets)
+    
+    if summary is None or summary.empty:
+        print("No models were evaluated")
+    else:
+        print(summary.to_string())
+    
+    if importance and not ablation_df.empty:
+        print(ablation_df.to_string())
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ import random
 import csv
 from app import app, db
 from models import Result
-from utils import calculate_derived_fields, parse_date
+from services.data_service import sync_results_store, upsert_rows
+from ml.results_store import append_csv_rows, csv_has_results, load_results_store
+from utils import calculate_derived_fields, calculate_digit_fields, parse_date
 from sqlalchemy.exc import SQLAlchemyError
 from config import Config
 
@@ -109,9 +111,6 @@ def scrape_satta_results():
                         except Exception as e:
                             print(f"Error parsing date {start_date}: {e}")
                             continue
-        except Exception as e:
-            print(f"Error parsing HTML for {market}: {e}")
-            continue
                             
                         # Get all cells (excluding the date range cell)
                         cells = cols[1:]
@@ -194,38 +193,24 @@ def update_csv_with_new_results(new_results_df):
         return False
     
     try:
-        # Load the existing CSV
-        existing_data = pd.read_csv(csv_path)
-        print(f"Loaded existing CSV with {len(existing_data)} rows")
-        
         # Calculate derived fields for new results
         for index, row in new_results_df.iterrows():
             derived_fields = calculate_derived_fields(row)
             for key, value in derived_fields.items():
                 new_results_df.at[index, key] = value
         
-        # Add new results to existing data, avoiding duplicates
-        # Create a key for comparison (Date + Market)
-        existing_data['key'] = existing_data['Date'] + existing_data['Market']
-        new_results_df['key'] = new_results_df['Date'] + new_results_df['Market']
-        
-        # Filter out rows that already exist in the CSV
-        new_rows = new_results_df[~new_results_df['key'].isin(existing_data['key'])]
+        # Filter out rows that already exist in the CSV, looked up in its columnar
+        # mirror instead of parsing the whole file
+        existing = csv_has_results(csv_path, new_results_df['Date'], new_results_df['Market'])
+        new_rows = new_results_df[~existing]
         
         if new_rows.empty:
             print("All results already exist in CSV, no updates needed")
             return False
         
-        # Remove the temporary key column
-        new_rows = new_rows.drop(columns=['key'])
-        existing_data = existing_data.drop(columns=['key'])
-        
-        # Append new rows to existing data
-        updated_data = pd.concat([existing_data, new_rows], ignore_index=True)
-        
-        # Save the updated data
-        updated_data.to_csv(csv_path, index=False)
-        print(f"Successfully updated CSV with {len(new_rows)} new results, total {len(updated_data)} rows")
+        # Append the new rows to the end of the CSV
+        append_csv_rows(csv_path, new_rows)
+        print(f"Successfully updated CSV with {len(new_rows)} new results")
         return True
     except Exception as e:
         print(f"Error updating CSV: {str(e)}")
@@ -248,56 +233,44 @@ def main():
         # If we have new results, add them directly to the database as well
         with app.app_context():
             try:
+                rows = []
                 for _, row in new_results_df.iterrows():
                     try:
                         # Parse the date
                         date_parts = row['Date'].split('/')
                         date_obj = datetime.date(int(date_parts[2]), int(date_parts[1]), int(date_parts[0]))
                         
-                        # Check if result already exists
-                        existing = Result.query.filter_by(date=date_obj, market=row['Market']).first()
-                        if existing:
-                            # Update existing result if needed
-                            if existing.open == 'Off' or existing.open is None:
-                                existing.open = row['Open']
-                            if existing.close == 'Off' or existing.close is None:
-                                existing.close = row['Close']
-                            if existing.jodi == 'Off' or existing.jodi is None:
-                                existing.jodi = row['Jodi']
-                            # Update other fields
-                            for field in ['day_of_week', 'is_weekend', 'open_sum', 'close_sum', 
-                                          'mirror_open', 'mirror_close', 'reverse_jodi']:
-                                if field in row and not pd.isna(row[field]):
-                                    setattr(existing, field, row[field])
-                            db.session.commit()
-                            print(f"Updated existing result for {row['Market']} on {row['Date']}")
-                        else:
-                            # Create new result
-                            new_result = Result(
-                                date=date_obj,
-                                market=row['Market'],
-                                open=row['Open'],
-                                jodi=row['Jodi'],
-                                close=row['Close'],
-                                day_of_week=row['day_of_week'],
-                                is_weekend=bool(row['is_weekend']) if 'is_weekend' in row else False
-                            )
-                            
-                            # Add calculated fields if they exist
-                            for field in ['open_sum', 'close_sum', 'mirror_open', 'mirror_close', 
-                                          'reverse_jodi', 'prev_jodi_distance']:
-                                if field in row and not pd.isna(row[field]):
-                                    setattr(new_result, field, row[field])
-                            
-                            db.session.add(new_result)
-                            db.session.commit()
-                            print(f"Added new result for {row['Market']} on {row['Date']}")
+                        result = {
+                            'date': date_obj,
+                            'market': row['Market'],
+                            'open': row['Open'],
+                            'jodi': row['Jodi'],
+                            'close': row['Close'],
+                            'day_of_week': row['day_of_week'],
+                            'is_weekend': bool(row['is_weekend']) if 'is_weekend' in row else False
+                        }
+                        
+                        # Add calculated fields if they exist
+                        for field in ['open_sum', 'close_sum', 'mirror_open', 'mirror_close', 
+                                      'reverse_jodi', 'prev_jodi_distance']:
+                            if field in row and not pd.isna(row[field]):
+                                result[field] = row[field]
+                        result.update(calculate_digit_fields(result))
+                        
+                        rows.append(result)
                     except Exception as e:
                         print(f"Error processing scraped row: {str(e)}")
-                        db.session.rollback()
                         continue
                 
-                print("Successfully processed scraped results")
+                # Insert new results and fill missing ('Off') values of existing ones
+                # in one statement
+                upsert_rows(Result, rows, fill_columns=(
+                    'open', 'close', 'jodi', 'open_panel', 'open_ank', 'jodi_num', 'close_ank', 'close_panel'
+                ))
+                db.session.commit()
+                sync_results_store(rows)
+                
+                print(f"Successfully processed {len(rows)} scraped results")
                 # After adding new results, return True to indicate success
                 return True
             except Exception as e:
@@ -319,6 +292,13 @@ def main():
         print(f"Error loading CSV data: {str(e)}")
         return False
     
+    # Skip the rows the database already has, as recorded in the results mirror
+    history = load_results_store()
+    if history is not None:
+        dates = pd.to_datetime(data['Date'], format='%d/%m/%Y', errors='coerce')
+        data = data[~history.contains(dates, data['Market'].astype(str))]
+        print(f"{len(data)} rows are not in the database yet")
+    
     # Process data in batches to avoid memory issues
     print(f"Importing all {len(data)} rows in batches")
     
@@ -329,13 +309,14 @@ def main():
     # Set up application context for database operations
     with app.app_context():
         count = 0
+        imported = []
         for market in data['Market'].unique():
             print(f"Processing market: {market}")
             market_data = data[data['Market'] == market]
             
             try:
                 # Process each row for this market
-                market_count = 0
+                rows = []
                 for _, row in market_data.iterrows():
                     try:
                         # Parse the date (assuming DD/MM/YYYY format in CSV)
@@ -346,42 +327,30 @@ def main():
                         if row['Open'] == 'Off' or row['Close'] == 'Off':
                             continue
                         
-                        # Check if result already exists
-                        existing = Result.query.filter_by(date=date_obj, market=row['Market']).first()
-                        if existing:
-                            # Skip if already exists
-                            continue
-                        
                         # Create new result record
-                        new_result = Result(
-                            date=date_obj,
-                            market=row['Market'],
-                            open=row['Open'],
-                            jodi=row['Jodi'],
-                            close=row['Close'],
-                            day_of_week=row['day_of_week'],
-                            is_weekend=bool(row['is_weekend']),
-                            open_sum=row['open_sum'] if not pd.isna(row['open_sum']) else None,
-                            close_sum=row['close_sum'] if not pd.isna(row['close_sum']) else None,
-                            mirror_open=row['mirror_open'] if not pd.isna(row['mirror_open']) else None,
-                            mirror_close=row['mirror_close'] if not pd.isna(row['mirror_close']) else None,
-                            reverse_jodi=row['reverse_jodi'] if not pd.isna(row['reverse_jodi']) else None,
-                            is_holiday=bool(row['is_holiday'])
-                        )
+                        result = {
+                            'date': date_obj,
+                            'market': row['Market'],
+                            'open': row['Open'],
+                            'jodi': row['Jodi'],
+                            'close': row['Close'],
+                            'day_of_week': row['day_of_week'],
+                            'is_weekend': bool(row['is_weekend']),
+                            'open_sum': row['open_sum'] if not pd.isna(row['open_sum']) else None,
+                            'close_sum': row['close_sum'] if not pd.isna(row['close_sum']) else None,
+                            'mirror_open': row['mirror_open'] if not pd.isna(row['mirror_open']) else None,
+                            'mirror_close': row['mirror_close'] if not pd.isna(row['mirror_close']) else None,
+                            'reverse_jodi': row['reverse_jodi'] if not pd.isna(row['reverse_jodi']) else None,
+                            'is_holiday': bool(row['is_holiday']),
+                            'prev_jodi_distance': None
+                        }
                         
                         # Check if prev_jodi_distance exists in the row
                         if 'prev_jodi_distance' in row and not pd.isna(row['prev_jodi_distance']):
-                            new_result.prev_jodi_distance = row['prev_jodi_distance']
-                        
-                        # Add to database
-                        db.session.add(new_result)
-                        count += 1
-                        market_count += 1
+                            result['prev_jodi_distance'] = row['prev_jodi_distance']
+                        result.update(calculate_digit_fields(result))
                         
-                        # Commit in smaller batches
-                        if market_count % 200 == 0:
-                            db.session.commit()
-                            print(f"Processed {market_count} rows for {market}, total {count}/{total_rows}")
+                        rows.append(result)
                         
                     except Exception as e:
                         print(f"Error processing row for {market}: {str(e)}")
@@ -389,10 +358,14 @@ def main():
                         # Continue with next row
                         continue
                 
-                # Commit remaining rows for this market
+                # Insert the market's rows in batches, skipping results that already exist
                 try:
-                    db.session.commit()
-                    print(f"Completed market {market}: {market_count} records imported")
+                    for start in range(0, len(rows), BATCH_SIZE):
+                        upsert_rows(Result, rows[start:start + BATCH_SIZE], update=False)
+                        db.session.commit()
+                    count += len(rows)
+                    imported.extend(rows)
+                    print(f"Completed market {market}: {len(rows)} records processed, total {count}/{total_rows}")
                 except SQLAlchemyError as e:
                     db.session.rollback()
                     print(f"Database error when committing {market} data: {str(e)}")
@@ -402,6 +375,7 @@ def main():
                 traceback.print_exc()
                 db.session.rollback()
         
+        sync_results_store(imported)
         print(f"Successfully processed {count} results across all markets")
         return True
 
@@ -166,10 +166,10 @@ def generate_predictions_for_all_markets():
             
             # Generate prediction
             logger.info(f"Generating prediction for {market} on {next_day}")
-            prediction_data = generate_predictions(df, market)
+            prediction_data = generate_predictions(df, market, next_day)
             
             # Calculate confidence
-            confidence_score = calculate_confidence_score(market)
+            confidence_score = calculate_confidence_score(market, target_date=next_day)
             
             # Create prediction
             new_prediction = Prediction(
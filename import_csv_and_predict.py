@@ -3,6 +3,7 @@ import datetime
 from app import app, db
 from models import Result, Prediction
 from ml.predictor import generate_predictions, calculate_confidence_score
+from services.data_service import import_csv_data, load_market_history
 import logging
 
 # Set up logging
@@ -15,56 +16,9 @@ def import_csv_to_database():
     """Import data from CSV to database"""
     logger.info(f"Importing data from {CSV_FILE}")
     
-    # Load CSV
-    df = pd.read_csv(CSV_FILE)
-    logger.info(f"Loaded {len(df)} rows from CSV")
-    
-    # Process each row
-    count = 0
-    for _, row in df.iterrows():
-        try:
-            # Parse date
-            date_parts = row['Date'].split('/')
-            date_obj = datetime.date(int(date_parts[2]), int(date_parts[1]), int(date_parts[0]))
-            
-            # Check if result exists
-            existing = Result.query.filter_by(date=date_obj, market=row['Market']).first()
-            
-            if existing:
-                # Skip existing records
-                continue
-            
-            # Create new result
-            new_result = Result(
-                date=date_obj,
-                market=row['Market'],
-                open=row['Open'],
-                jodi=row['Jodi'],
-                close=row['Close'],
-                day_of_week=row['day_of_week'],
-                is_weekend=bool(row['is_weekend']),
-                is_holiday=bool(row['is_holiday']) if 'is_holiday' in row else False
-            )
-            
-            # Add derived fields
-            for field in ['open_sum', 'close_sum', 'mirror_open', 'mirror_close', 'reverse_jodi', 'prev_jodi_distance']:
-                if field in row and not pd.isna(row[field]):
-                    setattr(new_result, field, row[field])
-            
-            db.session.add(new_result)
-            count += 1
-            
-            # Commit in batches
-            if count % 100 == 0:
-                db.session.commit()
-                logger.info(f"Imported {count} records")
-        
-        except Exception as e:
-            logger.error(f"Error importing {row['Date']}, {row['Market']}: {e}")
-            continue
-    
-    # Final commit
-    db.session.commit()
+    # Streamed, bulk import; also refreshes the columnar results mirror
+    stats = import_csv_data(CSV_FILE)
+    count = stats['inserted']
     logger.info(f"Successfully imported {count} records")
     return count
 
@@ -95,31 +49,8 @@ def generate_predictions_for_all_markets():
                 logger.info(f"Prediction already exists for {market} on {next_day}")
                 continue
             
-            # Get all results for this market
-            results = Result.query.filter_by(market=market).order_by(Result.date).all()
-            
-            # Convert to DataFrame
-            data = []
-            for r in results:
-                row = {
-                    'Date': r.date.strftime('%d/%m/%Y'),
-                    'Market': r.market,
-                    'Open': r.open,
-                    'Jodi': r.jodi,
-                    'Close': r.close,
-                    'day_of_week': r.day_of_week,
-                    'is_weekend': r.is_weekend,
-                    'open_sum': r.open_sum,
-                    'close_sum': r.close_sum,
-                    'mirror_open': r.mirror_open,
-                    'mirror_close': r.mirror_close,
-                    'reverse_jodi': r.reverse_jodi,
-                    'is_holiday': r.is_holiday,
-                    'prev_jodi_distance': r.prev_jodi_distance
-                }
-                data.append(row)
-            
-            df = pd.DataFrame(data)
+            # Get all results for this market from the results mirror
+            df = load_market_history(market)
             
             if len(df) < 30:
                 logger.warning(f"Not enough data for {market}, need at least 30 days. Got {len(df)} days.")
@@ -127,10 +58,10 @@ def generate_predictions_for_all_markets():
             
             # Generate prediction
             logger.info(f"Generating prediction for {market} on {next_day}")
-            prediction_data = generate_predictions(df, market)
+            prediction_data = generate_predictions(df, market, next_day)
             
             # Calculate confidence
-            confidence_score = calculate_confidence_score(market)
+            confidence_score = calculate_confidence_score(market, target_date=next_day)
             
             # Create prediction
             new_prediction = Prediction(
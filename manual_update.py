@@ -241,10 +241,10 @@ def generate_predictions_for_all_markets():
                 continue
             
             # Generate prediction
-            prediction_data = generate_predictions(df, market)
+            prediction_data = generate_predictions(df, market, next_day)
             
             # Calculate confidence
-            confidence_score = calculate_confidence_score(market)
+            confidence_score = calculate_confidence_score(market, target_date=next_day)
             
             # Create new prediction
             new_prediction = Prediction(
@@ -0,0 +1,74 @@
+"""Add integer digit columns to results
+
+Revision ID: d92f6b3c8e14
+Revises: b7d24e91c3a5
+Create Date: 2026-10-17 16:48:09.215730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd92f6b3c8e14'
+down_revision = 'b7d24e91c3a5'
+branch_labels = None
+depends_on = None
+
+DIGIT_COLUMNS = ('open_panel', 'open_ank', 'jodi_num', 'close_ank', 'close_panel')
+
+# Rows updated per backfill statement
+BACKFILL_BATCH = 1000
+
+
+def _digit_fields(open_value, jodi_value, close_value):
+    """Same values as utils.calculate_digit_fields, without importing the app"""
+    def _number(value, width):
+        value = (value or '').strip()
+        return int(value) if len(value) == width and value.isdigit() else None
+
+    jodi_num = _number(jodi_value, 2)
+    fields = {'jodi_num': jodi_num}
+    for side, value, jodi_digit in (
+        ('open', open_value, jodi_num // 10 if jodi_num is not None else None),
+        ('close', close_value, jodi_num % 10 if jodi_num is not None else None)
+    ):
+        panel = _number(value, 3)
+        fields[f'{side}_panel'] = panel
+        fields[f'{side}_ank'] = sum(int(digit) for digit in f'{panel:03d}') % 10 if panel is not None else jodi_digit
+    return fields
+
+
+def upgrade():
+    with op.batch_alter_table('results', schema=None) as batch_op:
+        for column in DIGIT_COLUMNS:
+            batch_op.add_column(sa.Column(column, sa.SmallInteger(), nullable=True))
+        batch_op.create_index('idx_result_market_jodi_num', ['market', 'jodi_num'], unique=False)
+
+    # Backfill from the stored result strings
+    results = sa.table(
+        'results',
+        sa.column('id', sa.Integer),
+        sa.column('open', sa.String),
+        sa.column('jodi', sa.String),
+        sa.column('close', sa.String),
+        *[sa.column(column, sa.SmallInteger) for column in DIGIT_COLUMNS]
+    )
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(results.c.id, results.c.open, results.c.jodi, results.c.close)).fetchall()
+    update = results.update().where(results.c.id == sa.bindparam('row_id')).values(
+        **{column: sa.bindparam(column) for column in DIGIT_COLUMNS}
+    )
+    for start in range(0, len(rows), BACKFILL_BATCH):
+        batch = [
+            {'row_id': row.id, **_digit_fields(row.open, row.jodi, row.close)}
+            for row in rows[start:start + BACKFILL_BATCH]
+        ]
+        connection.execute(update, batch)
+
+
+def downgrade():
+    with op.batch_alter_table('results', schema=None) as batch_op:
+        batch_op.drop_index('idx_result_market_jodi_num')
+        for column in reversed(DIGIT_COLUMNS):
+            batch_op.drop_column(column)
@@ -0,0 +1,90 @@
+"""Add the market_stats table
+
+Revision ID: e5b1c7a9f203
+Revises: d92f6b3c8e14
+Create Date: 2026-10-17 18:32:41.508916
+
+"""
+from collections import Counter
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1c7a9f203'
+down_revision = 'd92f6b3c8e14'
+branch_labels = None
+depends_on = None
+
+# Period of the all-time cells, as services.stats_service.ALL_TIME
+ALL_TIME = 0
+
+
+def _market_cells(rows):
+    """Cells of one market's results in date order, as services.stats_service.rebuild_market_stats"""
+    cells = Counter()
+
+    def _add(kind, date, value):
+        cells[(kind, ALL_TIME, value)] += 1
+        cells[(kind, date.year * 100 + date.month, value)] += 1
+
+    previous = None
+    for row in rows:
+        _add('total', row.date, 0)
+        for kind, value in (('jodi', row.jodi_num), ('open_ank', row.open_ank), ('close_ank', row.close_ank)):
+            if value is not None:
+                _add(kind, row.date, value)
+        if row.jodi_num is None:
+            continue
+        _add('weekday', row.date, row.date.weekday())
+        if previous is not None:
+            _add('transition', row.date, previous * 100 + row.jodi_num)
+        previous = row.jodi_num
+    return cells
+
+
+def upgrade():
+    market_stats = op.create_table(
+        'market_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('market', sa.String(length=50), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('period', sa.Integer(), nullable=False),
+        sa.Column('value', sa.SmallInteger(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('market_stats', schema=None) as batch_op:
+        batch_op.create_index('idx_market_stat_cell', ['market', 'kind', 'period', 'value'], unique=True)
+
+    # Backfill from the stored results
+    results = sa.table(
+        'results',
+        sa.column('market', sa.String),
+        sa.column('date', sa.Date),
+        sa.column('jodi_num', sa.SmallInteger),
+        sa.column('open_ank', sa.SmallInteger),
+        sa.column('close_ank', sa.SmallInteger)
+    )
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(results.c.market, results.c.date, results.c.jodi_num, results.c.open_ank, results.c.close_ank)
+        .order_by(results.c.market, results.c.date)
+    ).fetchall()
+
+    by_market = {}
+    for row in rows:
+        by_market.setdefault(row.market, []).append(row)
+    for market, market_rows in by_market.items():
+        cells = [
+            {'market': market, 'kind': kind, 'period': period, 'value': value, 'count': count}
+            for (kind, period, value), count in _market_cells(market_rows).items()
+        ]
+        op.bulk_insert(market_stats, cells)
+
+
+def downgrade():
+    with op.batch_alter_table('market_stats', schema=None) as batch_op:
+        batch_op.drop_index('idx_market_stat_cell')
+
+    op.drop_table('market_stats')
@@ -0,0 +1,153 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import Config
+from ml.market_state import MarketState
+from ml.predictor import data_version, prediction_rng, predictions_from_engine
+from utils import is_matching_prediction
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Historical results replayed by the backtest
+HISTORY_CSV = "enhanced_satta_data.csv"
+
+# Same minimum window as generate_predictions; earlier days are not scored
+MIN_HISTORY = 30
+
+MATCH_COLUMNS = ['open', 'close', 'jodi', 'patti_open', 'patti_close']
+
+
+def load_history(csv_path=HISTORY_CSV):
+    """
+    Load the results history for backtesting
+
+    Returns:
+        DataFrame with a datetime 'Date' column and string result columns, sorted
+        by market and date
+    """
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y')
+    return df.sort_values(['Market', 'Date'], kind='stable').reset_index(drop=True)
+
+
+def backtest_market(market, market_df, window=Config.TRAINING_DAYS, min_history=MIN_HISTORY):
+    """
+    Walk forward through one market's history
+
+    Each day is predicted from the preceding `window` days only, using the same
+    seeded generator the live predictor would use for that window, then scored
+    against the actual result with `utils.is_matching_prediction`.
+
+    Args:
+        market: Market name
+        market_df: The market's rows from `load_history` (oldest first)
+        window: Calendar days of preceding results the prediction sees
+        min_history: Minimum preceding results before a day is scored
+
+    Returns:
+        DataFrame with one row per scored day and one boolean column per match type
+    """
+    state = MarketState(market, window)
+    records = []
+
+    for row in market_df.itertuples(index=False):
+        date = row.Date.date()
+
+        if row.Jodi.isdigit() and len(state) >= min_history:
+            jodis = np.array(state.jodis, dtype=np.int16)
+            pattis = np.array(state.pattis, dtype=np.int16)
+            rng = prediction_rng(market, date, data_version(jodis, pattis))
+            prediction = predictions_from_engine(state.engine, rng)
+
+            matches = is_matching_prediction(prediction, {
+                'open': row.Open,
+                'close': row.Close,
+                'jodi': row.Jodi.zfill(2)
+            })
+            record = {'market': market, 'date': date}
+            record.update({col: matches.get(col) for col in MATCH_COLUMNS})
+            records.append(record)
+
+        state.push(date, row.Jodi)
+
+    return pd.DataFrame(records, columns=['market', 'date'] + MATCH_COLUMNS)
+
+
+def _backtest_market_args(args):
+    """Process pool entry point for `backtest_market`"""
+    return backtest_market(*args)
+
+
+def summarize(daily_df):
+    """
+    Hit-rate table per market plus an 'All' row
+
+    Returns:
+        DataFrame indexed by market with the number of scored days and the hit rate
+        (percent) for every match type
+    """
+    def _hit_rates(group):
+        rates = {'days': len(group)}
+        for col in MATCH_COLUMNS:
+            scored = group[col].dropna()
+            rates[f'{col}_hit_rate'] = round(100 * scored.astype(bool).mean(), 2) if len(scored) else None
+        return pd.Series(rates)
+
+    if daily_df.empty:
+        return pd.DataFrame(columns=['days'] + [f'{col}_hit_rate' for col in MATCH_COLUMNS])
+
+    summary = daily_df.groupby('market')[MATCH_COLUMNS].apply(_hit_rates)
+    summary.loc['All'] = _hit_rates(daily_df)
+    return summary
+
+
+def run_backtest(csv_path=HISTORY_CSV, markets=None, window=Config.TRAINING_DAYS,
+                 min_history=MIN_HISTORY, max_workers=None):
+    """
+    Replay the results history day by day for every market
+
+    Markets are independent, so each one runs in its own worker process.
+
+    Args:
+        csv_path: Results history CSV
+        markets: Markets to replay (defaults to every market in the CSV)
+        window: Number of preceding results each prediction sees
+        min_history: Minimum preceding results before a day is scored
+        max_workers: Process pool size (defaults to the CPU count)
+
+    Returns:
+        Tuple (daily_df, summary_df)
+    """
+    history = load_history(csv_path)
+    if markets is not None:
+        history = history[history['Market'].isin(markets)]
+
+    jobs = [(market, market_df, window, min_history)
+            for market, market_df in history.groupby('Market', sort=True)]
+    logger.info(f"Backtesting {len(jobs)} markets over {len(history)} results")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        daily_frames = list(executor.map(_backtest_market_args, jobs))
+
+    daily_frames = [frame for frame in daily_frames if not frame.empty]
+    if daily_frames:
+        daily_df = pd.concat(daily_frames, ignore_index=True)
+    else:
+        daily_df = pd.DataFrame(columns=['market', 'date'] + MATCH_COLUMNS)
+    return daily_df, summarize(daily_df)
+
+
+if __name__ == "__main__":
+    import sys
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else HISTORY_CSV
+    daily_df, summary_df = run_backtest(csv_path)
+    print(summary_df.to_string())
+
+    output_path = os.path.join("ml_models", "backtest_daily.csv")
+    daily_df.to_csv(output_path, index=False)
+    print(f"Daily results written to {output_path}")
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+from config import Config
+from ml.pattern_engine import frame_jodi_codes
+
+
+def as_dates(values):
+    """datetime64[D] array from 'dd/mm/YYYY' strings, dates or datetime64 values"""
+    values = pd.Series(values)
+    if values.dtype == object and values.astype(str).str.contains('/').any():
+        return pd.to_datetime(values, format='%d/%m/%Y').to_numpy(dtype='datetime64[D]')
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[D]')
+
+
+def market_order(markets):
+    """Markets sorted by close time (markets missing from Config.MARKETS last)"""
+    def _close_time(market):
+        settings = Config.MARKETS.get(market)
+        return (settings is None, settings['close_time'] if settings else '', market)
+    return sorted(markets, key=_close_time)
+
+
+class CrossMarketMatrix:
+    """
+    All markets' results pivoted into one date-indexed matrix
+
+    `digits[i, j]` holds the open and close digits (first and second jodi digits)
+    of market `markets[j]` on `dates[i]`, -1 where there is no result. Built once
+    per load and shared by every market's feature pipeline.
+
+    Attributes:
+        dates: Sorted datetime64[D] array
+        markets: Market names in close-time order
+        digits: int8 array (dates x markets x 2)
+    """
+
+    def __init__(self, dates, markets, digits):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.markets = list(markets)
+        self.digits = digits
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Build the matrix from a results frame with 'Date', 'Market' and 'Jodi' columns
+        (e.g. services.data_service.load_results_frame)
+        """
+        dates = as_dates(df['Date'])
+        markets = market_order(pd.unique(df['Market'].astype(str)))
+        unique_dates = np.unique(dates)
+
+        digits = np.full((len(unique_dates), len(markets), 2), -1, dtype=np.int8)
+        codes = frame_jodi_codes(df)
+        valid = codes >= 0
+        row = np.searchsorted(unique_dates, dates[valid])
+        col = pd.Categorical(df['Market'].astype(str)[valid], categories=markets).codes
+        digits[row, col, 0] = codes[valid] // 10
+        digits[row, col, 1] = codes[valid] % 10
+        return cls(unique_dates, markets, digits)
+
+    def feature_names(self, market, markets=None):
+        """Names of the cross-market columns for one market's model"""
+        others = [m for m in (markets if markets is not None else self.markets) if m != market]
+        return [f'cross_{other}_{side}' for other in others for side in ('open', 'close')]
+
+    def features(self, market, dates, markets=None):
+        """
+        Other markets' latest digits known when `market` closes on each date
+
+        Markets that close earlier contribute their latest result up to and
+        including that day; markets that close later contribute their latest result
+        before that day, so nothing is taken from after `market`'s close.
+
+        Args:
+            market: Market the features are for
+            dates: Dates of the market's rows
+            markets: Other markets to include, in order (defaults to all known ones)
+
+        Returns:
+            int8 array (len(dates) x 2 * number of other markets), -1 where unknown
+        """
+        order = market_order(set(self.markets) | {market})
+        position = order.index(market)
+        others = [m for m in (markets if markets is not None else self.markets) if m != market]
+        dates = as_dates(dates)
+
+        block = np.full((len(dates), len(others), 2), -1, dtype=np.int8)
+        for j, other in enumerate(others):
+            if other not in self.markets:
+                continue
+            column = self.markets.index(other)
+            known = self.digits[:, column, 0] >= 0
+            same_day = order.index(other) < position
+            rows = np.searchsorted(self.dates[known], dates, side='right' if same_day else 'left') - 1
+            found = rows >= 0
+            block[found, j] = self.digits[known, column][rows[found]]
+        return block.reshape(len(dates), 2 * len(others))
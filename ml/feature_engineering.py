@@ -1,52 +1,228 @@
-import pandas as pd
 import numpy as np
-from datetime import datetime
-
-
-def engineer_features(df):
-    """Engineer features for the ML model"""
-    # Create a copy to avoid modifying the original
-    df = df.copy()
-    
-    # Convert date to datetime
-    df['datetime'] = pd.to_datetime(df['Date'], format='%d/%m/%Y')
-    
-    # Extract date components
-    df['day_of_week_num'] = df['datetime'].dt.dayofweek
-    df['month'] = df['datetime'].dt.month
-    df['year'] = df['datetime'].dt.year
-    
-    # Extract digits from open, close, jodi
-    df['open_first'] = df['Open'].apply(lambda x: int(str(x)[0]) if isinstance(x, str) and len(str(x)) >= 1 else np.nan)
-    df['open_last'] = df['Open'].apply(lambda x: int(str(x)[-1]) if isinstance(x, str) and len(str(x)) >= 1 else np.nan)
-    df['close_first'] = df['Close'].apply(lambda x: int(str(x)[0]) if isinstance(x, str) and len(str(x)) >= 1 else np.nan)
-    df['close_last'] = df['Close'].apply(lambda x: int(str(x)[-1]) if isinstance(x, str) and len(str(x)) >= 1 else np.nan)
-    df['jodi_first'] = df['Jodi'].apply(lambda x: int(str(x)[0]) if isinstance(x, str) and len(str(x)) >= 1 else np.nan)
-    df['jodi_last'] = df['Jodi'].apply(lambda x: int(str(x)[1]) if isinstance(x, str) and len(str(x)) >= 2 else np.nan)
-    df['jodi_numeric'] = df['Jodi'].apply(lambda x: int(x) if isinstance(x, str) and x.isdigit() else np.nan)
-    
-    # Create lag features
-    for col in ['open_first', 'open_last', 'close_first', 'close_last', 'jodi_first', 'jodi_last', 'jodi_numeric']:
-        df[f'prev_{col}'] = df[col].shift(1)
-    
-    # Create rolling statistics
-    df['open_sum_rolling_mean'] = df['open_sum'].rolling(window=7, min_periods=1).mean()
-    df['close_sum_rolling_mean'] = df['close_sum'].rolling(window=7, min_periods=1).mean()
-    
-    # Calculate additional features based on day of week patterns
-    df['is_start_of_week'] = df['day_of_week_num'] == 0
-    df['is_end_of_week'] = df['day_of_week_num'] == 6
-    
-    # Calculate day of week frequency features
-    dow_frequencies = df.groupby('day_of_week_num')['jodi_numeric'].value_counts().unstack().fillna(0)
-    if not dow_frequencies.empty:
-        for jodi_val in range(100):
-            if jodi_val in dow_frequencies.columns:
-                df[f'jodi_{jodi_val}_freq'] = df['day_of_week_num'].map(dow_frequencies[jodi_val])
-    
-    # Fill missing values
-    for col in df.columns:
-        if df[col].dtype == np.float64 or df[col].dtype == np.int64:
-            df[col] = df[col].fillna(df[col].median())
-    
-    return df
+import pandas as pd
+from ml.pattern_engine import encode_jodis
+
+# Rows of history a feature row looks at (7-day rolling statistics)
+ROLLING_WINDOW = 7
+
+# Columns never used as model inputs
+EXCLUDED_COLUMNS = ('is_holiday', 'Date', 'Market',
+                    'open_panel', 'open_ank', 'jodi_num', 'close_ank', 'close_panel')
+
+# Weekday one-hot categories of pipelines saved before they were fitted; fitted
+# pipelines keep the order the days first appear in, as the original trainer did
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# Derived jodi pattern features, in output order
+PATTERN_COLUMNS = [
+    'jodi_numeric', 'prev_jodi', 'jodi_distance',
+    'jodi_first_digit', 'jodi_second_digit', 'prev_jodi_first', 'prev_jodi_second',
+    'is_flip', 'near_miss_first', 'near_miss_second', 'is_near_miss',
+] + [f'{position}_digit_{digit}_freq' for digit in range(10) for position in ('first', 'second')] + [
+    'jodi_7day_avg', 'jodi_7day_std', 'jodi_trend',
+]
+
+
+def _column(data, name, length):
+    """One input column as an array (DataFrame or mapping of sequences)"""
+    if name not in data:
+        return np.full(length, np.nan)
+    values = data[name]
+    return values.to_numpy() if hasattr(values, 'to_numpy') else np.asarray(values)
+
+
+def _rolling_sum(values, window):
+    """Sum of the trailing `window` values (fewer at the start)"""
+    cumulative = np.cumsum(values, axis=0)
+    sums = cumulative.copy()
+    sums[window:] -= cumulative[:-window]
+    return sums
+
+
+def _shift(values):
+    """Previous row's value, 0 for the first row"""
+    shifted = np.zeros_like(values)
+    shifted[1:] = values[:-1]
+    return shifted
+
+
+class FeaturePipeline:
+    """
+    Numeric feature pipeline shared by training and online inference
+
+    `fit` learns which numeric source columns a frame has; `transform` turns any
+    frame of results into the model feature matrix and `transform_one` computes
+    only the last row from the trailing window. The pipeline holds plain Python
+    values, so it pickles with the model bundle and round-trips through
+    `get_config` / `from_config`.
+
+    Attributes:
+        source_columns: Numeric input columns copied as features
+        days: 'day_of_week' values one-hot encoded as features, in the order they
+            first appear in the fitted frame
+        market: Market the pipeline was fitted for (set with cross-market features)
+        cross_markets: Other markets whose latest digits are appended as features
+            (see ml.cross_market.CrossMarketMatrix)
+        columns: Names of all output features, in matrix order
+    """
+
+    days = DAYS
+
+    def __init__(self, source_columns=None, market=None, cross_markets=None, days=DAYS):
+        self.source_columns = list(source_columns) if source_columns is not None else None
+        self.market = market
+        self.cross_markets = list(cross_markets or [])
+        self.days = list(days)
+
+    @property
+    def columns(self):
+        cross = [f'cross_{other}_{side}' for other in self.cross_markets for side in ('open', 'close')]
+        return self.source_columns + PATTERN_COLUMNS + [f'day_{day}' for day in self.days] + cross
+
+    def fit(self, df, cross=None):
+        """
+        Learn the numeric source columns of a results frame
+
+        Args:
+            df: One market's results frame
+            cross: Optional CrossMarketMatrix; the other markets in it become
+                cross-market features
+
+        Returns:
+            self
+        """
+        self.source_columns = [
+            col for col in df.columns
+            if col not in EXCLUDED_COLUMNS and pd.api.types.is_numeric_dtype(df[col])
+        ]
+        self.days = []
+        if 'day_of_week' in df.columns and df['day_of_week'].dtype == object:
+            self.days = list(df['day_of_week'].fillna('').unique())
+        if cross is not None and 'Market' in df.columns and len(df):
+            self.market = str(df['Market'].iloc[0])
+            self.cross_markets = [m for m in cross.markets if m != self.market]
+        return self
+
+    def transform(self, df, cross=None):
+        """
+        Feature matrix of a results frame (oldest first)
+
+        Every row holds the features known at the end of that day.
+
+        Args:
+            df: Results frame
+            cross: CrossMarketMatrix for pipelines fitted with one (its features are
+                -1, i.e. unknown, without it)
+
+        Returns:
+            float64 array (rows x len(columns))
+        """
+        n = len(df)
+        parts = [self._source_block(df, n), self._pattern_block(df, n), self._day_block(df, n)]
+        if self.cross_markets:
+            parts.append(self.cross_block(df, cross))
+        return np.hstack(parts) if n else np.zeros((0, len(self.columns)))
+
+    def transform_frame(self, df, cross=None):
+        """`transform` as a DataFrame with the feature names as columns"""
+        return pd.DataFrame(self.transform(df, cross), columns=self.columns, index=getattr(df, 'index', None))
+
+    def transform_one(self, last_window, cross=None):
+        """
+        Features of the last row only
+
+        Args:
+            last_window: Results frame or mapping of column sequences whose last row is
+                the day to featurize; only its trailing ROLLING_WINDOW rows are read
+            cross: CrossMarketMatrix, as for `transform`
+
+        Returns:
+            float64 array (len(columns),)
+        """
+        if isinstance(last_window, pd.DataFrame):
+            tail = last_window.iloc[-ROLLING_WINDOW:]
+        else:
+            tail = {name: list(values)[-ROLLING_WINDOW:] for name, values in last_window.items()}
+        return self.transform(_Rows(tail), cross)[-1]
+
+    def _source_block(self, df, n):
+        block = np.zeros((n, len(self.source_columns)))
+        for i, col in enumerate(self.source_columns):
+            values = pd.to_numeric(pd.Series(_column(df, col, n)), errors='coerce').to_numpy(dtype=float)
+            block[:, i] = np.nan_to_num(values, nan=0.0)
+        return block
+
+    def _pattern_block(self, df, n):
+        codes = encode_jodis(_column(df, 'Jodi', n)).astype(np.int64)
+        valid = codes >= 0
+        jodi = np.where(valid, codes, 0).astype(float)
+        first = np.where(valid, codes // 10, 0).astype(float)
+        second = np.where(valid, codes % 10, 0).astype(float)
+
+        has_prev = np.arange(n) > 0
+        prev_jodi, prev_first, prev_second = _shift(jodi), _shift(first), _shift(second)
+        near_first = np.where(has_prev, np.abs(first - prev_first), 0)
+        near_second = np.where(has_prev, np.abs(second - prev_second), 0)
+        is_flip = has_prev & (first == prev_second) & (second == prev_first)
+        is_near_miss = has_prev & (near_first <= 1) & (near_second <= 1) & ((near_first > 0) | (near_second > 0))
+
+        one_hot = np.arange(10)
+        first_freq = _rolling_sum((first[:, None] == one_hot).astype(float), ROLLING_WINDOW)
+        second_freq = _rolling_sum((second[:, None] == one_hot).astype(float), ROLLING_WINDOW)
+        freq = np.empty((n, 20))
+        freq[:, 0::2] = first_freq
+        freq[:, 1::2] = second_freq
+
+        # pandas' rolling kernels keep the mean and std bit-identical to the features
+        # existing models were trained on
+        rolling = pd.Series(jodi).rolling(window=ROLLING_WINDOW, min_periods=1)
+        mean = rolling.mean().to_numpy()
+        std = np.nan_to_num(rolling.std().to_numpy(), nan=0.0)
+
+        return np.column_stack([
+            jodi, prev_jodi, np.where(has_prev, np.abs(jodi - prev_jodi), 0),
+            first, second, prev_first, prev_second,
+            is_flip, near_first, near_second, is_near_miss,
+            freq,
+            mean, std, np.where(has_prev, jodi - prev_jodi, 0),
+        ]).astype(float)
+
+    def _day_block(self, df, n):
+        days = pd.Series(_column(df, 'day_of_week', n), dtype=object).fillna('').to_numpy()
+        return (days[:, None] == np.array(self.days, dtype=object)).astype(np.uint8)
+
+    def cross_block(self, df, cross):
+        """Cross-market feature columns of a frame, -1 where unknown or without `cross`"""
+        n = len(df)
+        if cross is None or 'Date' not in df:
+            return np.full((n, 2 * len(self.cross_markets)), -1.0)
+        return cross.features(self.market, _column(df, 'Date', n), self.cross_markets).astype(float)
+
+    def get_config(self):
+        """JSON-serializable description of the fitted pipeline"""
+        return {
+            'source_columns': self.source_columns,
+            'market': self.market,
+            'cross_markets': self.cross_markets,
+            'days': self.days
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['source_columns'], config.get('market'), config.get('cross_markets'),
+                   config.get('days', DAYS))
+
+
+class _Rows(dict):
+    """Mapping of column sequences with a length, for `transform_one`"""
+
+    def __init__(self, data):
+        if isinstance(data, pd.DataFrame):
+            super().__init__({col: data[col].to_numpy() for col in data.columns})
+            self._length = len(data)
+        else:
+            super().__init__(data)
+            self._length = len(next(iter(data.values()), []))
+
+    def __len__(self):
+        return self._length
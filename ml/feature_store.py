@@ -0,0 +1,247 @@
+import os
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from ml.feature_engineering import ROLLING_WINDOW, FeaturePipeline
+from ml.pattern_engine import frame_jodi_codes
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Path to save per-market feature matrices
+FEATURE_CACHE_DIR = os.path.join("ml_models", "feature_cache")
+os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+
+# Bump whenever `ml.feature_engineering.FeaturePipeline` or the cached targets change
+FEATURE_PIPELINE_VERSION = 4
+
+# Preceding rows a feature row depends on (7-day rolling windows); rows with at
+# least this many predecessors in a frame do not depend on where the frame starts
+FEATURE_LOOKBACK = ROLLING_WINDOW - 1
+
+# Target columns cached with the features: jodi first digit, second digit and value,
+# -1 where the row has no jodi
+TARGET_COLUMNS = ['jodi_first_digit', 'jodi_second_digit', 'jodi']
+
+
+class FeatureSet:
+    """
+    Engineered features and targets for one frame of result rows
+
+    Attributes:
+        key: Content hash of the source rows and the pipeline version
+        row_hashes: uint64 hash of every source row
+        columns: Feature column names
+        features: float64 array (rows x columns)
+        targets: int16 array (rows x TARGET_COLUMNS)
+    """
+
+    def __init__(self, key, row_hashes, columns, features, targets):
+        self.key = key
+        self.row_hashes = row_hashes
+        self.columns = list(columns)
+        self.features = features
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.features)
+
+    def to_frame(self):
+        """Feature matrix as a DataFrame with the cached column names"""
+        return pd.DataFrame(self.features, columns=self.columns)
+
+
+def row_hashes(df):
+    """Content hash of every source row (column names and values)"""
+    hashes = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy(dtype=np.uint64)
+    salt = np.uint64(int(hashlib.sha1('|'.join(map(str, df.columns)).encode()).hexdigest()[:16], 16))
+    return hashes ^ salt
+
+
+def cross_hashes(df, pipeline, cross):
+    """
+    Row hashes extended with the row's cross-market features, so results added or
+    edited in other markets invalidate the rows they feed
+    """
+    hashes = row_hashes(df)
+    if not pipeline.cross_markets:
+        return hashes
+    block = pd.DataFrame(pipeline.cross_block(df, cross))
+    return hashes ^ pd.util.hash_pandas_object(block, index=False).to_numpy(dtype=np.uint64)
+
+
+def frame_key(hashes, pipeline):
+    """Cache key of a frame from its row hashes and the pipeline version and config"""
+    digest = hashlib.sha256(f"v{FEATURE_PIPELINE_VERSION}:{pipeline.get_config()}:".encode())
+    digest.update(np.ascontiguousarray(hashes, dtype=np.uint64).tobytes())
+    return digest.hexdigest()
+
+
+def feature_cache_path(market):
+    """Cache path for a market's feature matrix"""
+    return os.path.join(FEATURE_CACHE_DIR, f"{market}_features.npz")
+
+
+def build_targets(df):
+    """
+    Per-row jodi targets
+
+    Returns:
+        int16 array (rows x TARGET_COLUMNS), -1 where the row has no jodi
+    """
+    codes = frame_jodi_codes(df)
+    valid = codes >= 0
+    targets = np.column_stack([np.where(valid, codes // 10, -1), np.where(valid, codes % 10, -1), codes])
+    return targets.astype(np.int16)
+
+
+def pair_rows(feature_set, start=0):
+    """
+    Rows usable for next-day prediction: day rows from `start` on whose next day has a jodi
+
+    Returns:
+        int array of row positions in the FeatureSet
+    """
+    rows = np.arange(start, len(feature_set) - 1)
+    return rows[feature_set.targets[rows + 1, 2] >= 0]
+
+
+def training_pairs(feature_set):
+    """
+    Training pairs of a FeatureSet
+
+    Returns:
+        Tuple (X, Y): features of day i and the jodi targets of day i + 1, for every
+        day whose next day has a jodi
+    """
+    rows = pair_rows(feature_set)
+    return feature_set.features[rows], feature_set.targets[rows + 1]
+
+
+def _compute(df, hashes, pipeline, cross=None):
+    """Run the full feature pipeline on a frame"""
+    return FeatureSet(
+        frame_key(hashes, pipeline), hashes, pipeline.columns,
+        pipeline.transform(df, cross), build_targets(df)
+    )
+
+
+def _extend(cached, df, hashes, pipeline, cross=None):
+    """
+    Reuse a cached FeatureSet for a frame that overlaps it
+
+    The new frame must start inside the cached frame and continue it (the daily
+    window slide plus any appended days). Rows far enough from the new frame start
+    are copied from the cache; only the first FEATURE_LOOKBACK rows (when the start
+    moved) and the appended rows go through the pipeline again.
+
+    Returns:
+        FeatureSet, or None if the frames do not overlap enough
+    """
+    if cached.columns != pipeline.columns:
+        return None
+    positions = np.flatnonzero(cached.row_hashes == hashes[0])
+    if len(positions) == 0:
+        return None
+    shift = int(positions[0])
+    overlap = len(cached) - shift
+    if overlap > len(hashes) or not np.array_equal(cached.row_hashes[shift:], hashes[:overlap]):
+        return None
+    if shift > 0 and overlap <= FEATURE_LOOKBACK:
+        return None
+
+    parts = []
+    if shift > 0:
+        parts.append(pipeline.transform(df.iloc[:FEATURE_LOOKBACK], cross))
+        parts.append(cached.features[shift + FEATURE_LOOKBACK:])
+    else:
+        parts.append(cached.features)
+
+    if overlap < len(df):
+        start = max(0, overlap - FEATURE_LOOKBACK)
+        parts.append(pipeline.transform(df.iloc[start:], cross)[overlap - start:])
+
+    targets = np.concatenate([cached.targets[shift:], build_targets(df.iloc[overlap:])])
+    return FeatureSet(frame_key(hashes, pipeline), hashes, pipeline.columns, np.concatenate(parts), targets)
+
+
+def save_features(market, feature_set, path=None):
+    """Write a market's FeatureSet to the cache"""
+    path = path or feature_cache_path(market)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        version=FEATURE_PIPELINE_VERSION,
+        key=feature_set.key,
+        row_hashes=feature_set.row_hashes,
+        columns=np.array(feature_set.columns, dtype=str),
+        features=feature_set.features,
+        targets=feature_set.targets,
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_cached_features(market, path=None):
+    """
+    Load a market's cached FeatureSet
+
+    Returns:
+        FeatureSet, or None if there is no cache or it was built by another pipeline version
+    """
+    path = path or feature_cache_path(market)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as data:
+            if int(data['version']) != FEATURE_PIPELINE_VERSION:
+                return None
+            return FeatureSet(
+                str(data['key']), data['row_hashes'], data['columns'].tolist(),
+                data['features'], data['targets']
+            )
+    except Exception as e:
+        logger.error(f"Error loading feature cache for {market}: {e}")
+        return None
+
+
+def get_features(df, market, pipeline=None, cross=None):
+    """
+    Features and targets for a frame, from the cache when possible
+
+    An identical frame is served straight from the cache; a frame that continues the
+    cached one is extended; anything else is rebuilt. The result becomes the market's
+    cached frame.
+
+    Args:
+        df: DataFrame with historical data (oldest first)
+        market: Market name
+        pipeline: Fitted FeaturePipeline (fitted on `df` and `cross` if not given)
+        cross: CrossMarketMatrix for pipelines with cross-market features
+
+    Returns:
+        FeatureSet
+    """
+    df = df.reset_index(drop=True)
+    pipeline = pipeline or FeaturePipeline().fit(df, cross)
+    hashes = cross_hashes(df, pipeline, cross)
+    key = frame_key(hashes, pipeline)
+
+    cached = load_cached_features(market)
+    if cached is not None and cached.key == key:
+        return cached
+
+    feature_set = None
+    if cached is not None and len(df):
+        feature_set = _extend(cached, df, hashes, pipeline, cross)
+    if feature_set is None:
+        feature_set = _compute(df, hashes, pipeline, cross)
+
+    try:
+        save_features(market, feature_set)
+    except Exception as e:
+        logger.error(f"Error saving feature cache for {market}: {e}")
+    return feature_set
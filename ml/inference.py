@@ -0,0 +1,229 @@
+import os
+import glob
+import time
+import datetime
+import threading
+import logging
+from collections import OrderedDict
+import joblib
+import numpy as np
+from config import Config
+from ml.trainer import MODEL_DIR, build_features
+from ml.feature_engineering import ROLLING_WINDOW
+from ml.feature_store import get_features
+from ml.model_registry import BUNDLE_EXTENSION, compact_path_for, current_bundle_path, load_bundle
+from ml.model_export import load_compact
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of market model bundles kept in memory
+MODEL_CACHE_SIZE = 16
+
+# Process-wide LRU cache of loaded bundles: market -> ModelBundle
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+
+class ModelBundle:
+    """
+    Everything `train_model` saved for one market run, loaded once
+
+    Attributes:
+        market: Market name
+        info_path: Path of the registry bundle (or legacy model_info pickle) the
+            models were loaded from
+        mtime: Modification time of `info_path` when it was loaded
+        loaded_at: Unix time the bundle was loaded
+        info: The model_info dictionary (accuracies, data size, last trained day)
+        compact: CompactModel used for predictions when the run has a compact export
+        pipeline: FeaturePipeline the models were trained with (None for older runs)
+
+    The full estimators are only unpickled when a compact export is missing or when
+    one of them is accessed.
+    """
+
+    def __init__(self, market, info_path):
+        self.market = market
+        self.info_path = info_path
+        self.mtime = os.path.getmtime(info_path)
+        self.compact = None
+        self._objects = None
+        if info_path.endswith(BUNDLE_EXTENSION):
+            self.compact = load_compact(compact_path_for(info_path))
+        if self.compact is not None:
+            self.info = self.compact.info
+            self.feature_columns = self.compact.feature_columns
+            self.pipeline = self.compact.pipeline
+        else:
+            self._load_objects()
+        self.loaded_at = time.time()
+
+    def _load_objects(self):
+        """Unpickle the full estimators of the run"""
+        if self._objects is not None:
+            return self._objects
+        if self.info_path.endswith(BUNDLE_EXTENSION):
+            objects = load_bundle(self.info_path)
+        else:
+            # Runs saved before the model registry: one pickle per object
+            info = joblib.load(self.info_path)
+            objects = {
+                'open_model': joblib.load(info['open_model_path']),
+                'close_model': joblib.load(info['close_model_path']),
+                'jodi_model': joblib.load(info['jodi_model_path']),
+                'scaler': joblib.load(info['scaler_path']),
+                'feature_columns': joblib.load(info['feature_columns_path']),
+                'info': info
+            }
+        self._objects = objects
+        self.info = objects['info']
+        self.feature_columns = objects['feature_columns']
+        self.pipeline = objects.get('feature_pipeline')
+        return objects
+
+    @property
+    def open_model(self):
+        return self._load_objects()['open_model']
+
+    @property
+    def close_model(self):
+        return self._load_objects()['close_model']
+
+    @property
+    def jodi_model(self):
+        return self._load_objects()['jodi_model']
+
+    @property
+    def scaler(self):
+        return self._load_objects()['scaler']
+
+
+def latest_model_info_path(market, model_dir=MODEL_DIR):
+    """Path of the newest legacy model_info pickle for a market, or None"""
+    paths = glob.glob(os.path.join(glob.escape(model_dir), f"{glob.escape(market)}_model_info_*.pkl"))
+    # Timestamps are YYYYmmdd_HHMMSS, so the lexical maximum is the latest run
+    return max(paths) if paths else None
+
+
+def get_model_bundle(market, training_date=None):
+    """
+    Return the market's current model bundle, loading it only when needed
+
+    The registry's current version is used, falling back to the newest legacy
+    model_info pickle. A cached bundle is reused until the current pointer moves,
+    its file's mtime changes, or `training_date` (e.g. MLModel.training_date) is newer than the load.
+
+    Args:
+        market: Market name
+        training_date: Optional datetime (UTC) of the latest registered training run
+
+    Returns:
+        ModelBundle, or None if the market has no trained models
+    """
+    info_path = current_bundle_path(market) or latest_model_info_path(market)
+    if info_path is None:
+        return None
+    mtime = os.path.getmtime(info_path)
+
+    with _model_cache_lock:
+        bundle = _model_cache.get(market)
+        if bundle is not None:
+            stale = bundle.info_path != info_path or bundle.mtime != mtime
+            if training_date is not None and _utc_timestamp(training_date) > bundle.loaded_at:
+                stale = True
+            if not stale:
+                _model_cache.move_to_end(market)
+                return bundle
+
+    logger.info(f"Loading models for {market} from {info_path}")
+    bundle = ModelBundle(market, info_path)
+
+    with _model_cache_lock:
+        _model_cache[market] = bundle
+        _model_cache.move_to_end(market)
+        while len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+    return bundle
+
+
+def clear_model_cache(market=None):
+    """Drop one market's bundle (or all bundles) from the cache"""
+    with _model_cache_lock:
+        if market is None:
+            _model_cache.clear()
+        else:
+            _model_cache.pop(market, None)
+
+
+def build_feature_row(df, feature_columns, market=None):
+    """
+    Feature row for predicting the day after the last row of `df`
+
+    Args:
+        df: DataFrame with historical data (oldest first)
+        feature_columns: Column list saved with the models
+        market: Market name; when given the features come from the feature cache
+
+    Returns:
+        2D float array with a single row, in the models' column order
+    """
+    recent_df = df.tail(Config.TRAINING_DAYS)
+    if market is not None:
+        feature_df = get_features(recent_df, market).to_frame()
+    else:
+        feature_df = build_features(recent_df)
+    # Weekday one-hot columns only exist for days seen in the window
+    row = feature_df.iloc[[-1]].reindex(columns=feature_columns, fill_value=0)
+    return row.to_numpy(dtype=float)
+
+
+def _utc_timestamp(value):
+    """Unix time of a naive UTC datetime (as stored by datetime.utcnow)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def _class_probabilities(model, X, size):
+    """Spread predict_proba output over a fixed 0..size-1 index"""
+    probabilities = np.zeros(size)
+    indices = np.array([int(c) for c in model.classes_])
+    probabilities[indices] = model.predict_proba(X)[0]
+    return probabilities
+
+
+def predict_probabilities(df, market, training_date=None, cross=None):
+    """
+    Class probabilities from the market's trained models for the next day
+
+    Args:
+        df: DataFrame with historical data (oldest first)
+        market: Market name
+        training_date: Optional MLModel.training_date used to invalidate the cache
+        cross: CrossMarketMatrix with the other markets' latest results, for models
+            trained with cross-market features
+
+    Returns:
+        Dictionary with 'open' (10), 'close' (10) and 'jodi' (100) probability
+        arrays, or None if the market has no trained models
+    """
+    bundle = get_model_bundle(market, training_date)
+    if bundle is None:
+        return None
+
+    if bundle.pipeline is not None:
+        # Same compiled features as training, computed for the last row only
+        row = bundle.pipeline.transform_one(df.tail(ROLLING_WINDOW), cross)[None, :]
+    else:
+        row = build_feature_row(df, bundle.feature_columns, market)
+    if bundle.compact is not None:
+        return bundle.compact.predict_probabilities(row[0])
+
+    X = bundle.scaler.transform(row)
+    return {
+        'open': _class_probabilities(bundle.open_model, X, 10),
+        'close': _class_probabilities(bundle.close_model, X, 10),
+        'jodi': _class_probabilities(bundle.jodi_model, X, 100)
+    }
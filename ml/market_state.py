@@ -0,0 +1,221 @@
+import os
+import datetime
+import logging
+from collections import deque
+import numpy as np
+from config import Config
+from ml.cross_market import as_dates
+from ml.pattern_engine import PatternEngine, RECENCY_DAYS, encode_jodis, encode_pattis, frame_jodi_codes
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Path to save per-market predictor state snapshots
+STATE_DIR = os.path.join("ml_models", "state")
+os.makedirs(STATE_DIR, exist_ok=True)
+
+# Bump when the snapshot layout or the engine statistics change
+STATE_VERSION = 2
+
+
+class MarketState:
+    """
+    Sliding-window predictor state for one market
+
+    Keeps the result rows of the last `window` calendar days up to the latest
+    result, at most `window` rows (the rows the full recompute read), together
+    with the PatternEngine statistics for exactly those rows. Pushing a new result
+    adds its observation and drops the observations that left the window, each in
+    O(1), so predictions can be refreshed without re-querying and rebuilding the
+    whole window.
+    """
+
+    def __init__(self, market, window=Config.TRAINING_DAYS):
+        self.market = market
+        self.window = window
+        self.dates = deque()
+        self.jodis = deque()
+        self.pattis = deque()
+        # Last RECENCY_DAYS observed jodis, shared with engine.recent_jodis
+        self.recent = deque(maxlen=RECENCY_DAYS)
+        self.engine = PatternEngine()
+        self.engine.recent_jodis = self.recent
+        self.last_date = None
+        self.synced_at = None
+
+    def __len__(self):
+        return len(self.jodis)
+
+    @classmethod
+    def from_dataframe(cls, df, market, window=Config.TRAINING_DAYS):
+        """
+        Build the state from a chronological DataFrame with 'Date' and 'Jodi' columns
+
+        Args:
+            df: DataFrame with historical data (oldest first)
+            market: Market name
+            window: Calendar days (and most result rows) kept in the sliding window
+
+        Returns:
+            MarketState
+        """
+        state = cls(market, window)
+        if len(df) == 0:
+            return state
+        dates = as_dates(df['Date'])
+        cutoff = dates[-1] - np.timedelta64(window, 'D')
+        recent_df = df[dates >= cutoff].tail(window)
+        dates = dates[dates >= cutoff][-window:]
+
+        jodis = frame_jodi_codes(recent_df)
+        if 'patti' in recent_df.columns:
+            pattis = encode_pattis(recent_df['patti'])
+        else:
+            pattis = np.full(len(jodis), -1, dtype=np.int16)
+
+        state.dates.extend(dates.astype(datetime.date))
+        state.jodis.extend(int(j) for j in jodis)
+        state.pattis.extend(int(p) for p in pattis)
+        state.engine = PatternEngine.from_sequence(jodis, pattis)
+        state.recent.extend(int(j) for j in state.engine.recent_jodis)
+        state.engine.recent_jodis = state.recent
+        state.last_date = state.dates[-1]
+        state.synced_at = datetime.datetime.utcnow()
+        return state
+
+    def push(self, date, jodi, patti=None):
+        """
+        Slide the window forward by one result
+
+        Args:
+            date: Result date (results on or before `last_date` are ignored)
+            jodi: Jodi value ("45", 45, None, ...)
+            patti: Optional 3-digit patti value
+
+        Returns:
+            True if the result was applied, False if it was already part of the state
+        """
+        date = _parse_date(date)
+        if self.last_date is not None and date <= self.last_date:
+            return False
+
+        jodi_code = int(encode_jodis([jodi])[0])
+        patti_code = int(encode_pattis([patti])[0]) if patti is not None else -1
+
+        if self.jodis:
+            self.engine.update(self.jodis[-1], jodi_code, patti_code)
+            self.recent.append(jodi_code)
+        self.dates.append(date)
+        self.jodis.append(jodi_code)
+        self.pattis.append(patti_code)
+
+        cutoff = date - datetime.timedelta(days=self.window)
+        while len(self.jodis) > self.window or self.dates[0] < cutoff:
+            # The second row becomes the first of the window, so it stops being an
+            # observation and only acts as the "previous" jodi from now on
+            oldest = self.jodis.popleft()
+            self.dates.popleft()
+            self.pattis.popleft()
+            self.engine.update(oldest, self.jodis[0], self.pattis[0], sign=-1)
+        # Only rows after the first are observations
+        while len(self.recent) > len(self.jodis) - 1:
+            self.recent.popleft()
+
+        if jodi_code >= 0:
+            self.engine.latest_jodi = jodi_code
+        elif self.engine.latest_jodi >= 0 and self.engine.latest_jodi not in self.jodis:
+            self.engine.latest_jodi = next((j for j in reversed(self.jodis) if j >= 0), -1)
+
+        self.last_date = date
+        self.synced_at = datetime.datetime.utcnow()
+        return True
+
+    def save(self, path=None):
+        """
+        Write a versioned snapshot of the state
+
+        Returns:
+            Path of the snapshot file
+        """
+        path = path or state_path(self.market)
+        engine = self.engine
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            version=STATE_VERSION,
+            market=self.market,
+            window=self.window,
+            last_date=self.last_date.isoformat() if self.last_date else '',
+            synced_at=self.synced_at.isoformat() if self.synced_at else '',
+            dates=np.array(self.dates, dtype='datetime64[D]'),
+            jodis=np.array(self.jodis, dtype=np.int16),
+            pattis=np.array(self.pattis, dtype=np.int16),
+            latest_jodi=engine.latest_jodi,
+            recent_jodis=np.array(self.recent, dtype=np.int16),
+            first_digit_hist=engine.first_digit_hist,
+            second_digit_hist=engine.second_digit_hist,
+            jodi_counts=engine.jodi_counts,
+            distances=engine.distances,
+            patti_counts=engine.patti_counts,
+            sum_patti_counts=engine.sum_patti_counts,
+            diff_patti_counts=engine.diff_patti_counts,
+        )
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, market, path=None):
+        """
+        Load a snapshot written by `save`
+
+        Returns:
+            MarketState, or None if there is no snapshot or it has an older version
+        """
+        path = path or state_path(market)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != STATE_VERSION:
+                    logger.info(f"Discarding predictor state for {market}: version {int(data['version'])}")
+                    return None
+
+                state = cls(str(data['market']), int(data['window']))
+                state.dates.extend(data['dates'].astype(datetime.date))
+                state.jodis.extend(int(j) for j in data['jodis'])
+                state.pattis.extend(int(p) for p in data['pattis'])
+                if str(data['last_date']):
+                    state.last_date = datetime.date.fromisoformat(str(data['last_date']))
+                if str(data['synced_at']):
+                    state.synced_at = datetime.datetime.fromisoformat(str(data['synced_at']))
+
+                engine = state.engine
+                engine.latest_jodi = int(data['latest_jodi'])
+                state.recent.extend(int(j) for j in data['recent_jodis'])
+                engine.first_digit_hist = data['first_digit_hist']
+                engine.second_digit_hist = data['second_digit_hist']
+                engine.jodi_counts = data['jodi_counts']
+                engine.distances = data['distances']
+                engine.patti_counts = data['patti_counts']
+                engine.sum_patti_counts = data['sum_patti_counts']
+                engine.diff_patti_counts = data['diff_patti_counts']
+            return state
+        except Exception as e:
+            logger.error(f"Error loading predictor state for {market}: {e}")
+            return None
+
+
+def state_path(market):
+    """Snapshot path for a market's predictor state"""
+    return os.path.join(STATE_DIR, f"{market}_state.npz")
+
+
+def _parse_date(value):
+    """Convert a 'dd/mm/YYYY' string, datetime or date to a date"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(str(value), '%d/%m/%Y').date()
@@ -1,11 +1,97 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
 import joblib
-import os
-from datetime import datetime
+from config import Config
+from ml.feature_engineering import FeaturePipeline
+from ml.feature_store import get_features, pair_rows
+from ml.inference import ModelBundle, latest_model_info_path
+from ml.model_registry import current_bundle_path
+from ml.trainer import _day, plan_cpu_budget
+from ml.tuning import MIN_PROBABILITY
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Path to save the evaluation reports of registry models
+REPORT_DIR = os.path.join("ml_models", "evaluation")
+
+# Latest held-out next-day rows each market's models are scored on
+EVALUATION_DAYS = 30
+
+# Models scored per market, with the jodi target column each one predicts
+MODEL_TARGETS = (('open', 0), ('close', 1), ('jodi', 2))
+
+# Shuffles per feature column in `permutation_importance`
+PERMUTATION_REPEATS = 5
+
+# Feature groups removed together by `group_ablation` (name, column pattern);
+# cross-market columns form one group per market and the rest one 'source' group
+FEATURE_GROUPS = (
+    ('first_digit_freq', r'^first_digit_\d_freq$'),
+    ('second_digit_freq', r'^second_digit_\d_freq$'),
+    ('rolling_stats', r'^jodi_7day_|^jodi_trend$'),
+    ('current_jodi', r'^jodi_(numeric|first_digit|second_digit)$'),
+    ('previous_jodi', r'^prev_jodi|^jodi_distance$'),
+    ('flip_near_miss', r'^is_flip$|near_miss'),
+    ('day_of_week', r'^day_'),
+)
+
+# Loaded model files: path -> (mtime, model data)
+_loaded_models = {}
+
+# Baseline scores of a model run on a test matrix: (path, mtime, matrix hash) -> scores
+_baseline_scores = {}
+
+# Models and scaled test matrix of the importance run, set in every worker process
+_importance_state = {}
+
+
+def load_model_data(model_path):
+    """
+    Load a saved model file once
+
+    The file is read again only when its modification time changes, so comparing
+    or re-evaluating models does not unpickle them on every call.
+    """
+    mtime = os.path.getmtime(model_path)
+    cached = _loaded_models.get(model_path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, joblib.load(model_path))
+        _loaded_models[model_path] = cached
+    return cached[1]
+
+
+def plot_confusion_matrix(cm, title, path):
+    """
+    Save a confusion matrix heatmap
+
+    matplotlib and seaborn are imported here, on the Agg backend, so evaluation runs
+    headless and only pays for the plotting stack when a plot is requested.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(np.asarray(cm), annot=True, fmt='d', cmap='Blues')
+    plt.xlabel('Predicted')
+    plt.ylabel('True')
+    plt.title(title)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+    return path
 
 
 def evaluate_model(model_path, test_data, target_column, feature_columns=None):
@@ -22,7 +108,7 @@ def evaluate_model(model_path, test_data, target_column, feature_columns=None):
         Dictionary containing evaluation metrics
     """
     # Load model
-    model_data = joblib.load(model_path)
+    model_data = load_model_data(model_path)
     
     # Use model's stored features if not specified
     if feature_columns is None:
@@ -123,7 +209,8 @@ def evaluate_digit_model(model_data, X_test_scaled, test_data, target_prefix):
     return metrics
 
 
-def generate_evaluation_report(model_path, test_data, target_column, feature_columns=None, output_dir='model_reports'):
+def generate_evaluation_report(model_path, test_data, target_column, feature_columns=None, output_dir='model_reports',
+                               plot=False):
     """
     Generate comprehensive evaluation report for a model
     
@@ -133,6 +220,7 @@ def generate_evaluation_report(model_path, test_data, target_column, feature_col
         target_column: Name of the target column
         feature_columns: List of feature column names
         output_dir: Directory to save the report
+        plot: Also save a confusion matrix plot
     
     Returns:
         Path to the generated report
@@ -186,18 +274,11 @@ def generate_evaluation_report(model_path, test_data, target_column, feature_col
         f.write(f"  Features used: {feature_columns}\n\n")
     
     # Generate confusion matrix plot for non-digit models
-    if 'first_digit' not in metrics:
-        plt.figure(figsize=(10, 8))
-        cm = metrics['confusion_matrix']
-        sns.heatmap(cm, annot=True, fmt='d', cmap='Blues')
-        plt.xlabel('Predicted')
-        plt.ylabel('True')
-        plt.title(f'Confusion Matrix - {model_name}')
-        plt.tight_layout()
-        
-        # Save plot
-        plt.savefig(os.path.join(output_dir, f"{model_name}_confusion_matrix_{timestamp}.png"))
-        plt.close()
+    if plot and 'first_digit' not in metrics:
+        plot_confusion_matrix(
+            metrics['confusion_matrix'], f'Confusion Matrix - {model_name}',
+            os.path.join(output_dir, f"{model_name}_confusion_matrix_{timestamp}.png")
+        )
     
     return report_path
 
@@ -258,11 +339,18 @@ def analyze_feature_importance(model_path, feature_names=None):
         DataFrame with feature importance scores
     """
     # Load model
-    model_data = joblib.load(model_path)
+    model_data = load_model_data(model_path)
     
     # Get model
     if 'model' in model_data:
         model = model_data['model']
+    elif 'open_model' in model_data:
+        # Registry bundle: every model of the run, named by the stored column list
+        feature_names = feature_names or model_data['feature_columns']
+        return {
+            model_type: analyze_digit_model_importance(model_data[f'{model_type}_model'], feature_names)
+            for model_type, _ in MODEL_TARGETS
+        }
     elif 'first_digit' in model_data and 'last_digit' in model_data:
         # Special case for digit models
         return {
@@ -315,6 +403,8 @@ def analyze_digit_model_importance(model, feature_names=None):
     
     importances = model.feature_importances_
     
+    if feature_names is None and hasattr(model, 'feature_names_in_'):
+        feature_names = list(model.feature_names_in_)
     if feature_names is None:
         feature_names = [f"feature_{i}" for i in range(len(importances))]
     
@@ -328,3 +418,452 @@ def analyze_digit_model_importance(model, feature_names=None):
     importance_df = importance_df.sort_values('importance', ascending=False).reset_index(drop=True)
     
     return importance_df
+
+
+def classification_metrics(y_true, y_pred, labels=None):
+    """
+    Accuracy and macro precision/recall/F1 as plain floats
+
+    Args:
+        y_true: True classes
+        y_pred: Predicted classes
+        labels: Classes of the confusion matrix (no confusion matrix if None)
+
+    Returns:
+        Dictionary of metrics, JSON-serializable
+    """
+    metrics = {
+        'accuracy': float(accuracy_score(y_true, y_pred)),
+        'precision': float(precision_score(y_true, y_pred, average='macro', zero_division=0)),
+        'recall': float(recall_score(y_true, y_pred, average='macro', zero_division=0)),
+        'f1': float(f1_score(y_true, y_pred, average='macro', zero_division=0))
+    }
+    if labels is not None:
+        metrics['confusion_matrix'] = confusion_matrix(y_true, y_pred, labels=labels).tolist()
+    return metrics
+
+
+def test_matrix(df, market, bundle, cross=None, days=EVALUATION_DAYS):
+    """
+    A market's held-out next-day rows in the column order of its models
+
+    Only pairs whose target day comes after the run's `last_date` are returned, so
+    no row was among the pairs the models were fit on. The features come from the
+    feature cache, so evaluation reuses the matrix training already built when the
+    frames overlap.
+
+    Args:
+        df: DataFrame with historical data (oldest first)
+        market: Market name
+        bundle: The market's ModelBundle
+        cross: CrossMarketMatrix, for models trained with cross-market features
+        days: Number of latest held-out rows to return
+
+    Returns:
+        Tuple (X, Y): raw features of day i and the jodi targets of day i + 1 (empty
+        if the run has no `last_date` or no results came in after it)
+    """
+    last_date = bundle.info.get('last_date')
+    recent_df = df.tail(Config.TRAINING_DAYS + days).reset_index(drop=True)
+    pipeline = bundle.pipeline or FeaturePipeline().fit(recent_df)
+    feature_set = get_features(recent_df, market, pipeline, cross)
+    X = feature_set.features
+    if bundle.pipeline is None:
+        # Runs saved before the feature pipeline was bundled are aligned by name
+        X = feature_set.to_frame().reindex(columns=bundle.feature_columns, fill_value=0).to_numpy()
+
+    rows = pair_rows(feature_set)
+    if last_date is None:
+        logger.warning(f"{market} models have no last training date, nothing is held out")
+        rows = rows[:0]
+    else:
+        dates = recent_df['Date'].map(_day).to_numpy()
+        rows = rows[dates[rows + 1] > _day(last_date)]
+    rows = rows[-days:]
+    return X[rows], feature_set.targets[rows + 1]
+
+
+def evaluate_market(market, df, cross=None, days=EVALUATION_DAYS):
+    """
+    Score a market's current models on the results after their training window
+
+    The models are loaded once and every model of the run is scored on the same
+    scaled held-out matrix of `test_matrix`.
+
+    Args:
+        market: Market name
+        df: DataFrame with historical data (oldest first)
+        cross: CrossMarketMatrix, for models trained with cross-market features
+        days: Number of latest held-out rows to score
+
+    Returns:
+        Report dictionary with the metrics of the open, close and jodi models, or
+        None if the market has no trained models or no rows to score
+    """
+    path = current_bundle_path(market) or latest_model_info_path(market)
+    if path is None:
+        return None
+    bundle = ModelBundle(market, path)
+    X, Y = test_matrix(df, market, bundle, cross, days)
+    if len(X) == 0:
+        return None
+
+    X = bundle.scaler.transform(X)
+    report = {
+        'market': market,
+        'version': bundle.info.get('version'),
+        'last_date': bundle.info.get('last_date'),
+        'rows': len(X)
+    }
+    for model_type, column in MODEL_TARGETS:
+        model = getattr(bundle, f'{model_type}_model')
+        y_pred = np.array([int(label) for label in model.predict(X)])
+        labels = list(range(10)) if model_type != 'jodi' else None
+        report[model_type] = classification_metrics(Y[:, column], y_pred, labels)
+    return report
+
+
+def _evaluate_market_args(args):
+    """Process pool entry point for `evaluate_market`"""
+    market, df, cross, days = args
+    try:
+        return evaluate_market(market, df, cross, days)
+    except Exception as e:
+        logger.error(f"Error evaluating models for {market}: {e}")
+        return None
+
+
+def summary_frame(reports):
+    """One row per market and model type with the scalar metrics"""
+    columns = ['market', 'version', 'model_type', 'rows', 'accuracy', 'precision', 'recall', 'f1']
+    rows = []
+    for report in reports:
+        for model_type, _ in MODEL_TARGETS:
+            row = {'market': report['market'], 'version': report['version'], 'model_type': model_type, 'rows': report['rows']}
+            row.update({k: v for k, v in report[model_type].items() if k != 'confusion_matrix'})
+            rows.append(row)
+    return pd.DataFrame(rows, columns=columns)
+
+
+def write_reports(reports, output_dir=REPORT_DIR, plots=False):
+    """
+    Write evaluation reports
+
+    The full reports go to a JSON file and the summary table to a Parquet file
+    (skipped with a warning when no Parquet engine is installed). Confusion matrix
+    plots of the open/close models are only rendered when `plots` is set.
+
+    Returns:
+        Dictionary of report kind -> path (plots -> list of paths)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    paths = {'json': os.path.join(output_dir, f"evaluation_{timestamp}.json")}
+
+    with open(paths['json'], 'w') as f:
+        json.dump(reports, f, indent=2, default=str)
+
+    parquet_path = os.path.join(output_dir, f"evaluation_{timestamp}.parquet")
+    try:
+        summary_frame(reports).to_parquet(parquet_path, index=False)
+        paths['parquet'] = parquet_path
+    except ImportError as e:
+        logger.warning(f"Skipping Parquet report: {e}")
+
+    if plots:
+        paths['plots'] = [
+            plot_confusion_matrix(
+                report[model_type]['confusion_matrix'], f"Confusion Matrix - {report['market']} {model_type}",
+                os.path.join(output_dir, f"{report['market']}_{model_type}_confusion_matrix_{timestamp}.png")
+            )
+            for report in reports
+            for model_type in ('open', 'close')
+        ]
+    return paths
+
+
+def evaluate_registry(market_frames, cross=None, cpu_budget=None, days=EVALUATION_DAYS,
+                      output_dir=REPORT_DIR, plots=False):
+    """
+    Evaluate the current models of many markets in parallel
+
+    Every market is scored in its own worker process within the training CPU
+    budget; the reports are then written once for the whole run.
+
+    Args:
+        market_frames: Dictionary of market name -> history DataFrame
+        cross: CrossMarketMatrix shared by every market
+        cpu_budget: Total cores available (defaults to Config.TRAINING_CPU_BUDGET)
+        days: Number of latest held-out rows each market is scored on
+        output_dir: Directory to write the reports to
+        plots: Also render confusion matrix plots
+
+    Returns:
+        Tuple (summary DataFrame, dictionary of report paths)
+    """
+    workers, _ = plan_cpu_budget(len(market_frames), cpu_budget)
+    jobs = [(market, df, cross, days) for market, df in market_frames.items()]
+    logger.info(f"Evaluating {len(jobs)} markets with {workers} workers")
+
+    if workers == 1:
+        reports = list(map(_evaluate_market_args, jobs))
+    else:
+        # Spawned workers avoid inheriting OpenMP thread pools and DB connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            reports = list(executor.map(_evaluate_market_args, jobs))
+
+    reports = [report for report in reports if report]
+    paths = write_reports(reports, output_dir, plots)
+    logger.info(f"Evaluated {len(reports)} markets, reports written to {paths['json']}")
+    return summary_frame(reports), paths
+
+
+def feature_groups(columns):
+    """
+    Split feature columns into the groups of FEATURE_GROUPS
+
+    Returns:
+        Dictionary of group name -> list of column indices
+    """
+    groups = {}
+    for i, column in enumerate(columns):
+        if column.startswith('cross_'):
+            group = column.rsplit('_', 1)[0]
+        else:
+            group = next((name for name, pattern in FEATURE_GROUPS if re.search(pattern, column)), 'source')
+        groups.setdefault(group, []).append(i)
+    return groups
+
+
+def _model_score(model, X, y):
+    """Mean log-probability a model gives the true classes of `y` (higher is better)"""
+    probabilities = model.predict_proba(X)
+    position = {int(c): i for i, c in enumerate(model.classes_)}
+    true_prob = np.array([
+        probabilities[row, position[label]] if label in position else 0.0
+        for row, label in enumerate(y)
+    ])
+    return float(np.log(np.maximum(true_prob, MIN_PROBABILITY)).mean())
+
+
+def _init_importance_worker(market, path, X, Y, bundle=None):
+    """Load a run's models once per process for `_perturbed_score`"""
+    bundle = bundle or ModelBundle(market, path)
+    _importance_state.update({
+        'models': {model_type: getattr(bundle, f'{model_type}_model') for model_type, _ in MODEL_TARGETS},
+        'X': X,
+        'Y': Y
+    })
+
+
+def _perturbed_score(args):
+    """
+    Score one model with some columns shuffled (seed given) or ablated (seed None)
+
+    Ablated columns are set to 0, the training mean after scaling.
+    """
+    model_type, columns, seed = args
+    X = _importance_state['X'].copy()
+    if seed is None:
+        X[:, columns] = 0.0
+    else:
+        order = np.random.default_rng(seed).permutation(len(X))
+        X[:, columns] = X[order][:, columns]
+    y = _importance_state['Y'][:, dict(MODEL_TARGETS)[model_type]]
+    return _model_score(_importance_state['models'][model_type], X, y)
+
+
+def _prepare_importance(market, df, cross, days):
+    """
+    Load a market's current models and scaled held-out matrix, and their baseline scores
+
+    Returns:
+        Tuple (path, feature columns, X, Y, baseline scores by model type), or None
+        if the market has no trained models or no rows to score
+    """
+    path = current_bundle_path(market) or latest_model_info_path(market)
+    if path is None:
+        return None
+    bundle = ModelBundle(market, path)
+    X, Y = test_matrix(df, market, bundle, cross, days)
+    if len(X) == 0:
+        return None
+    X = bundle.scaler.transform(X)
+    _init_importance_worker(market, path, X, Y, bundle)
+
+    key = (path, bundle.mtime, hashlib.sha1(np.ascontiguousarray(X).tobytes()).hexdigest())
+    baselines = _baseline_scores.get(key)
+    if baselines is None:
+        baselines = {
+            model_type: _model_score(_importance_state['models'][model_type], X, Y[:, column])
+            for model_type, column in MODEL_TARGETS
+        }
+        _baseline_scores[key] = baselines
+    return path, list(bundle.feature_columns), X, Y, baselines
+
+
+def _run_perturbations(market, path, X, Y, jobs, cpu_budget=None):
+    """Score perturbation jobs in worker processes that each load the models once"""
+    workers, _ = plan_cpu_budget(len(jobs), cpu_budget)
+    if workers == 1:
+        return list(map(_perturbed_score, jobs))
+
+    # Spawned workers avoid inheriting OpenMP thread pools and DB connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context,
+        initializer=_init_importance_worker, initargs=(market, path, X, Y)
+    ) as executor:
+        return list(executor.map(_perturbed_score, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+
+
+def permutation_importance(market, df, cross=None, days=EVALUATION_DAYS, n_repeats=PERMUTATION_REPEATS,
+                           cpu_budget=None, seed=42):
+    """
+    Permutation importance of every feature column for a market's current models
+
+    Each column is shuffled `n_repeats` times on the held-out rows of `test_matrix`
+    and the drop in mean log-likelihood from the (cached) baseline is its importance. Shuffles run
+    in parallel worker processes.
+
+    Args:
+        market: Market name
+        df: DataFrame with historical data (oldest first)
+        cross: CrossMarketMatrix, for models trained with cross-market features
+        days: Number of latest held-out rows to score
+        n_repeats: Shuffles per column
+        cpu_budget: Total cores available (defaults to Config.TRAINING_CPU_BUDGET)
+        seed: Seed of the first shuffle
+
+    Returns:
+        DataFrame with one row per model type and feature, sorted by importance,
+        or None if the market has no models to score
+    """
+    prepared = _prepare_importance(market, df, cross, days)
+    if prepared is None:
+        return None
+    path, columns, X, Y, baselines = prepared
+
+    jobs = [
+        (model_type, [i], seed + repeat)
+        for model_type, _ in MODEL_TARGETS
+        for i in range(len(columns))
+        for repeat in range(n_repeats)
+    ]
+    logger.info(f"Permutation importance for {market}: {len(jobs)} shuffles")
+    scores = np.array(_run_perturbations(market, path, X, Y, jobs, cpu_budget))
+    scores = scores.reshape(len(MODEL_TARGETS), len(columns), n_repeats)
+
+    rows = []
+    for m, (model_type, _) in enumerate(MODEL_TARGETS):
+        drops = baselines[model_type] - scores[m]
+        for i, column in enumerate(columns):
+            rows.append({
+                'model_type': model_type,
+                'feature': column,
+                'importance_mean': float(drops[i].mean()),
+                'importance_std': float(drops[i].std()),
+                'baseline': baselines[model_type]
+            })
+    return pd.DataFrame(rows).sort_values(['model_type', 'importance_mean'], ascending=[True, False]).reset_index(drop=True)
+
+
+def group_ablation(market, df, cross=None, days=EVALUATION_DAYS, cpu_budget=None):
+    """
+    Score drop of a market's current models when each feature group is removed
+
+    Every group of `feature_groups` is set to its training mean at once on the
+    held-out rows of `test_matrix`, which shows whether e.g. the 20 rolling
+    digit-frequency columns carry signal together.
+
+    Returns:
+        DataFrame with one row per model type and group, sorted by importance, or
+        None if the market has no models to score
+    """
+    prepared = _prepare_importance(market, df, cross, days)
+    if prepared is None:
+        return None
+    path, columns, X, Y, baselines = prepared
+
+    groups = feature_groups(columns)
+    jobs = [(model_type, indices, None) for model_type, _ in MODEL_TARGETS for indices in groups.values()]
+    scores = iter(_run_perturbations(market, path, X, Y, jobs, cpu_budget))
+
+    rows = []
+    for model_type, _ in MODEL_TARGETS:
+        for group, indices in groups.items():
+            rows.append({
+                'model_type': model_type,
+                'group': group,
+                'features': len(indices),
+                'importance': baselines[model_type] - next(scores),
+                'baseline': baselines[model_type]
+            })
+    return pd.DataFrame(rows).sort_values(['model_type', 'importance'], ascending=[True, False]).reset_index(drop=True)
+
+
+def low_importance_features(importance_df, threshold=0.0):
+    """
+    Features no model relies on, as pruning candidates
+
+    Args:
+        importance_df: Output of `permutation_importance` (one or many markets)
+        threshold: Largest mean importance a feature may have to be listed
+
+    Returns:
+        List of feature names whose importance is at most `threshold` for every
+        model type
+    """
+    best = importance_df.groupby('feature')['importance_mean'].max()
+    return best[best <= threshold].index.tolist()
+
+
+def importance_registry(market_frames, cross=None, cpu_budget=None, days=EVALUATION_DAYS,
+                        output_dir=REPORT_DIR):
+    """
+    Permutation importance and group ablation of the current models of many markets
+
+    Markets are analysed one after another, each with its perturbations spread over
+    the CPU budget; both tables are written to Parquet files (skipped with a warning
+    when no Parquet engine is installed).
+
+    Args:
+        market_frames: Dictionary of market name -> history DataFrame
+        cross: CrossMarketMatrix shared by every market
+        cpu_budget: Total cores available (defaults to Config.TRAINING_CPU_BUDGET)
+        days: Number of latest held-out rows each market is scored on
+        output_dir: Directory to write the tables to
+
+    Returns:
+        Tuple (importance DataFrame, ablation DataFrame, dictionary of table paths),
+        both tables with a 'market' column
+    """
+    importance, ablation = [], []
+    for market, df in market_frames.items():
+        try:
+            market_importance = permutation_importance(market, df, cross, days, cpu_budget=cpu_budget)
+            market_ablation = group_ablation(market, df, cross, days, cpu_budget)
+        except Exception as e:
+            logger.error(f"Error analysing feature importance for {market}: {e}")
+            continue
+        if market_importance is None:
+            continue
+        importance.append(market_importance.assign(market=market))
+        ablation.append(market_ablation.assign(market=market))
+
+    importance_df = pd.concat(importance, ignore_index=True) if importance else pd.DataFrame()
+    ablation_df = pd.concat(ablation, ignore_index=True) if ablation else pd.DataFrame()
+
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    paths = {}
+    for kind, table in (('importance', importance_df), ('ablation', ablation_df)):
+        path = os.path.join(output_dir, f"{kind}_{timestamp}.parquet")
+        try:
+            table.to_parquet(path, index=False)
+            paths[kind] = path
+        except ImportError as e:
+            logger.warning(f"Skipping Parquet {kind} table: {e}")
+    logger.info(f"Analysed feature importance of {len(importance)} markets")
+    return importance_df, ablation_df, paths
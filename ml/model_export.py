@@ -0,0 +1,191 @@
+import os
+import json
+import logging
+import numpy as np
+import xgboost as xgb
+from ml.feature_engineering import FeaturePipeline
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump when the compact layout changes
+COMPACT_VERSION = 1
+
+
+def _flatten_forest(forest):
+    """
+    Flatten a fitted RandomForestClassifier into shared node arrays
+
+    Node ids are global across trees. For a split node `left`/`right` hold child
+    ids; for a leaf `left` holds -1 - leaf_id, where leaf_id indexes `leaf_values`
+    (class probabilities of the leaf, as the tree's predict_proba returns them).
+
+    Returns:
+        Dictionary of NumPy arrays
+    """
+    roots, left, right, feature, threshold, leaf_values = [], [], [], [], [], []
+    offset = leaf_offset = 0
+
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        leaf_ids = np.cumsum(is_leaf) - 1 + leaf_offset
+
+        roots.append(offset)
+        left.append(np.where(is_leaf, -1 - leaf_ids, tree.children_left + offset))
+        right.append(np.where(is_leaf, -1, tree.children_right + offset))
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(tree.threshold)
+
+        values = tree.value[is_leaf, 0, :]
+        totals = values.sum(axis=1, keepdims=True)
+        leaf_values.append(values / np.where(totals == 0, 1, totals))
+
+        offset += tree.node_count
+        leaf_offset += int(is_leaf.sum())
+
+    return {
+        'rf_roots': np.array(roots, dtype=np.int32),
+        'rf_left': np.concatenate(left).astype(np.int32),
+        'rf_right': np.concatenate(right).astype(np.int32),
+        'rf_feature': np.concatenate(feature).astype(np.int32),
+        'rf_threshold': np.concatenate(threshold).astype(np.float64),
+        'rf_leaf_values': np.concatenate(leaf_values).astype(np.float32),
+        'rf_classes': np.array([str(c) for c in forest.classes_]),
+    }
+
+
+def export_compact(path, objects):
+    """
+    Write a model bundle in the compact format
+
+    The open/close XGBoost models are stored as native UBJ buffers, the jodi
+    RandomForest as flattened node arrays and the scaler as its mean/scale vectors,
+    all in a single uncompressed .npz.
+
+    Args:
+        path: Destination .npz path
+        objects: Bundle dictionary (see ml.model_registry.BUNDLE_KEYS)
+
+    Returns:
+        Path of the written file
+    """
+    arrays = _flatten_forest(objects['jodi_model'])
+    for name in ('open', 'close'):
+        model = objects[f'{name}_model']
+        raw = model.get_booster().save_raw(raw_format='ubj')
+        arrays[f'{name}_ubj'] = np.frombuffer(bytes(raw), dtype=np.uint8)
+        arrays[f'{name}_classes'] = np.asarray(model.classes_, dtype=np.int64)
+
+    scaler = objects['scaler']
+    arrays['scaler_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+    arrays['scaler_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+    arrays['feature_columns'] = np.array(objects['feature_columns'], dtype=str)
+    pipeline = objects.get('feature_pipeline')
+    arrays['feature_pipeline'] = np.array(json.dumps(pipeline.get_config() if pipeline else None))
+    arrays['info'] = np.array(json.dumps(objects['info'], default=str))
+    arrays['version'] = np.array(COMPACT_VERSION)
+
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+class CompactModel:
+    """
+    Lightweight loader and single-row predictor for `export_compact` files
+
+    Only NumPy and the XGBoost booster runtime are needed; no pickles are
+    unpickled and no scikit-learn estimators are rebuilt.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            if int(data['version']) != COMPACT_VERSION:
+                raise ValueError(f"Unsupported compact model version {int(data['version'])}")
+            arrays = {key: data[key] for key in data.files}
+
+        self.info = json.loads(str(arrays['info']))
+        self.feature_columns = arrays['feature_columns'].tolist()
+        pipeline_config = json.loads(str(arrays['feature_pipeline'])) if 'feature_pipeline' in arrays else None
+        self.pipeline = FeaturePipeline.from_config(pipeline_config) if pipeline_config else None
+        self.mean = arrays['scaler_mean']
+        self.scale = arrays['scaler_scale']
+
+        self.open_booster = xgb.Booster(model_file=bytearray(arrays['open_ubj'].tobytes()))
+        self.close_booster = xgb.Booster(model_file=bytearray(arrays['close_ubj'].tobytes()))
+        self.open_classes = arrays['open_classes']
+        self.close_classes = arrays['close_classes']
+
+        self.rf_roots = arrays['rf_roots']
+        self.rf_left = arrays['rf_left']
+        self.rf_right = arrays['rf_right']
+        self.rf_feature = arrays['rf_feature']
+        self.rf_threshold = arrays['rf_threshold']
+        self.rf_leaf_values = arrays['rf_leaf_values']
+        self.rf_classes = np.array([int(c) for c in arrays['rf_classes']])
+
+    def scale_row(self, row):
+        """Apply the saved StandardScaler to one raw feature row"""
+        return (np.asarray(row, dtype=np.float64) - self.mean) / self.scale
+
+    def forest_probabilities(self, x):
+        """
+        Jodi RandomForest predict_proba for one scaled row
+
+        All trees are walked together, one level per step.
+        """
+        # Trees compare float32 features against float64 thresholds
+        x = np.asarray(x, dtype=np.float32).astype(np.float64)
+        nodes = self.rf_roots.copy()
+        left = self.rf_left[nodes]
+        while True:
+            active = left >= 0
+            if not active.any():
+                break
+            go_left = x[self.rf_feature[nodes]] <= self.rf_threshold[nodes]
+            nodes = np.where(active, np.where(go_left, left, self.rf_right[nodes]), nodes)
+            left = self.rf_left[nodes]
+        return self.rf_leaf_values[-1 - left].mean(axis=0)
+
+    @staticmethod
+    def _booster_probabilities(booster, x, classes):
+        probabilities = np.asarray(booster.inplace_predict(x[None, :]), dtype=np.float64).reshape(-1)
+        if len(classes) == 2 and len(probabilities) == 1:
+            probabilities = np.array([1 - probabilities[0], probabilities[0]])
+        return probabilities
+
+    def predict_probabilities(self, row):
+        """
+        Class probabilities for one raw (unscaled) feature row
+
+        Returns:
+            Dictionary with 'open' (10), 'close' (10) and 'jodi' (100) probability arrays
+        """
+        x = self.scale_row(row)
+        result = {}
+        for name, booster, classes in (
+            ('open', self.open_booster, self.open_classes),
+            ('close', self.close_booster, self.close_classes)
+        ):
+            probabilities = np.zeros(10)
+            probabilities[classes] = self._booster_probabilities(booster, x, classes)
+            result[name] = probabilities
+
+        jodi = np.zeros(100)
+        jodi[self.rf_classes] = self.forest_probabilities(x)
+        result['jodi'] = jodi
+        return result
+
+
+def load_compact(path):
+    """Load a compact model file, or None if it is missing or unreadable"""
+    try:
+        return CompactModel(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error loading compact model {path}: {e}")
+        return None
@@ -0,0 +1,233 @@
+import os
+import re
+import glob
+import json
+import logging
+from datetime import datetime
+import joblib
+from config import Config
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Path to the per-market model bundles
+LEGACY_MODEL_DIR = "ml_models"
+REGISTRY_DIR = os.path.join(LEGACY_MODEL_DIR, "registry")
+os.makedirs(REGISTRY_DIR, exist_ok=True)
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+BUNDLE_EXTENSION = ".joblib"
+COMPACT_EXTENSION = ".compact.npz"
+
+# Objects stored in every bundle (feature_pipeline is None in older bundles)
+BUNDLE_KEYS = ('open_model', 'close_model', 'jodi_model', 'scaler', 'feature_columns', 'feature_pipeline', 'info')
+
+# Pickles of a run saved before the registry: {market}_{kind}_{YYYYmmdd_HHMMSS}.pkl
+LEGACY_KINDS = ('open', 'close', 'jodi', 'scaler', 'feature_columns', 'model_info')
+LEGACY_TIMESTAMP = re.compile(r"\d{8}_\d{6}\.pkl$")
+
+
+def market_dir(market):
+    """Directory holding a market's bundles, manifest and current pointer"""
+    return os.path.join(REGISTRY_DIR, market)
+
+
+def bundle_path(market, version):
+    """Path of one bundle version"""
+    return os.path.join(market_dir(market), f"{version}{BUNDLE_EXTENSION}")
+
+
+def compact_path(market, version):
+    """Path of the compact export of one bundle version"""
+    return os.path.join(market_dir(market), f"{version}{COMPACT_EXTENSION}")
+
+
+def compact_path_for(path):
+    """Compact export path matching a bundle path"""
+    return path[:-len(BUNDLE_EXTENSION)] + COMPACT_EXTENSION
+
+
+def _write_atomic(path, text):
+    """Replace a small text file in one step"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(market):
+    """
+    A market's manifest: one entry per stored version, oldest first
+
+    Returns:
+        List of dictionaries with 'version', 'created_at' and the run's model info
+    """
+    path = os.path.join(market_dir(market), MANIFEST_FILE)
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error reading model manifest for {market}: {e}")
+        return []
+
+
+def _save_manifest(market, manifest):
+    _write_atomic(os.path.join(market_dir(market), MANIFEST_FILE), json.dumps(manifest, indent=2, default=str))
+
+
+def current_version(market):
+    """Version the market's current pointer refers to, or None"""
+    path = os.path.join(market_dir(market), CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        version = f.read().strip()
+    return version or None
+
+
+def current_bundle_path(market):
+    """Path of the market's current bundle, or None"""
+    version = current_version(market)
+    if version is None:
+        return None
+    path = bundle_path(market, version)
+    return path if os.path.exists(path) else None
+
+
+def set_current(market, version):
+    """Atomically point the market at another stored version, then apply retention"""
+    if not os.path.exists(bundle_path(market, version)):
+        raise ValueError(f"No model bundle {version} for {market}")
+    _write_atomic(os.path.join(market_dir(market), CURRENT_FILE), version)
+    collect_garbage(market)
+
+
+def _new_version(market):
+    """Timestamp version that sorts after, and does not collide with, stored ones"""
+    version = datetime.now().strftime("%Y%m%d_%H%M%S")
+    candidate, suffix = version, 1
+    while os.path.exists(bundle_path(market, candidate)):
+        candidate = f"{version}_{suffix}"
+        suffix += 1
+    return candidate
+
+
+def save_bundle(market, objects, make_current=True):
+    """
+    Store one training run as a single versioned bundle
+
+    Arrays are written uncompressed so `load_bundle` can memory-map them.
+
+    Args:
+        market: Market name
+        objects: Dictionary with every key of BUNDLE_KEYS
+        make_current: Switch the current pointer to the new version
+
+    Returns:
+        Tuple (version, path)
+    """
+    os.makedirs(market_dir(market), exist_ok=True)
+    version = _new_version(market)
+    path = bundle_path(market, version)
+
+    tmp_path = f"{path}.tmp"
+    joblib.dump({key: objects.get(key) for key in BUNDLE_KEYS}, tmp_path)
+    os.replace(tmp_path, path)
+
+    manifest = load_manifest(market)
+    entry = {'version': version, 'created_at': datetime.utcnow().isoformat()}
+    entry.update({k: v for k, v in objects['info'].items() if not k.endswith('_path')})
+    manifest.append(entry)
+    _save_manifest(market, manifest)
+
+    if make_current:
+        set_current(market, version)
+    return version, path
+
+
+def load_bundle(path, mmap_mode='r'):
+    """
+    Load a bundle written by `save_bundle`
+
+    With mmap_mode='r' the large estimator arrays (RandomForest node tables) are
+    memory-mapped instead of read, so cold loads only touch the pages they use.
+
+    Returns:
+        Dictionary with every key of BUNDLE_KEYS
+    """
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def collect_garbage(market, keep=None):
+    """
+    Delete old bundles beyond the retention policy
+
+    The newest `keep` versions (Config.MODEL_RETENTION_VERSIONS by default) and the
+    current version are kept; everything else is removed from disk and the manifest.
+
+    Returns:
+        List of deleted versions
+    """
+    keep = Config.MODEL_RETENTION_VERSIONS if keep is None else keep
+    manifest = load_manifest(market)
+    current = current_version(market)
+    retained = {entry['version'] for entry in manifest[-keep:]} if keep > 0 else set()
+    if current:
+        retained.add(current)
+
+    deleted = []
+    for entry in manifest:
+        if entry['version'] in retained:
+            continue
+        try:
+            for path in (bundle_path(market, entry['version']), compact_path(market, entry['version'])):
+                if os.path.exists(path):
+                    os.remove(path)
+            deleted.append(entry['version'])
+        except OSError as e:
+            logger.error(f"Error deleting model bundle {entry['version']} for {market}: {e}")
+
+    if deleted:
+        _save_manifest(market, [entry for entry in manifest if entry['version'] not in deleted])
+        logger.info(f"Deleted {len(deleted)} old model bundles for {market}")
+    if current:
+        collect_legacy_models(market)
+    return deleted
+
+
+def collect_legacy_models(market, model_dir=None):
+    """
+    Delete the per-object pickles of a market's runs saved before the registry
+
+    Only call this once the market has a current registry version; inference and
+    incremental training no longer read the legacy runs then.
+
+    Args:
+        market: Market name
+        model_dir: Directory of the legacy pickles (defaults to LEGACY_MODEL_DIR)
+
+    Returns:
+        List of deleted paths
+    """
+    model_dir = LEGACY_MODEL_DIR if model_dir is None else model_dir
+    deleted = []
+    for kind in LEGACY_KINDS:
+        pattern = os.path.join(glob.escape(model_dir), f"{glob.escape(market)}_{kind}_*.pkl")
+        prefix = os.path.join(model_dir, f"{market}_{kind}_")
+        for path in glob.glob(pattern):
+            # Skip other markets whose name extends this one's (e.g. "X_open" for "X")
+            if not LEGACY_TIMESTAMP.fullmatch(path[len(prefix):]):
+                continue
+            try:
+                os.remove(path)
+                deleted.append(path)
+            except OSError as e:
+                logger.error(f"Error deleting legacy model file {path}: {e}")
+
+    if deleted:
+        logger.info(f"Deleted {len(deleted)} legacy model files for {market}")
+    return deleted
@@ -0,0 +1,315 @@
+import numpy as np
+import pandas as pd
+
+# Jodis (00-99) and digits (0-9) are used directly as array indices
+NUM_JODIS = 100
+NUM_DIGITS = 10
+# Pattis are indexed by the integer value of their sorted digits (e.g. "127" -> 127)
+NUM_PATTI_KEYS = 1000
+
+# Extra weight given to the last week of results (days_ago 1..7)
+RECENCY_DAYS = 7
+
+# Weights for the synthetic pattis built from a jodi when no real patti is known
+SUM_PATTI_WEIGHT = 0.8
+DIFF_PATTI_WEIGHT = 0.6
+
+# Mixing weights of the evidence sources combined in PatternEngine.jodi_probabilities
+FREQUENCY_WEIGHT = 0.5
+DIGIT_PAIR_WEIGHT = 0.3
+LATEST_PATTERN_WEIGHT = 0.2
+
+# Share of probability mass spread uniformly so that no jodi has zero probability
+SMOOTHING = 0.05
+
+
+def _build_near_miss_kernel():
+    """
+    Build the 100x100 near-miss weight kernel
+
+    K[j, t] is the weight added to jodi t every time jodi j is seen, for jodis that
+    differ from j by -4..+4 (mod 10) in each digit. Exact matches get no weight.
+    """
+    offsets = np.arange(-4, 5)
+    abs_1 = np.abs(offsets)[:, None]
+    abs_2 = np.abs(offsets)[None, :]
+
+    weights = np.full((len(offsets), len(offsets)), 0.1)
+    weights[(abs_1 <= 2) & (abs_2 <= 2)] = 0.2
+    weights[(abs_1 <= 1) & (abs_2 <= 1)] = 0.3
+    weights[4, 4] = 0.0  # Skip exact match
+
+    kernel = np.zeros((NUM_JODIS, NUM_JODIS))
+    jodis = np.arange(NUM_JODIS)
+    first = jodis // 10
+    second = jodis % 10
+    for i, d1 in enumerate(offsets):
+        for j, d2 in enumerate(offsets):
+            targets = ((first + d1) % 10) * 10 + (second + d2) % 10
+            kernel[jodis, targets] = weights[i, j]
+    return kernel
+
+
+NEAR_MISS_KERNEL = _build_near_miss_kernel()
+
+# FLIPPED_JODI[j] is the jodi with the digits of j swapped (27 -> 72)
+FLIPPED_JODI = (np.arange(NUM_JODIS) % 10) * 10 + np.arange(NUM_JODIS) // 10
+
+
+def encode_jodis(values):
+    """
+    Convert a sequence of jodi values ("07", "45", 45, None, ...) to integer codes
+
+    Returns:
+        int16 array with the jodi number (0-99), or -1 where the value is missing/invalid
+    """
+    numeric = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+    valid = (numeric >= 0) & (numeric < NUM_JODIS) & (numeric == np.floor(numeric))
+    return np.where(valid, numeric, -1).astype(np.int16)
+
+
+def frame_jodi_codes(df):
+    """
+    Jodi codes of a results frame, as `encode_jodis(df['Jodi'])`
+
+    Frames from services.data_service.load_results_frame carry the stored integer
+    'jodi_num' column, which is used directly instead of parsing the strings.
+    """
+    if 'jodi_num' in df.columns:
+        return df['jodi_num'].fillna(-1).to_numpy(dtype=np.int16)
+    return encode_jodis(df['Jodi'])
+
+
+def encode_pattis(values):
+    """
+    Convert a sequence of 3-digit patti values to the integer value of their sorted digits
+
+    Returns:
+        int16 array with the patti key (0-999), or -1 where the value is missing/invalid
+    """
+    strings = pd.Series(values, dtype=object).fillna('').astype(str)
+    valid = strings.str.fullmatch(r'\d{3}').to_numpy(dtype=bool)
+    codes = np.full(len(strings), -1, dtype=np.int16)
+    if valid.any():
+        digits = np.array([list(s) for s in strings[valid]], dtype=np.int16)
+        digits.sort(axis=1)
+        codes[valid] = digits[:, 0] * 100 + digits[:, 1] * 10 + digits[:, 2]
+    return codes
+
+
+def synthetic_patti_keys(jodis):
+    """
+    Sorted patti keys built from jodi digits with the sum and difference middle-digit rules
+
+    Returns:
+        Tuple (sum_keys, diff_keys) of int arrays aligned with `jodis`
+    """
+    first = jodis // 10
+    second = jodis % 10
+    sum_middle = (first + second) % 10
+    diff_middle = np.abs(first - second) % 10
+
+    def _sorted_key(middle):
+        digits = np.sort(np.stack([first, middle, second], axis=1), axis=1)
+        return digits[:, 0] * 100 + digits[:, 1] * 10 + digits[:, 2]
+
+    return _sorted_key(sum_middle), _sorted_key(diff_middle)
+
+
+def normalize(scores):
+    """Scale non-negative scores to sum to 1 (all zeros if there is no mass)"""
+    scores = np.asarray(scores, dtype=float)
+    total = scores.sum()
+    return scores / total if total > 0 else np.zeros_like(scores)
+
+
+def top_k(scores, k, exclude=None):
+    """
+    Indices of the k highest scores, highest first
+
+    Ties are broken by the lower index so the result is deterministic. Entries listed
+    in `exclude` and entries with a zero score are never returned.
+    """
+    scores = np.asarray(scores, dtype=float).copy()
+    if exclude is not None and len(exclude):
+        scores[np.asarray(list(exclude), dtype=int)] = 0.0
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) == 0 or k <= 0:
+        return np.array([], dtype=int)
+    if len(candidates) > k:
+        # argpartition picks the k largest; the boundary value may be shared with
+        # entries outside the partition, so take every entry tied with it
+        kth = scores[candidates][np.argpartition(-scores[candidates], k - 1)[k - 1]]
+        candidates = candidates[scores[candidates] >= kth]
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+class PatternEngine:
+    """
+    Dense pattern statistics for one market's jodi sequence
+
+    Every observation is a result row that has a predecessor in the window (the first
+    row of the window only acts as the "previous" jodi of the second one). All tables
+    hold integer counts so observations can be added and removed without drift.
+
+    Attributes:
+        first_digit_hist: 10-bin histogram of first jodi digits (open prediction)
+        second_digit_hist: 10-bin histogram of second jodi digits (close prediction)
+        jodi_counts: 100-bin histogram of observed jodis
+        distances: 100x100 counts of prev_jodi -> |jodi - prev_jodi|
+        patti_counts: 1000-bin counts of real sorted pattis
+        sum_patti_counts: 1000-bin counts of synthetic pattis (sum middle digit)
+        diff_patti_counts: 1000-bin counts of synthetic pattis (difference middle digit)
+    """
+
+    def __init__(self):
+        self.first_digit_hist = np.zeros(NUM_DIGITS, dtype=np.int64)
+        self.second_digit_hist = np.zeros(NUM_DIGITS, dtype=np.int64)
+        self.jodi_counts = np.zeros(NUM_JODIS, dtype=np.int64)
+        self.distances = np.zeros((NUM_JODIS, NUM_JODIS), dtype=np.int64)
+        self.patti_counts = np.zeros(NUM_PATTI_KEYS, dtype=np.int64)
+        self.sum_patti_counts = np.zeros(NUM_PATTI_KEYS, dtype=np.int64)
+        self.diff_patti_counts = np.zeros(NUM_PATTI_KEYS, dtype=np.int64)
+        self.recent_jodis = np.array([], dtype=np.int16)
+        self.latest_jodi = -1
+
+    @classmethod
+    def from_sequence(cls, jodis, pattis=None):
+        """
+        Build the statistics from a chronological jodi sequence
+
+        Args:
+            jodis: Jodi codes from `encode_jodis` (oldest first, -1 for missing)
+            pattis: Optional patti codes from `encode_pattis`, aligned with `jodis`
+
+        Returns:
+            PatternEngine
+        """
+        engine = cls()
+        jodis = np.asarray(jodis, dtype=np.int16)
+        if len(jodis) == 0:
+            return engine
+
+        valid_jodis = jodis[jodis >= 0]
+        if len(valid_jodis):
+            engine.latest_jodi = int(valid_jodis[-1])
+
+        prev = jodis[:-1].astype(np.int64)
+        curr = jodis[1:].astype(np.int64)
+        observed = curr[curr >= 0]
+
+        engine.first_digit_hist = np.bincount(observed // 10, minlength=NUM_DIGITS)
+        engine.second_digit_hist = np.bincount(observed % 10, minlength=NUM_DIGITS)
+        engine.jodi_counts = np.bincount(observed, minlength=NUM_JODIS)
+
+        pair = (prev >= 0) & (curr >= 0)
+        pair_prev = prev[pair]
+        pair_curr = curr[pair]
+        np.add.at(engine.distances, (pair_prev, np.abs(pair_curr - pair_prev)), 1)
+
+        # Pattis: real pattis where available, synthetic ones from the jodi otherwise
+        if pattis is not None:
+            patti_codes = np.asarray(pattis, dtype=np.int64)[1:]
+        else:
+            patti_codes = np.full(len(curr), -1, dtype=np.int64)
+        real = patti_codes >= 0
+        engine.patti_counts = np.bincount(patti_codes[real], minlength=NUM_PATTI_KEYS)
+        synthetic = ~real & (curr >= 0)
+        sum_keys, diff_keys = synthetic_patti_keys(curr[synthetic])
+        engine.sum_patti_counts = np.bincount(sum_keys, minlength=NUM_PATTI_KEYS)
+        engine.diff_patti_counts = np.bincount(diff_keys, minlength=NUM_PATTI_KEYS)
+
+        engine.recent_jodis = curr[-RECENCY_DAYS:].astype(np.int16)
+        return engine
+
+    def update(self, prev_jodi, jodi, patti=-1, sign=1):
+        """
+        Add (sign=1) or remove (sign=-1) a single observation in O(1)
+
+        Args:
+            prev_jodi: Jodi code of the preceding row (-1 if missing)
+            jodi: Jodi code of the observed row (-1 if missing)
+            patti: Patti code of the observed row (-1 if missing)
+            sign: 1 to add the observation, -1 to remove it
+        """
+        if jodi >= 0:
+            self.first_digit_hist[jodi // 10] += sign
+            self.second_digit_hist[jodi % 10] += sign
+            self.jodi_counts[jodi] += sign
+
+            if prev_jodi >= 0:
+                self.distances[prev_jodi, abs(jodi - prev_jodi)] += sign
+
+        if patti >= 0:
+            self.patti_counts[patti] += sign
+        elif jodi >= 0:
+            sum_keys, diff_keys = synthetic_patti_keys(np.array([jodi]))
+            self.sum_patti_counts[sum_keys[0]] += sign
+            self.diff_patti_counts[diff_keys[0]] += sign
+
+    @property
+    def patti_weights(self):
+        """1000-bin weights of sorted pattis (real pattis plus weighted synthetic ones)"""
+        return (self.patti_counts
+                + SUM_PATTI_WEIGHT * self.sum_patti_counts
+                + DIFF_PATTI_WEIGHT * self.diff_patti_counts)
+
+    def jodi_scores(self):
+        """
+        Weighted jodi frequency over the window
+
+        Counts plus a recency bonus for the last week (0.5 down to 0.07) and half of
+        the near-miss weight of every observed jodi.
+        """
+        scores = self.jodi_counts + 0.5 * (self.jodi_counts @ NEAR_MISS_KERNEL)
+        recent = np.asarray(self.recent_jodis, dtype=np.int64)
+        days_ago = np.arange(len(recent), 0, -1)
+        weights = 0.5 * (8 - days_ago) / RECENCY_DAYS
+        valid = recent >= 0
+        np.add.at(scores, recent[valid].astype(np.int64), weights[valid])
+        return scores
+
+    def digit_probabilities(self):
+        """Normalized (open, close) digit probability vectors from the jodi digit histograms"""
+        first_total = self.first_digit_hist.sum() or 1
+        second_total = self.second_digit_hist.sum() or 1
+        return self.first_digit_hist / first_total, self.second_digit_hist / second_total
+
+    def latest_pattern_scores(self):
+        """
+        Evidence for the next jodi from patterns around the most recent jodi
+
+        Equal shares of: jodis at the historical numeric distances from it, its
+        digit flip (27 -> 72) and its near-miss neighbours.
+        """
+        scores = np.zeros(NUM_JODIS)
+        latest = self.latest_jodi
+        if latest < 0:
+            return scores
+
+        distance_scores = np.zeros(NUM_JODIS)
+        distance_counts = self.distances[latest]
+        distances = np.flatnonzero(distance_counts)
+        for targets in (latest + distances, latest - distances[distances > 0]):
+            in_range = (targets >= 0) & (targets < NUM_JODIS)
+            np.add.at(distance_scores, targets[in_range], distance_counts[np.abs(targets[in_range] - latest)])
+        scores += normalize(distance_scores)
+
+        if self.jodi_counts[latest] > 0:
+            scores[FLIPPED_JODI[latest]] += 1.0
+        scores += normalize(self.jodi_counts[latest] * NEAR_MISS_KERNEL[latest])
+        return scores
+
+    def jodi_probabilities(self):
+        """
+        Probability vector over all 100 jodis
+
+        Mixes the weighted jodi frequency, the product of the open/close digit
+        probabilities and the latest-jodi patterns, then smooths with a uniform share.
+        """
+        open_prob, close_prob = self.digit_probabilities()
+        mix = (FREQUENCY_WEIGHT * normalize(self.jodi_scores())
+               + DIGIT_PAIR_WEIGHT * np.outer(open_prob, close_prob).ravel()
+               + LATEST_PATTERN_WEIGHT * normalize(self.latest_pattern_scores()))
+        return (1 - SMOOTHING) * normalize(mix) + SMOOTHING / NUM_JODIS
@@ -0,0 +1,90 @@
+import itertools
+import numpy as np
+from ml.pattern_engine import NUM_DIGITS, NUM_PATTI_KEYS, normalize
+
+# Every valid patti (panel) is a multiset of three digits written in ascending order
+# with 0 counted as 10, e.g. "127", "190", "550", "000": 120 single, 90 double and
+# 10 triple pattis. Its ank is the last digit of the digit sum.
+
+
+def _panel_order(digit):
+    """Sort key placing 0 after 9, as pattis are written"""
+    return 10 if digit == 0 else digit
+
+
+def _build_patti_table():
+    """Enumerate all 220 valid pattis as a (220, 3) digit array in panel order"""
+    triples = itertools.combinations_with_replacement(range(NUM_DIGITS), 3)
+    panels = sorted(
+        (tuple(sorted(triple, key=_panel_order)) for triple in triples),
+        key=lambda panel: [_panel_order(d) for d in panel]
+    )
+    return np.array(panels, dtype=np.int16)
+
+
+# PATTI_DIGITS[i] are the three digits of patti i as written (e.g. [1, 9, 0])
+PATTI_DIGITS = _build_patti_table()
+NUM_PATTIS = len(PATTI_DIGITS)
+
+# PATTI_STRINGS[i] is the patti as stored in results ("190")
+PATTI_STRINGS = np.array([''.join(str(d) for d in digits) for digits in PATTI_DIGITS])
+
+# PATTI_ANK[i] is the single (ank) digit of patti i; an open patti's ank is the first
+# jodi digit and a close patti's ank is the second
+PATTI_ANK = (PATTI_DIGITS.sum(axis=1) % 10).astype(np.int16)
+
+# PATTI_CONTAINS[i, d] is True when digit d appears in patti i
+PATTI_CONTAINS = (PATTI_DIGITS[:, :, None] == np.arange(NUM_DIGITS)).any(axis=1)
+
+# PATTIS_BY_ANK[d] holds the indices of the 22 pattis whose ank is d
+PATTIS_BY_ANK = [np.flatnonzero(PATTI_ANK == d) for d in range(NUM_DIGITS)]
+
+# PATTI_KEY[i] is the sorted-digit key used by `encode_pattis` ("190" -> 19); every
+# possible key maps back to exactly one patti through PATTI_INDEX_BY_KEY
+_sorted_digits = np.sort(PATTI_DIGITS, axis=1).astype(np.int64)
+PATTI_KEY = _sorted_digits[:, 0] * 100 + _sorted_digits[:, 1] * 10 + _sorted_digits[:, 2]
+PATTI_INDEX_BY_KEY = np.full(NUM_PATTI_KEYS, -1, dtype=np.int16)
+PATTI_INDEX_BY_KEY[PATTI_KEY] = np.arange(NUM_PATTIS)
+
+# Mixing weights of the patti score sources and the uniform share that keeps every
+# patti rankable
+PATTI_HISTORY_WEIGHT = 0.5
+PATTI_ANK_WEIGHT = 0.5
+PATTI_SMOOTHING = 0.01
+
+
+def patti_scores(patti_weights, open_prob, close_prob):
+    """
+    Score all valid pattis for the next result
+
+    Args:
+        patti_weights: 1000-bin weights by sorted-digit key (PatternEngine.patti_weights)
+        open_prob: 10-bin open (first jodi digit) probabilities
+        close_prob: 10-bin close (second jodi digit) probabilities
+
+    Returns:
+        Array of NUM_PATTIS scores aligned with PATTI_STRINGS
+    """
+    history = normalize(np.asarray(patti_weights, dtype=float)[PATTI_KEY])
+    # Probability that a patti's ank comes up as either the open or the close ank,
+    # shared between the pattis with that ank
+    ank_prob = 0.5 * (np.asarray(open_prob) + np.asarray(close_prob))
+    ank = ank_prob[PATTI_ANK] / len(PATTIS_BY_ANK[0])
+    scores = PATTI_HISTORY_WEIGHT * history + PATTI_ANK_WEIGHT * ank
+    return (1 - PATTI_SMOOTHING) * normalize(scores) + PATTI_SMOOTHING / NUM_PATTIS
+
+
+def random_pattis(rng, k, ank=None):
+    """
+    Draw k different valid pattis
+
+    Args:
+        rng: numpy.random.Generator
+        k: Number of pattis
+        ank: Optional ank digit the pattis must have
+
+    Returns:
+        List of patti strings
+    """
+    pool = PATTIS_BY_ANK[ank] if ank is not None else np.arange(NUM_PATTIS)
+    return [str(p) for p in PATTI_STRINGS[rng.choice(pool, size=k, replace=False)]]
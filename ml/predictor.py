@@ -1,10 +1,15 @@
 import os
+import json
+import time
+import hashlib
 import joblib
 import numpy as np
 import pandas as pd
-import random
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from config import Config
+from ml.pattern_engine import NUM_JODIS, PatternEngine, encode_pattis, frame_jodi_codes, top_k
+from ml.patti_table import PATTI_STRINGS, patti_scores, random_pattis
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -14,17 +19,177 @@ logger = logging.getLogger(__name__)
 MODEL_DIR = "ml_models"
 os.makedirs(MODEL_DIR, exist_ok=True)
 
+# Batches with at least this many markets are spread over a process pool
+BATCH_POOL_MIN_MARKETS = 16
+
+# Bump when the prediction algorithm changes so cached predictions are not reused
+PREDICTOR_VERSION = 3
+
+# Number of jodis and pattis in a prediction
+JODI_LIST_SIZE = 10
+PATTI_LIST_SIZE = 4
+
+# Little-endian float16 for the stored probability vectors (240 bytes per prediction)
+PROBABILITY_DTYPE = '<f2'
+
+# Content-addressed cache of deterministic predictions, one JSON file per key
+PREDICTION_CACHE_DIR = os.path.join(MODEL_DIR, "prediction_cache")
+os.makedirs(PREDICTION_CACHE_DIR, exist_ok=True)
+
+# Share of the trained models' class probabilities in a blended prediction
+MODEL_BLEND_WEIGHT = 0.5
+
+# Retention of the prediction cache (see `prune_prediction_cache`)
+PREDICTION_CACHE_MAX_AGE_DAYS = 30
+PREDICTION_CACHE_MAX_FILES = 5000
+
 def create_jodi(open_digit, close_digit):
     """Create jodi from open and close digits"""
     return f"{open_digit}{close_digit}"
 
-def generate_predictions(df, market):
+def data_version(jodis, pattis=None, model_probabilities=None):
+    """
+    Content hash of a market's prediction window
+    
+    Args:
+        jodis: Jodi codes from `encode_jodis`
+        pattis: Optional patti codes from `encode_pattis` (ignored if all missing)
+        model_probabilities: Optional model output blended into the prediction
+    
+    Returns:
+        16-character hex digest
+    """
+    digest = hashlib.sha256(np.asarray(jodis, dtype=np.int16).tobytes())
+    if pattis is not None and (np.asarray(pattis) >= 0).any():
+        digest.update(b'|' + np.asarray(pattis, dtype=np.int16).tobytes())
+    if model_probabilities is not None:
+        for name in ('open', 'close', 'jodi'):
+            digest.update(b'|' + np.asarray(model_probabilities[name], dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+def prediction_key(market, target_date, version=''):
+    """Cache key of the prediction for (market, target_date, data_version)"""
+    key = f"{PREDICTOR_VERSION}|{market}|{target_date}|{version}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def prediction_rng(market, target_date, version=''):
+    """Random generator seeded from (market, target_date, data_version)"""
+    return _rng_from_key(prediction_key(market, target_date, version))
+
+def _rng_from_key(key):
+    """Random generator seeded from the first 64 bits of a prediction key"""
+    return np.random.default_rng(int(key[:16], 16))
+
+def _load_cached_prediction(key):
+    """Read a cached prediction, or None if it is not cached"""
+    path = os.path.join(PREDICTION_CACHE_DIR, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error reading cached prediction {key}: {e}")
+        return None
+
+def _save_cached_prediction(key, predictions):
+    """Write a prediction to the cache (atomically, so readers never see partial files)"""
+    path = os.path.join(PREDICTION_CACHE_DIR, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(predictions, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error caching prediction {key}: {e}")
+
+def prune_prediction_cache(max_age_days=PREDICTION_CACHE_MAX_AGE_DAYS, max_files=PREDICTION_CACHE_MAX_FILES,
+                           cache_dir=PREDICTION_CACHE_DIR):
+    """
+    Delete cached predictions that were not written recently
+    
+    Files older than `max_age_days` are removed, then the oldest files beyond
+    `max_files`. Stale keys are never read again (a new result changes the data
+    version), so this only bounds disk use.
+    
+    Returns:
+        Number of deleted files
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith('.json'):
+            entries.append((entry.stat().st_mtime, entry.path))
+    entries.sort(reverse=True)
+    
+    cutoff = time.time() - max_age_days * 86400
+    expired = [path for i, (mtime, path) in enumerate(entries) if mtime < cutoff or i >= max_files]
+    deleted = 0
+    for path in expired:
+        try:
+            os.remove(path)
+            deleted += 1
+        except OSError as e:
+            logger.error(f"Error deleting cached prediction {path}: {e}")
+    
+    if deleted:
+        logger.info(f"Deleted {deleted} cached predictions")
+    return deleted
+
+def _generate_cached(market, target_date, jodis, pattis, build, model_probabilities=None):
+    """
+    Run `build(rng)` deterministically through the prediction cache
+    
+    Without a target date the generator is unseeded and nothing is cached, which
+    keeps the old non-deterministic behaviour for ad-hoc calls.
+    """
+    if target_date is None:
+        return build(np.random.default_rng())
+    
+    key = prediction_key(market, target_date, data_version(jodis, pattis, model_probabilities))
+    cached = _load_cached_prediction(key)
+    if cached is not None:
+        logger.info(f"Using cached predictions for {market} on {target_date}")
+        return cached
+    
+    predictions = build(_rng_from_key(key))
+    _save_cached_prediction(key, predictions)
+    return predictions
+
+def _select_digit_pair(digit_prob, rng):
+    """
+    Pick two different digits from a 10-bin probability vector
+
+    The first is the most probable digit (lowest digit on ties); the second is a
+    weighted random choice among the remaining digits.
+    """
+    order = np.lexsort((np.arange(len(digit_prob)), -digit_prob))
+    first_digit = int(order[0])
+    
+    remaining = order[1:]
+    weights = digit_prob[remaining]
+    
+    if weights.sum() > 0:
+        # Select one with probability proportional to historical frequency
+        second_digit = int(rng.choice(remaining, p=weights / weights.sum()))
+    else:
+        # No history for the other digits, choose a random different digit
+        second_digit = int(rng.choice(remaining))
+    
+    return [str(first_digit), str(second_digit)]
+
+def generate_predictions(df, market, target_date=None, model_probabilities=None):
     """
     Generate predictions for a market with enhanced pattern recognition based on historical data
     
     Args:
         df: DataFrame with historical data
         market: Market name
+        target_date: Date being predicted. When given, the output is deterministic for
+            the same market, date and window, and is served from the prediction cache
+        model_probabilities: Optional 'open'/'close'/'jodi' class probabilities of the
+            market's trained models (ml.inference.predict_probabilities), blended
+            into the pattern statistics; without them the prediction is heuristic
     
     Returns:
         Dictionary with predictions
@@ -35,392 +200,251 @@ def generate_predictions(df, market):
         # Get most recent 60 days as requested
         recent_df = df.tail(Config.TRAINING_DAYS)  # Config.TRAINING_DAYS = 60
         
-        if len(recent_df) < 30:
-            logger.warning(f"Not enough data for {market}, need at least 30 days")
-            # For testing, return random predictions
-            return generate_random_predictions()
-        
-        # Initialize frequency trackers
-        jodi_first_digit_freq = {}   # For open digit prediction (first digit of jodi)
-        jodi_second_digit_freq = {}  # For close digit prediction (second digit of jodi)
-        jodi_freq = {}               # Full jodi frequency
-        patti_freq = {}              # Actual patti frequency
-        
-        # Track transitions and pattern analysis
-        jodi_transitions = {}        # What jodi tends to follow another
-        jodi_distances = {}          # Distance between consecutive jodis
-        flip_patterns = {}           # Track when digits swap positions
-        near_miss_patterns = {}      # Track near-miss patterns
-        
-        # Extract all jodis for pattern analysis
-        all_jodis = []
-        for i in range(len(recent_df)):
-            if recent_df.iloc[i]['Jodi'] and not pd.isna(recent_df.iloc[i]['Jodi']):
-                jodi = str(recent_df.iloc[i]['Jodi']).zfill(2)
-                all_jodis.append(jodi)
-        
-        # Analyze recent results to find patterns
-        for i in range(1, len(recent_df)):
-            # Current row
-            row = recent_df.iloc[i]
-            prev_row = recent_df.iloc[i-1]
-            
-            # Process jodi for open/close digit studies 
-            if row['Jodi'] and not pd.isna(row['Jodi']):
-                jodi = str(row['Jodi']).zfill(2)
-                
-                # Extract digits for specific studies
-                first_digit = int(jodi[0])   # For open prediction
-                second_digit = int(jodi[1])  # For close prediction
-                
-                # Update frequencies for open/close digit prediction
-                jodi_first_digit_freq[first_digit] = jodi_first_digit_freq.get(first_digit, 0) + 1
-                jodi_second_digit_freq[second_digit] = jodi_second_digit_freq.get(second_digit, 0) + 1
-                
-                # Update full jodi frequency
-                jodi_freq[jodi] = jodi_freq.get(jodi, 0) + 1
-                
-                # Add additional weight to recent jodis (recency bias)
-                days_ago = len(recent_df) - i
-                if days_ago <= 7:  # Last week gets extra weight
-                    recency_weight = 0.5 * (8 - days_ago) / 7  # 0.5 to 0.07 extra weight
-                    jodi_freq[jodi] = jodi_freq.get(jodi, 0) + recency_weight
-                
-                # Study flip patterns (e.g., 27 -> 72)
-                flipped_jodi = f"{jodi[1]}{jodi[0]}"
-                flip_patterns[jodi] = flipped_jodi
-                
-                # Track transitions from previous jodi to current
-                if prev_row['Jodi'] and not pd.isna(prev_row['Jodi']):
-                    prev_jodi = str(prev_row['Jodi']).zfill(2)
-                    
-                    # Direct transition
-                    transition_key = f"{prev_jodi}->{jodi}"
-                    jodi_transitions[transition_key] = jodi_transitions.get(transition_key, 0) + 1
-                    
-                    # Calculate jodi distance (difference between consecutive jodis)
-                    # This captures the numeric jump between jodis
-                    prev_jodi_num = int(prev_jodi)
-                    curr_jodi_num = int(jodi)
-                    distance = abs(curr_jodi_num - prev_jodi_num)
-                    distance_key = f"{prev_jodi}:dist:{distance}"
-                    jodi_distances[distance_key] = jodi_distances.get(distance_key, 0) + 1
-                    
-                    # Check for digit flip between consecutive jodis
-                    if prev_jodi[0] == jodi[1] and prev_jodi[1] == jodi[0]:
-                        flip_key = f"{prev_jodi}->flip->{jodi}"
-                        jodi_transitions[flip_key] = jodi_transitions.get(flip_key, 0) + 1.5  # Extra weight for flips
-                
-                # Analyze near-miss patterns (differing by ±1-4 in each digit)
-                for d1_diff in range(-4, 5):
-                    for d2_diff in range(-4, 5):
-                        if d1_diff == 0 and d2_diff == 0:
-                            continue  # Skip exact match
-                        
-                        d1 = (first_digit + d1_diff) % 10
-                        d2 = (second_digit + d2_diff) % 10
-                        
-                        # Weight decreases as difference increases
-                        if abs(d1_diff) <= 1 and abs(d2_diff) <= 1:
-                            weight = 0.3  # Near misses get good weight
-                        elif abs(d1_diff) <= 2 and abs(d2_diff) <= 2:
-                            weight = 0.2  # Further misses get less weight
-                        else:
-                            weight = 0.1  # Distant misses get even less
-                        
-                        near_miss_jodi = f"{d1}{d2}"
-                        near_miss_key = f"{jodi}->near:{near_miss_jodi}"
-                        near_miss_patterns[near_miss_key] = near_miss_patterns.get(near_miss_key, 0) + weight
-                        
-                        # Also update jodi frequency with a smaller weight
-                        jodi_freq[near_miss_jodi] = jodi_freq.get(near_miss_jodi, 0) + weight * 0.5
-            
-            # Process pattis from actual data
-            # In real data, pattis are 3-digit numbers derived from the panel/matka results
-            # Here we'll capture them from any 3-digit pattern in the data
-            if 'patti' in row and row['patti'] and not pd.isna(row['patti']):
-                patti = str(row['patti'])
-                
-                # Ensure the patti is sorted in ascending order of digits
-                sorted_patti = ''.join(sorted(patti))
-                patti_freq[sorted_patti] = patti_freq.get(sorted_patti, 0) + 1
-            
-            # If specific patti field is not available, we'll create synthetic pattis from jodis
-            elif row['Jodi'] and not pd.isna(row['Jodi']):
-                jodi = str(row['Jodi']).zfill(2)
-                
-                # Method 1: Middle digit is sum of jodi digits mod 10
-                middle1 = (int(jodi[0]) + int(jodi[1])) % 10
-                patti1 = f"{jodi[0]}{middle1}{jodi[1]}"
-                sorted_patti1 = ''.join(sorted(patti1))
-                patti_freq[sorted_patti1] = patti_freq.get(sorted_patti1, 0) + 0.8
-                
-                # Method 2: Middle digit is difference of jodi digits mod 10
-                middle2 = abs(int(jodi[0]) - int(jodi[1])) % 10
-                patti2 = f"{jodi[0]}{middle2}{jodi[1]}"
-                sorted_patti2 = ''.join(sorted(patti2))
-                patti_freq[sorted_patti2] = patti_freq.get(sorted_patti2, 0) + 0.6
-        
-        # Normalize frequencies to get probabilities
-        total_jodi_first_digit = sum(jodi_first_digit_freq.values()) or 1
-        total_jodi_second_digit = sum(jodi_second_digit_freq.values()) or 1
-        
-        jodi_first_digit_prob = {}
-        jodi_second_digit_prob = {}
-        
-        for d in range(10):
-            jodi_first_digit_prob[d] = jodi_first_digit_freq.get(d, 0) / total_jodi_first_digit
-            jodi_second_digit_prob[d] = jodi_second_digit_freq.get(d, 0) / total_jodi_second_digit
-        
-        # Select open digits (based on first digit of jodis)
-        open_digit_candidates = sorted([(d, p) for d, p in jodi_first_digit_prob.items()], 
-                                      key=lambda x: x[1], reverse=True)
-        
-        # Select close digits (based on second digit of jodis)
-        close_digit_candidates = sorted([(d, p) for d, p in jodi_second_digit_prob.items()], 
-                                       key=lambda x: x[1], reverse=True)
-        
-        # Select digits with more variation across the full range (0-9)
-        open_digits = []
-        close_digits = []
-        
-        # Ensure variety by selecting from different parts of the digit range
-        # NEW APPROACH: More varied open digit selection
-        # First, take the highest probability digit
-        open_digits.append(str(open_digit_candidates[0][0]))
-        
-        # For the second digit, we'll use a weighted random selection from the remaining digits
-        # This ensures both diversity and maintains statistical relevance
-        remaining_candidates = [(d, p) for d, p in open_digit_candidates if d != int(open_digits[0])]
-        
-        # If we have remaining candidates, select one with probability proportional to historical frequency
-        if remaining_candidates:
-            # Calculate total probability weight for normalization
-            total_weight = sum(p for _, p in remaining_candidates)
-            
-            # Calculate normalized probabilities
-            weights = [p/total_weight for _, p in remaining_candidates]
-            
-            # Weighted random selection
-            selected_index = random.choices(range(len(remaining_candidates)), weights=weights, k=1)[0]
-            open_digits.append(str(remaining_candidates[selected_index][0]))
-        else:
-            # In the unlikely case there are no other candidates, choose a random digit
-            random_digit = random.randint(0, 9)
-            while str(random_digit) == open_digits[0]:  # Ensure it's different from first digit
-                random_digit = random.randint(0, 9)
-            open_digits.append(str(random_digit))
-        
-        # NEW APPROACH: More varied close digit selection (similar to open digits)
-        # First, take the highest probability digit
-        close_digits.append(str(close_digit_candidates[0][0]))
-        
-        # For the second digit, use weighted random selection from the remaining digits
-        # This ensures both diversity and maintains statistical relevance
-        remaining_candidates = [(d, p) for d, p in close_digit_candidates if d != int(close_digits[0])]
-        
-        # If we have remaining candidates, select one with probability proportional to historical frequency
-        if remaining_candidates:
-            # Calculate total probability weight for normalization
-            total_weight = sum(p for _, p in remaining_candidates)
-            
-            # Calculate normalized probabilities
-            weights = [p/total_weight for _, p in remaining_candidates]
-            
-            # Weighted random selection
-            selected_index = random.choices(range(len(remaining_candidates)), weights=weights, k=1)[0]
-            close_digits.append(str(remaining_candidates[selected_index][0]))
-        else:
-            # In the unlikely case there are no other candidates, choose a random digit
-            random_digit = random.randint(0, 9)
-            while str(random_digit) == close_digits[0]:  # Ensure it's different from first digit
-                random_digit = random.randint(0, 9)
-            close_digits.append(str(random_digit))
-        
-        # Generate jodi predictions combining our insights
-        jodi_candidates = []
-        
-        # 1. Include highest frequency jodis from history
-        top_jodis = sorted([(j, f) for j, f in jodi_freq.items()], key=lambda x: x[1], reverse=True)
-        for jodi, _ in top_jodis[:4]:  # Top 4 historical jodis
-            if jodi not in jodi_candidates:
-                jodi_candidates.append(jodi)
-        
-        # 2. Include jodis from our predicted open and close digits
-        for o in open_digits:
-            for c in close_digits:
-                jodi = f"{o}{c}"
-                if jodi not in jodi_candidates and len(jodi_candidates) < 7:
-                    jodi_candidates.append(jodi)
-        
-        # 3. Include most likely transitions from the most recent jodi
-        if all_jodis:
-            latest_jodi = all_jodis[-1]
-            
-            # Find direct transitions from this jodi
-            transitions = [(k.split('->')[1], v) for k, v in jodi_transitions.items() 
-                          if k.startswith(f"{latest_jodi}->") and not k.startswith(f"{latest_jodi}->flip->")]
-            
-            # Add transitions based on the distance pattern from this jodi
-            # Get historical distances
-            latest_distances = [(k.split(':dist:')[1], v) for k, v in jodi_distances.items() 
-                               if k.startswith(f"{latest_jodi}:dist:")]
-            
-            if latest_distances:
-                # Find most common distance
-                most_common_distance = int(sorted(latest_distances, key=lambda x: x[1], reverse=True)[0][0])
-                
-                # Generate jodi with this distance
-                latest_jodi_num = int(latest_jodi)
-                potential_jodis = [
-                    str(latest_jodi_num + most_common_distance).zfill(2),
-                    str(latest_jodi_num - most_common_distance).zfill(2)
-                ]
-                
-                for potential_jodi in potential_jodis:
-                    if len(potential_jodi) == 2 and potential_jodi not in jodi_candidates:
-                        jodi_candidates.append(potential_jodi)
-            
-            # Add transitions based on flip patterns
-            if latest_jodi in flip_patterns:
-                flipped_jodi = flip_patterns[latest_jodi]
-                if flipped_jodi not in jodi_candidates:
-                    jodi_candidates.append(flipped_jodi)
-            
-            # Add high-probability near-miss patterns
-            near_misses = [(k.split('->near:')[1], v) for k, v in near_miss_patterns.items() 
-                           if k.startswith(f"{latest_jodi}->near:")]
-            
-            top_near_misses = sorted(near_misses, key=lambda x: x[1], reverse=True)[:2]
-            for near_miss, _ in top_near_misses:
-                if near_miss not in jodi_candidates:
-                    jodi_candidates.append(near_miss)
-        
-        # 4. Fill remaining slots with weighted random selection
-        jodi_list = jodi_candidates[:10]  # Take first 10 candidates
+        jodis = frame_jodi_codes(recent_df)
+        pattis = encode_pattis(recent_df['patti']) if 'patti' in recent_df.columns else None
         
-        # If we don't have enough candidates, add more using weighted probability
-        if len(jodi_list) < 10:
-            all_jodis_list = [(j, f) for j, f in jodi_freq.items() if j not in jodi_list]
-            all_jodis_list = sorted(all_jodis_list, key=lambda x: x[1], reverse=True)
+        def build(rng):
+            if len(recent_df) < 30:
+                logger.warning(f"Not enough data for {market}, need at least 30 days")
+                # For testing, return random predictions
+                return generate_random_predictions(rng)
             
-            for jodi, _ in all_jodis_list:
-                if len(jodi_list) >= 10:
-                    break
-                jodi_list.append(jodi)
-        
-        # Generate patti predictions based on historical pattis
-        patti_candidates = []
+            # Build dense pattern statistics (digit histograms, jodi counts, the
+            # distance matrix and patti weights) from the jodi sequence
+            engine = PatternEngine.from_sequence(jodis, pattis)
+            return predictions_from_engine(engine, rng, model_probabilities)
         
-        # Use actual historical pattis if available
-        if patti_freq:
-            top_pattis = sorted([(p, f) for p, f in patti_freq.items()], key=lambda x: x[1], reverse=True)
-            for patti, _ in top_pattis[:3]:  # Top 3 historical pattis
-                if patti not in patti_candidates:
-                    patti_candidates.append(patti)
-        
-        # Generate pattis from jodis if needed
-        while len(patti_candidates) < 4:
-            # Take a jodi from our list
-            if jodi_list and len(jodi_list) > len(patti_candidates):
-                jodi = jodi_list[len(patti_candidates)]
-                
-                # Create middle digit (various methods for variety)
-                if len(patti_candidates) % 3 == 0:
-                    middle_digit = (int(jodi[0]) + int(jodi[1])) % 10  # Sum of digits
-                elif len(patti_candidates) % 3 == 1:
-                    middle_digit = abs(int(jodi[0]) - int(jodi[1])) % 10  # Difference of digits
-                else:
-                    middle_digit = random.randint(0, 9)  # Random digit
-                
-                # Create patti and sort digits
-                patti = f"{jodi[0]}{middle_digit}{jodi[1]}"
-                sorted_patti = ''.join(sorted(patti))
-                
-                if sorted_patti not in patti_candidates:
-                    patti_candidates.append(sorted_patti)
-            else:
-                # Generate random patti if we run out of jodis
-                digits = [str(random.randint(0, 9)) for _ in range(3)]
-                sorted_patti = ''.join(sorted(digits))
-                
-                if sorted_patti not in patti_candidates:
-                    patti_candidates.append(sorted_patti)
-        
-        # Final patti list
-        patti_list = patti_candidates
-        
-        # Convert all numeric values to Python native strings
+        return _generate_cached(market, target_date, jodis, pattis, build, model_probabilities)
+    
+    except Exception as e:
+        logger.error(f"Error generating predictions: {e}")
+        import traceback
+        traceback.print_exc()
+        if target_date is None:
+            return generate_random_predictions()
+        return generate_random_predictions(prediction_rng(market, target_date))
+
+def generate_predictions_for_markets(states, target_dates=None, max_workers=None, model_probabilities=None):
+    """
+    Generate predictions for many markets in one call
+    
+    Every market predicts from its MarketState, so nothing is re-queried or rebuilt.
+    Small batches run in-process (each market is a handful of array operations);
+    batches of BATCH_POOL_MIN_MARKETS or more markets use a process pool.
+    
+    Args:
+        states: Dictionary of market name -> ml.market_state.MarketState
+        target_dates: Optional dictionary of market name -> date being predicted
+        max_workers: Process pool size (defaults to the CPU count)
+        model_probabilities: Optional dictionary of market name -> trained model
+            probabilities (see `generate_predictions`)
+    
+    Returns:
+        Dictionary of market name -> predictions
+    """
+    markets = list(states)
+    target_dates = target_dates or {}
+    model_probabilities = model_probabilities or {}
+    dates = [target_dates.get(m) for m in markets]
+    probabilities = [model_probabilities.get(m) for m in markets]
+    
+    if len(markets) < BATCH_POOL_MIN_MARKETS:
         return {
-            'open_digits': [str(d) for d in open_digits],
-            'close_digits': [str(d) for d in close_digits],
-            'jodi_list': [str(j) for j in jodi_list],
-            'patti_list': [str(p) for p in patti_list]
+            market: generate_predictions_from_state(states[market], date, market_probabilities)
+            for market, date, market_probabilities in zip(markets, dates, probabilities)
         }
     
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(generate_predictions_from_state, [states[m] for m in markets], dates, probabilities)
+        return dict(zip(markets, results))
+
+def generate_predictions_from_state(state, target_date=None, model_probabilities=None):
+    """
+    Generate predictions from an incrementally maintained MarketState
+    
+    Args:
+        state: ml.market_state.MarketState holding the market's sliding window
+        target_date: Date being predicted (see `generate_predictions`)
+        model_probabilities: Optional trained model probabilities (see `generate_predictions`)
+    
+    Returns:
+        Dictionary with predictions
+    """
+    logger.info(f"Generating predictions for {state.market} from incremental state")
+    
+    try:
+        def build(rng):
+            if len(state) < 30:
+                logger.warning(f"Not enough data for {state.market}, need at least 30 days")
+                return generate_random_predictions(rng)
+            
+            return predictions_from_engine(state.engine, rng, model_probabilities)
+        
+        jodis = np.array(state.jodis, dtype=np.int16)
+        pattis = np.array(state.pattis, dtype=np.int16)
+        return _generate_cached(state.market, target_date, jodis, pattis, build, model_probabilities)
+    
     except Exception as e:
         logger.error(f"Error generating predictions: {e}")
         import traceback
         traceback.print_exc()
-        return generate_random_predictions()
+        if target_date is None:
+            return generate_random_predictions()
+        return generate_random_predictions(prediction_rng(state.market, target_date))
 
-def generate_random_predictions():
-    """Generate random predictions for testing"""
+def blend_probabilities(heuristic, model, weight=MODEL_BLEND_WEIGHT):
+    """
+    Mix a pattern-statistics probability vector with a model's, renormalized
+    
+    Returns the heuristic vector unchanged when there is no usable model output.
+    """
+    if model is None:
+        return heuristic
+    model = np.asarray(model, dtype=np.float64)
+    total = model.sum()
+    if not np.isfinite(total) or total <= 0:
+        return heuristic
+    blended = (1 - weight) * heuristic + weight * model / total
+    return blended / blended.sum()
+
+def predictions_from_engine(engine, rng, model_probabilities=None):
+    """
+    Select open/close digits, jodis and pattis from a market's pattern statistics
+    
+    Args:
+        engine: PatternEngine built over the market's recent window
+        rng: numpy.random.Generator used for every random choice
+        model_probabilities: Optional trained model probabilities, blended into the
+            jodi and digit probabilities with MODEL_BLEND_WEIGHT
+    
+    Returns:
+        Dictionary with predictions
+    """
+    jodi_prob = engine.jodi_probabilities()
+    open_digit_prob, close_digit_prob = engine.digit_probabilities()
+    if model_probabilities is not None:
+        jodi_prob = blend_probabilities(jodi_prob, model_probabilities.get('jodi'))
+        open_digit_prob = blend_probabilities(open_digit_prob, model_probabilities.get('open'))
+        close_digit_prob = blend_probabilities(close_digit_prob, model_probabilities.get('close'))
+    
+    # Select digits with more variation across the full range (0-9)
+    # First, take the highest probability digit, then a weighted random selection
+    # from the remaining digits. This ensures both diversity and statistical relevance
+    open_digits = _select_digit_pair(open_digit_prob, rng)
+    close_digits = _select_digit_pair(close_digit_prob, rng)
+    
+    # Rank all 100 jodis by probability and keep the most likely ones
+    top_jodis = top_k(jodi_prob, JODI_LIST_SIZE)
+    jodi_list = [f"{jodi:02d}" for jodi in top_jodis]
+    
+    # Score every valid patti from the historical patti weights and the ank
+    # (open/close digit) probabilities, and keep the best ones
+    scores = patti_scores(engine.patti_weights, open_digit_prob, close_digit_prob)
+    patti_list = list(PATTI_STRINGS[top_k(scores, PATTI_LIST_SIZE)])
+    
+    # Convert all numeric values to Python native strings
+    return {
+        'open_digits': [str(d) for d in open_digits],
+        'close_digits': [str(d) for d in close_digits],
+        'jodi_list': [str(j) for j in jodi_list],
+        'patti_list': [str(p) for p in patti_list],
+        # Probability that the actual jodi is in the list
+        'confidence_score': round(float(jodi_prob[top_jodis].sum()), 4),
+        'jodi_probabilities': jodi_prob.tolist(),
+        'open_probabilities': open_digit_prob.tolist(),
+        'close_probabilities': close_digit_prob.tolist()
+    }
+
+def pack_probabilities(predictions):
+    """
+    Compact float16 blob of a prediction's probability vectors
+    
+    Layout: 100 jodi probabilities, then 10 open and 10 close digit probabilities.
+    
+    Returns:
+        bytes, or None if the predictions carry no probability vectors
+    """
+    if not predictions.get('jodi_probabilities'):
+        return None
+    
+    vector = np.concatenate([
+        predictions['jodi_probabilities'],
+        predictions['open_probabilities'],
+        predictions['close_probabilities']
+    ])
+    return vector.astype(PROBABILITY_DTYPE).tobytes()
+
+def unpack_probabilities(blob):
+    """
+    Read a blob written by `pack_probabilities`
+    
+    Returns:
+        Dictionary with 'jodi', 'open' and 'close' float arrays, or None
+    """
+    if not blob:
+        return None
+    
+    vector = np.frombuffer(blob, dtype=PROBABILITY_DTYPE).astype(float)
+    return {
+        'jodi': vector[:NUM_JODIS],
+        'open': vector[NUM_JODIS:NUM_JODIS + 10],
+        'close': vector[NUM_JODIS + 10:NUM_JODIS + 20]
+    }
+
+def generate_random_predictions(rng=None):
+    """Generate random predictions for testing (deterministic when given a seeded generator)"""
     logger.warning("Generating random predictions with enhanced variety")
+    rng = rng if rng is not None else np.random.default_rng()
     
     # ENHANCED: Generate more varied open digits using full range 0-9
     # Select first open digit from anywhere in 0-9
-    first_open_digit = random.randint(0, 9)
+    first_open_digit = int(rng.integers(0, 10))
     
     # Select second open digit different from the first
-    second_open_digit = random.randint(0, 9)
+    second_open_digit = int(rng.integers(0, 10))
     while second_open_digit == first_open_digit:
-        second_open_digit = random.randint(0, 9)
+        second_open_digit = int(rng.integers(0, 10))
     
     open_digits = [str(first_open_digit), str(second_open_digit)]
     
     # Randomly reorder open digits in ~40% of cases
-    if random.random() < 0.4:
+    if rng.random() < 0.4:
         open_digits.reverse()
     
     # ENHANCED: Generate more varied close digits using full range 0-9
     # Select first close digit from anywhere in 0-9
-    first_close_digit = random.randint(0, 9)
+    first_close_digit = int(rng.integers(0, 10))
     
     # Select second close digit different from the first
-    second_close_digit = random.randint(0, 9)
+    second_close_digit = int(rng.integers(0, 10))
     while second_close_digit == first_close_digit:
-        second_close_digit = random.randint(0, 9)
+        second_close_digit = int(rng.integers(0, 10))
     
     close_digits = [str(first_close_digit), str(second_close_digit)]
     
     # Randomly reorder close digits in ~40% of cases
-    if random.random() < 0.4:
+    if rng.random() < 0.4:
         close_digits.reverse()
     
     # Generate 10 random jodis
     jodi_list = []
     while len(jodi_list) < 10:
-        jodi = f"{random.randint(0, 9)}{random.randint(0, 9)}"
+        jodi = f"{int(rng.integers(0, 10))}{int(rng.integers(0, 10))}"
         if jodi not in jodi_list:
             jodi_list.append(jodi)
     
-    # Generate 4 random pattis with more variety
+    # Generate 4 random valid pattis with more variety
+    # Method 1: Use pattis whose ank matches the first digit of the top jodis
     patti_list = []
-    # Method 1: Use jodi digits with random middle
     for i in range(2):
         if len(jodi_list) > i:
-            middle_digit = random.randint(0, 9)
-            patti = f"{jodi_list[i][0]}{middle_digit}{jodi_list[i][1]}"
+            patti = random_pattis(rng, 1, ank=int(jodi_list[i][0]))[0]
             if patti not in patti_list:
                 patti_list.append(patti)
     
-    # Method 2: Use random digits for more variety
+    # Method 2: Use random pattis for more variety
     while len(patti_list) < 4:
-        first = random.randint(0, 9)
-        middle = random.randint(0, 9)
-        last = random.randint(0, 9)
-        patti = f"{first}{middle}{last}"
+        patti = random_pattis(rng, 1)[0]
         if patti not in patti_list:
             patti_list.append(patti)
     
@@ -432,13 +456,15 @@ def generate_random_predictions():
         'patti_list': [str(p) for p in patti_list]
     }
 
-def calculate_confidence_score(market, df=None):
+def calculate_confidence_score(market, df=None, target_date=None):
     """
     Calculate confidence score for market prediction
     
     Args:
         market: Market name
         df: DataFrame with historical data (optional)
+        target_date: Date being predicted; seeds the default score from
+            `prediction_rng` so the same inputs give the same score
     
     Returns:
         Confidence score (0.0 to 1.0)
@@ -446,8 +472,12 @@ def calculate_confidence_score(market, df=None):
     try:
         # If no dataframe is provided, use a default confidence
         if df is None:
+            if target_date is None:
+                rng = np.random.default_rng()
+            else:
+                rng = prediction_rng(market, target_date, 'confidence')
             # Start with a high confidence score that decreases over time if we miss predictions
-            return round(random.uniform(0.7, 0.9), 2)
+            return round(float(rng.uniform(0.7, 0.9)), 2)
             
         # Calculate real confidence based on recent prediction accuracy
         # Get the most recent 30 days of data
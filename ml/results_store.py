@@ -0,0 +1,378 @@
+import os
+import glob
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columnar mirror of the results table (Arrow IPC file, uncompressed so it can be
+# memory-mapped)
+RESULTS_STORE_PATH = os.path.join("ml_models", "results.arrow")
+
+# Files appended to a store before it is merged back into one file
+MAX_SEGMENTS = 32
+
+# Stored in the digit columns where a result is missing or 'Off'
+MISSING = np.iinfo(np.uint16).max
+
+# Key spacing between markets in `ResultsHistory.contains` (more days than any date range)
+DAY_SPAN = 1 << 24
+
+# Zero-padded width of each digit column
+DIGIT_WIDTHS = {'open': 3, 'jodi': 2, 'close': 3}
+
+RESULTS_SCHEMA = pa.schema([
+    ('date', pa.date32()),
+    ('market', pa.dictionary(pa.int16(), pa.string())),
+    ('open', pa.uint16()),
+    ('jodi', pa.uint16()),
+    ('close', pa.uint16()),
+    ('is_holiday', pa.uint8()),
+])
+
+
+def _digits(values):
+    """uint16 numbers of zero-padded digit strings, MISSING where not a number"""
+    numbers = pd.to_numeric(pd.Series(values, dtype=object).astype(str).str.strip(), errors='coerce')
+    return numbers.fillna(MISSING).to_numpy(dtype=np.uint16)
+
+
+def _stored_frame(df):
+    """A results frame (see `write_results_store`) in the stored column layout"""
+    dates = df['Date']
+    if dates.dtype == object:
+        dates = pd.to_datetime(dates, format='%d/%m/%Y')
+    holidays = df['is_holiday'] if 'is_holiday' in df else pd.Series(False, index=df.index)
+    return pd.DataFrame({
+        'date': pd.to_datetime(dates).to_numpy(dtype='datetime64[D]'),
+        'market': df['Market'].astype(str).to_numpy(),
+        'open': _digits(df['Open']),
+        'jodi': _digits(df['Jodi']),
+        'close': _digits(df['Close']),
+        'is_holiday': holidays.astype(bool).to_numpy(dtype=np.uint8),
+    })
+
+
+def _table(frame):
+    """Arrow table of a stored-layout frame, sorted by market and date"""
+    frame = frame.sort_values(['market', 'date'], kind='stable')
+
+    # Sorted dictionary values keep the market codes in row order
+    markets = sorted(frame['market'].unique())
+    columns = [
+        pa.array(frame['date'].to_numpy(dtype='datetime64[D]'), type=pa.date32()),
+        pa.DictionaryArray.from_arrays(
+            pa.array(pd.Categorical(frame['market'], categories=markets).codes.astype(np.int16)),
+            pa.array(markets, type=pa.string())
+        ),
+    ] + [pa.array(frame[name].to_numpy()) for name in ('open', 'jodi', 'close', 'is_holiday')]
+    return pa.Table.from_arrays(columns, schema=RESULTS_SCHEMA)
+
+
+def _write_table(table, path):
+    """Replace an IPC file with a table, as one record batch"""
+    # One record batch, so every column maps to one contiguous buffer
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, RESULTS_SCHEMA) as writer:
+            writer.write_table(table, max_chunksize=max(1, len(table)))
+    os.replace(tmp_path, path)
+
+
+def segment_paths(path=RESULTS_STORE_PATH):
+    """Files appended to a store since it was last written in full, oldest first"""
+    return sorted(glob.glob(f"{glob.escape(path)}.[0-9][0-9][0-9][0-9]"))
+
+
+def write_results_store(df, path=RESULTS_STORE_PATH):
+    """
+    Write the results history in the columnar layout
+
+    Replaces the store and everything appended to it.
+
+    Args:
+        df: Results frame with 'Date', 'Market', 'Open', 'Jodi', 'Close' and
+            optionally 'is_holiday' (services.data_service.load_results_frame or
+            the historical CSV with 'dd/mm/YYYY' dates)
+        path: Destination file
+
+    Returns:
+        Path of the written file
+    """
+    _write_table(_table(_stored_frame(df)), path)
+    for segment in segment_paths(path):
+        os.remove(segment)
+    return path
+
+
+def append_results_store(df, path=RESULTS_STORE_PATH, max_segments=MAX_SEGMENTS):
+    """
+    Add new or changed results to the store without rewriting it
+
+    The rows go to a small segment file next to the store; readers let them
+    replace stored rows with the same market and date. Once `max_segments`
+    segments exist, the store and its segments are merged into one file again.
+    Without a store, one is written with just these rows.
+
+    Args:
+        df: Results frame, as for `write_results_store`
+        path: Store file
+        max_segments: Segments kept before the store is compacted
+
+    Returns:
+        Path of the written file
+    """
+    if not os.path.exists(path):
+        return write_results_store(df, path)
+
+    frame = _stored_frame(df)
+    segments = segment_paths(path)
+    if len(segments) >= max_segments:
+        history = load_results_store(path)
+        if history is not None:
+            frame = _merge([_history_frame(history), frame])
+        _write_table(_table(frame), path)
+        for segment in segments:
+            os.remove(segment)
+        logger.info(f"Compacted results store {path} ({len(segments)} segments)")
+        return path
+
+    number = int(segments[-1].rsplit('.', 1)[1]) + 1 if segments else 1
+    segment = f"{path}.{number:04d}"
+    _write_table(_table(frame), segment)
+    return segment
+
+
+def _view(array, dtype):
+    """Zero-copy NumPy view of the values buffer of a null-free Arrow array"""
+    dtype = np.dtype(dtype)
+    return np.frombuffer(array.buffers()[1], dtype=dtype, count=len(array), offset=array.offset * dtype.itemsize)
+
+
+class ResultsHistory:
+    """
+    Memory-mapped results history
+
+    Every attribute is a read-only NumPy view into the mapped file, sorted by market
+    and date; nothing is parsed or copied on load.
+
+    Attributes:
+        markets: Market names; `market_codes` index into this list
+        market_codes: int16 array
+        days: int32 days since 1970-01-01 (`dates` for datetime64[D])
+        open, jodi, close: uint16 arrays, MISSING where there is no result
+        is_holiday: uint8 array
+    """
+
+    def __init__(self, table):
+        self.table = table
+        market = table.column('market').chunk(0) if len(table) else None
+        self.markets = market.dictionary.to_pylist() if market is not None else []
+        if len(table):
+            self.market_codes = _view(market.indices, np.int16)
+            self.days = _view(table.column('date').chunk(0), np.int32)
+            for name in ('open', 'jodi', 'close'):
+                setattr(self, name, _view(table.column(name).chunk(0), np.uint16))
+            self.is_holiday = _view(table.column('is_holiday').chunk(0), np.uint8)
+        else:
+            self.market_codes = np.zeros(0, dtype=np.int16)
+            self.days = np.zeros(0, dtype=np.int32)
+            for name in ('open', 'jodi', 'close'):
+                setattr(self, name, np.zeros(0, dtype=np.uint16))
+            self.is_holiday = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def dates(self):
+        return self.days.astype('datetime64[D]')
+
+    def market_rows(self, market):
+        """Slice of a market's rows (empty if the market is unknown)"""
+        if market not in self.markets:
+            return slice(0, 0)
+        code = self.markets.index(market)
+        return slice(*np.searchsorted(self.market_codes, [code, code + 1]))
+
+    def contains(self, dates, markets):
+        """
+        Whether each (date, market) pair has a stored row
+
+        Args:
+            dates: Dates (anything pandas.to_datetime accepts)
+            markets: Market names, one per date
+
+        Returns:
+            Boolean array
+        """
+        days = pd.to_datetime(pd.Series(list(dates))).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        codes = pd.Categorical(list(markets), categories=self.markets).codes.astype(np.int64)
+        found = np.zeros(len(days), dtype=bool)
+        if not len(self):
+            return found
+        # Rows are sorted by market, then date, so the combined keys are sorted
+        stored = self.market_codes.astype(np.int64) * DAY_SPAN + self.days
+        keys = codes * DAY_SPAN + days
+        known = codes >= 0
+        position = np.searchsorted(stored, keys[known])
+        position = np.minimum(position, len(stored) - 1)
+        found[known] = stored[position] == keys[known]
+        return found
+
+    def to_frame(self, market=None):
+        """
+        Results as a DataFrame in the layout of the historical CSV
+
+        Result values are zero-padded strings (None where missing), as the ML
+        pipeline expects.
+        """
+        rows = self.market_rows(market) if market is not None else slice(None)
+        codes = self.market_codes[rows]
+        df = pd.DataFrame({
+            'Date': pd.to_datetime(self.dates[rows]),
+            'Market': pd.Categorical.from_codes(codes, categories=self.markets) if self.markets else [],
+        })
+        for name, width in DIGIT_WIDTHS.items():
+            values = pd.Series(getattr(self, name)[rows])
+            df[name.capitalize()] = values.astype(str).str.zfill(width).where(values != MISSING, None)
+        df['is_holiday'] = self.is_holiday[rows].astype(bool)
+        return df
+
+
+def _history_frame(history):
+    """A ResultsHistory in the stored column layout"""
+    return pd.DataFrame({
+        'date': history.dates,
+        'market': np.asarray(history.markets, dtype=object)[history.market_codes],
+        'open': history.open,
+        'jodi': history.jodi,
+        'close': history.close,
+        'is_holiday': history.is_holiday,
+    })
+
+
+def _merge(frames):
+    """Stored-layout frames combined, later rows replacing earlier ones with the same market and date"""
+    frame = pd.concat(frames, ignore_index=True)
+    return frame.drop_duplicates(subset=['market', 'date'], keep='last')
+
+
+def _read_table(path):
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def load_results_store(path=RESULTS_STORE_PATH):
+    """
+    Memory-map the columnar results history
+
+    Segments appended since the store was last written in full are merged in
+    memory; the store itself is mapped without copies.
+
+    Returns:
+        ResultsHistory, or None if the store has not been written yet
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        history = ResultsHistory(_read_table(path))
+        segments = segment_paths(path)
+        if not segments:
+            return history
+        frames = [_history_frame(history)]
+        frames += [_history_frame(ResultsHistory(_read_table(segment))) for segment in segments]
+        return ResultsHistory(_table(_merge(frames)))
+    except Exception as e:
+        logger.error(f"Error loading results store {path}: {e}")
+        return None
+
+
+def csv_store_path(csv_path):
+    """Path of the Arrow mirror of a history CSV"""
+    return f"{os.path.splitext(csv_path)[0]}.arrow"
+
+
+def _is_current(path, csv_path):
+    """Whether a store, with its segments, was written after the CSV last changed"""
+    if not os.path.exists(path):
+        return False
+    written = max(os.path.getmtime(p) for p in [path] + segment_paths(path))
+    return written >= os.path.getmtime(csv_path)
+
+
+def load_csv_history(csv_path):
+    """
+    Results of a history CSV, through an Arrow mirror kept next to it
+
+    The mirror is rebuilt whenever the CSV is newer, so the CSV is only parsed
+    once per change. Holiday flags are not mirrored.
+
+    Returns:
+        ResultsHistory, or None if the CSV is missing or unreadable
+    """
+    if not os.path.exists(csv_path):
+        return None
+    path = csv_store_path(csv_path)
+    try:
+        if not _is_current(path, csv_path):
+            df = pd.read_csv(csv_path, usecols=['Date', 'Market', 'Open', 'Jodi', 'Close'],
+                             dtype=str, keep_default_na=False)
+            write_results_store(df, path)
+    except Exception as e:
+        logger.error(f"Error mirroring history CSV {csv_path}: {e}")
+        return None
+    return load_results_store(path)
+
+
+def csv_has_results(csv_path, dates, markets):
+    """
+    Whether each (date, market) pair already has a row in a history CSV
+
+    Args:
+        csv_path: History CSV
+        dates: 'dd/mm/YYYY' strings or dates
+        markets: Market names
+
+    Returns:
+        Boolean array, all False if the CSV does not exist
+    """
+    dates = pd.Series(list(dates), dtype=object)
+    if len(dates) and isinstance(dates.iloc[0], str):
+        dates = pd.to_datetime(dates, format='%d/%m/%Y')
+    history = load_csv_history(csv_path)
+    if history is None:
+        if not os.path.exists(csv_path):
+            return np.zeros(len(dates), dtype=bool)
+        # Unreadable as a mirror: compare against the CSV's key columns
+        keys = pd.read_csv(csv_path, usecols=['Date', 'Market'], dtype=str)
+        existing = set(zip(pd.to_datetime(keys['Date'], format='%d/%m/%Y', errors='coerce'), keys['Market']))
+        return np.array([(pd.Timestamp(d), m) in existing for d, m in zip(dates, markets)], dtype=bool)
+    return history.contains(dates, markets)
+
+
+def append_csv_rows(csv_path, df):
+    """
+    Append rows to a history CSV without rewriting it, and to its Arrow mirror
+
+    Columns are written in the CSV's header order; columns the CSV does not have
+    are dropped and missing ones left empty. A missing CSV is created.
+    """
+    path = csv_store_path(csv_path)
+    mirrored = os.path.exists(csv_path) and _is_current(path, csv_path)
+    if os.path.exists(csv_path):
+        header = pd.read_csv(csv_path, nrows=0).columns
+        df.reindex(columns=header).to_csv(csv_path, mode='a', header=False, index=False)
+    else:
+        df.to_csv(csv_path, index=False)
+
+    # Only an up-to-date mirror is extended; a stale one is rebuilt on its next load
+    if mirrored:
+        try:
+            append_results_store(df, path)
+        except Exception as e:
+            logger.error(f"Error appending to the mirror of {csv_path}: {e}")
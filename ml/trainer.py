@@ -2,6 +2,8 @@ import os
 import pandas as pd
 import numpy as np
 import joblib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
@@ -10,6 +12,10 @@ import xgboost as xgb
 import logging
 from datetime import datetime
 from config import Config
+from ml.feature_engineering import FeaturePipeline
+from ml.feature_store import get_features, pair_rows, training_pairs
+from ml.model_registry import compact_path, current_bundle_path, load_bundle, save_bundle, set_current
+from ml.model_export import export_compact
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -19,13 +25,47 @@ logger = logging.getLogger(__name__)
 MODEL_DIR = "ml_models"
 os.makedirs(MODEL_DIR, exist_ok=True)
 
-def train_model(df, market):
+# Model parameters used when a market has no tuned config (see ml.tuning)
+DEFAULT_XGB_PARAMS = {
+    'n_estimators': 100,
+    'learning_rate': 0.1,
+    'max_depth': 5,
+    'random_state': 42
+}
+DEFAULT_RF_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'random_state': 42
+}
+
+# Boosting rounds added to the open/close models by each incremental update
+INCREMENTAL_ROUNDS = 10
+
+def build_features(df):
+    """
+    Build the numeric feature frame used by the market models
+    
+    Every row holds the features known at the end of that day; models are trained to
+    predict the next day's jodi digits from them.
+    
+    Args:
+        df: DataFrame with historical data (oldest first)
+    
+    Returns:
+        DataFrame with one numeric feature row per input row
+    """
+    return FeaturePipeline().fit(df).transform_frame(df)
+
+def train_model(df, market, n_jobs=None, cross=None):
     """
     Train ML models for a specific market with enhanced features
     
     Args:
         df: DataFrame with historical data
         market: Market name
+        n_jobs: Threads each model may use while fitting (library default if None)
+        cross: Optional CrossMarketMatrix of all markets; adds the other markets'
+            latest digits as features
     
     Returns:
         Dictionary with model paths and accuracy
@@ -47,121 +87,22 @@ def train_model(df, market):
     
     # Prepare features and targets
     try:
-        # Use all columns except 'is_holiday' as features
-        feature_columns = [col for col in recent_df.columns if col != 'is_holiday']
-        
-        # Prepare datasets for our specific targets
-        jodi_first_digits = []  # For open prediction
-        jodi_second_digits = [] # For close prediction
-        full_jodis = []         # For jodi prediction
-        
-        # Create enhanced feature dataframe
-        feature_df = recent_df[feature_columns].copy()
-        
-        # Fill NAs with appropriate values
-        for col in feature_df.columns:
-            if feature_df[col].dtype == np.float64 or feature_df[col].dtype == np.int64:
-                feature_df[col] = feature_df[col].fillna(0)
-            else:
-                feature_df[col] = feature_df[col].fillna('')
-                
-        # Extract jodi digits and patterns
-        for i in range(len(feature_df)):
-            if feature_df.iloc[i]['Jodi'] and not pd.isna(feature_df.iloc[i]['Jodi']):
-                jodi = str(feature_df.iloc[i]['Jodi']).zfill(2)
-                
-                # Extract first digit (for open) and second digit (for close)
-                jodi_first_digits.append(int(jodi[0]))
-                jodi_second_digits.append(int(jodi[1]))
-                full_jodis.append(jodi)
-        
-        # Create additional features for pattern analysis
-        
-        # 1. Add distance between consecutive jodis
-        feature_df['jodi_numeric'] = feature_df['Jodi'].apply(
-            lambda x: int(str(x).zfill(2)) if x and not pd.isna(x) else 0
-        )
-        feature_df['prev_jodi'] = feature_df['jodi_numeric'].shift(1)
-        feature_df['jodi_distance'] = abs(feature_df['jodi_numeric'] - feature_df['prev_jodi'])
-        
-        # 2. Add flip pattern detection
-        feature_df['jodi_first_digit'] = feature_df['Jodi'].apply(
-            lambda x: int(str(x).zfill(2)[0]) if x and not pd.isna(x) else 0
-        )
-        feature_df['jodi_second_digit'] = feature_df['Jodi'].apply(
-            lambda x: int(str(x).zfill(2)[1]) if x and not pd.isna(x) else 0
-        )
-        feature_df['prev_jodi_first'] = feature_df['jodi_first_digit'].shift(1)
-        feature_df['prev_jodi_second'] = feature_df['jodi_second_digit'].shift(1)
-        
-        # Check if current jodi is flipped compared to previous
-        feature_df['is_flip'] = (
-            (feature_df['jodi_first_digit'] == feature_df['prev_jodi_second']) & 
-            (feature_df['jodi_second_digit'] == feature_df['prev_jodi_first'])
-        ).astype(int)
-        
-        # 3. Add near-miss pattern detection
-        feature_df['near_miss_first'] = abs(feature_df['jodi_first_digit'] - feature_df['prev_jodi_first'])
-        feature_df['near_miss_second'] = abs(feature_df['jodi_second_digit'] - feature_df['prev_jodi_second'])
-        feature_df['is_near_miss'] = (
-            (feature_df['near_miss_first'] <= 1) & 
-            (feature_df['near_miss_second'] <= 1) &
-            ((feature_df['near_miss_first'] > 0) | (feature_df['near_miss_second'] > 0))  # Not exact match
-        ).astype(int)
-        
-        # 4. Add rolling statistics on jodi frequencies
-        for digit in range(10):
-            # Count occurrences of each digit in first position (rolling window)
-            feature_df[f'first_digit_{digit}_freq'] = feature_df['jodi_first_digit'].rolling(
-                window=7, min_periods=1
-            ).apply(lambda x: (x == digit).sum())
-            
-            # Count occurrences of each digit in second position (rolling window)
-            feature_df[f'second_digit_{digit}_freq'] = feature_df['jodi_second_digit'].rolling(
-                window=7, min_periods=1
-            ).apply(lambda x: (x == digit).sum())
-        
-        # 5. Add moving averages and trends
-        feature_df['jodi_7day_avg'] = feature_df['jodi_numeric'].rolling(window=7, min_periods=1).mean()
-        feature_df['jodi_7day_std'] = feature_df['jodi_numeric'].rolling(window=7, min_periods=1).std()
-        feature_df['jodi_trend'] = feature_df['jodi_numeric'].diff()
-        
-        # Fill NAs in derived features
-        for col in feature_df.columns:
-            if feature_df[col].dtype == np.float64 or feature_df[col].dtype == np.int64:
-                feature_df[col] = feature_df[col].fillna(0)
-                
-        # Convert categorical data to numeric
-        # For 'day_of_week' column, convert to one-hot encoding
-        if 'day_of_week' in feature_df.columns and feature_df['day_of_week'].dtype == object:
-            # Get unique values
-            days = feature_df['day_of_week'].unique()
-            for day in days:
-                feature_df[f'day_{day}'] = (feature_df['day_of_week'] == day).astype(int)
-            
-            # Drop original column
-            feature_df = feature_df.drop('day_of_week', axis=1)
-            
-        # Remove non-numeric columns that can't be used for training
-        non_numeric_cols = []
-        for col in feature_df.columns:
-            if feature_df[col].dtype == object:
-                non_numeric_cols.append(col)
-                
-        feature_df = feature_df.drop(non_numeric_cols, axis=1)
+        # Engineered features and per-row jodi targets, from the feature cache when
+        # these rows were seen before
+        pipeline = FeaturePipeline().fit(recent_df, cross)
+        feature_set = get_features(recent_df, market, pipeline, cross)
+        
+        # Features of day i paired with the jodi of day i + 1, for days followed by a jodi
+        X, Y = training_pairs(feature_set)
         
         # Ensure we have enough data for all targets
-        if len(jodi_first_digits) < 30 or len(jodi_second_digits) < 30 or len(full_jodis) < 30:
+        if len(Y) < 30:
             logger.warning(f"Not enough target data for {market}")
             return None
-            
-        # Prepare feature and target arrays
-        X = feature_df.iloc[:-1].values  # All rows except last (which has no next day)
         
-        # Use appropriate target arrays (offset by 1 to predict next day)
-        y_open = np.array(jodi_first_digits[1:])   # First digit of next day's jodi
-        y_close = np.array(jodi_second_digits[1:]) # Second digit of next day's jodi
-        y_jodi = np.array(full_jodis[1:])          # Full jodi of next day
+        y_open = Y[:, 0].astype(int)    # First digit of next day's jodi
+        y_close = Y[:, 1].astype(int)   # Second digit of next day's jodi
+        y_jodi = np.array([f"{jodi:02d}" for jodi in Y[:, 2]])  # Full jodi of next day
         
         # Split data
         X_train, X_test, y_open_train, y_open_test = train_test_split(X, y_open, test_size=0.2, random_state=42)
@@ -173,31 +114,23 @@ def train_model(df, market):
         X_train_scaled = scaler.fit_transform(X_train)
         X_test_scaled = scaler.transform(X_test)
         
+        # Model parameters: the defaults, overridden by the market's tuned config
+        from ml.tuning import load_best_params
+        tuned = load_best_params(market) or {}
+        xgb_params = {**DEFAULT_XGB_PARAMS, **tuned.get('xgb', {}), 'n_jobs': n_jobs}
+        rf_params = {**DEFAULT_RF_PARAMS, **tuned.get('rf', {}), 'n_jobs': n_jobs}
+        
         # Use XGBoost for better performance
         # Train open model (classification)
-        open_model = xgb.XGBClassifier(
-            n_estimators=100, 
-            learning_rate=0.1,
-            max_depth=5,
-            random_state=42
-        )
+        open_model = xgb.XGBClassifier(**xgb_params)
         open_model.fit(X_train_scaled, y_open_train)
         
         # Train close model (classification)
-        close_model = xgb.XGBClassifier(
-            n_estimators=100, 
-            learning_rate=0.1,
-            max_depth=5,
-            random_state=42
-        )
+        close_model = xgb.XGBClassifier(**xgb_params)
         close_model.fit(X_train_scaled, y_close_train)
         
         # Train jodi model (classification)
-        jodi_model = RandomForestClassifier(
-            n_estimators=100, 
-            max_depth=10,
-            random_state=42
-        )
+        jodi_model = RandomForestClassifier(**rf_params)
         jodi_model.fit(X_train_scaled, y_jodi_train)
         
         # Evaluate models
@@ -205,41 +138,25 @@ def train_model(df, market):
         close_accuracy = accuracy_score(y_close_test, close_model.predict(X_test_scaled))
         jodi_accuracy = accuracy_score(y_jodi_test, jodi_model.predict(X_test_scaled))
         
-        # Save models
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        open_model_path = os.path.join(MODEL_DIR, f"{market}_open_{timestamp}.pkl")
-        close_model_path = os.path.join(MODEL_DIR, f"{market}_close_{timestamp}.pkl")
-        jodi_model_path = os.path.join(MODEL_DIR, f"{market}_jodi_{timestamp}.pkl")
-        scaler_path = os.path.join(MODEL_DIR, f"{market}_scaler_{timestamp}.pkl")
-        
-        # Also save feature columns for future prediction
-        feature_columns_path = os.path.join(MODEL_DIR, f"{market}_feature_columns_{timestamp}.pkl")
-        
-        joblib.dump(open_model, open_model_path)
-        joblib.dump(close_model, close_model_path)
-        joblib.dump(jodi_model, jodi_model_path)
-        joblib.dump(scaler, scaler_path)
-        joblib.dump(feature_df.columns.tolist(), feature_columns_path)
-        
-        # Save model info
+        # Save all models of this run as one versioned bundle
         model_info = {
             'market': market,
-            'open_model_path': open_model_path,
-            'close_model_path': close_model_path,
-            'jodi_model_path': jodi_model_path,
-            'scaler_path': scaler_path,
-            'feature_columns_path': feature_columns_path,
-            'open_accuracy': open_accuracy,
-            'close_accuracy': close_accuracy,
-            'jodi_accuracy': jodi_accuracy,
-            'timestamp': timestamp,
-            'data_size': len(recent_df)
+            'open_accuracy': float(open_accuracy),
+            'close_accuracy': float(close_accuracy),
+            'jodi_accuracy': float(jodi_accuracy),
+            'data_size': len(recent_df),
+            'last_date': _day(recent_df['Date'].iloc[-1]).date().isoformat(),
+            'incremental_updates': 0
         }
-        
-        # Save model info
-        model_info_path = os.path.join(MODEL_DIR, f"{market}_model_info_{timestamp}.pkl")
-        joblib.dump(model_info, model_info_path)
+        model_info = _save_run(market, {
+            'open_model': open_model,
+            'close_model': close_model,
+            'jodi_model': jodi_model,
+            'scaler': scaler,
+            'feature_columns': feature_set.columns,
+            'feature_pipeline': pipeline,
+            'info': model_info
+        })
         
         logger.info(f"Models for {market} saved. Open accuracy: {open_accuracy:.2f}, Close accuracy: {close_accuracy:.2f}, Jodi accuracy: {jodi_accuracy:.2f}")
         
@@ -249,4 +166,226 @@ def train_model(df, market):
         logger.error(f"Error training model for {market}: {e}")
         import traceback
         traceback.print_exc()
-        return None
\ No newline at end of file
+        return None
+
+def _day(value):
+    """Timestamp of a 'dd/mm/YYYY' string, ISO date string, date or datetime64 value"""
+    if isinstance(value, str) and '/' in value:
+        return pd.to_datetime(value, format='%d/%m/%Y')
+    return pd.Timestamp(value)
+
+def _registered_info(model_info, version, path):
+    """
+    Model info returned to callers for a stored bundle
+    
+    Every model of the run lives in the same bundle, so all model paths point to it.
+    """
+    model_info = dict(model_info)
+    model_info.update({
+        'version': version,
+        'timestamp': version,
+        'bundle_path': path,
+        'open_model_path': path,
+        'close_model_path': path,
+        'jodi_model_path': path
+    })
+    return model_info
+
+def export_models(market, version, objects):
+    """
+    Write the compact export of a stored bundle next to it
+    
+    The export (native UBJ boosters, flattened RandomForest node arrays, scaler
+    vectors) is what inference loads; the joblib bundle stays the full record.
+    
+    Returns:
+        Path of the export, or None if it could not be written
+    """
+    try:
+        return export_compact(compact_path(market, version), objects)
+    except Exception as e:
+        logger.error(f"Error exporting compact models for {market}: {e}")
+        return None
+
+def _save_run(market, objects):
+    """Store a training run in the model registry, export it and describe it"""
+    version, path = save_bundle(market, objects, make_current=False)
+    export_models(market, version, objects)
+    set_current(market, version)
+    return _registered_info(objects['info'], version, path)
+
+def _continue_boosting(model, X, y, n_jobs=None):
+    """
+    Add INCREMENTAL_ROUNDS trees to a fitted XGBClassifier using only new rows
+    
+    Args:
+        model: Fitted XGBClassifier
+        X: Scaled feature rows
+        y: Class labels (rows with labels the model has never seen are skipped)
+        n_jobs: Threads used while boosting
+    
+    Returns:
+        The same classifier with the extended booster
+    """
+    known = y < model.n_classes_
+    params = model.get_xgb_params()
+    if model.n_classes_ > 2:
+        params['num_class'] = model.n_classes_
+    if n_jobs is not None:
+        params['n_jobs'] = n_jobs
+    
+    booster = xgb.train(
+        params,
+        xgb.DMatrix(X[known], label=y[known]),
+        num_boost_round=INCREMENTAL_ROUNDS,
+        xgb_model=model.get_booster()
+    )
+    model._Booster = booster
+    model.set_params(n_estimators=booster.num_boosted_rounds())
+    return model
+
+def update_model(df, market, n_jobs=None, cross=None):
+    """
+    Incrementally update a market's open/close models with results added since
+    they were trained
+    
+    The saved XGBoost boosters keep boosting on the new rows only; the scaler,
+    feature columns and jodi RandomForest are reused as they are. Falls back to a
+    full `train_model` when there is no usable previous run or the previous run has
+    already had Config.MAX_INCREMENTAL_UPDATES updates.
+    
+    Args:
+        df: DataFrame with historical data (oldest first)
+        market: Market name
+        n_jobs: Threads each model may use while fitting
+        cross: CrossMarketMatrix of all markets, for models trained with one
+    
+    Returns:
+        Dictionary with model paths and accuracy, or None if there was nothing new
+    """
+    path = current_bundle_path(market)
+    base = load_bundle(path) if path else None
+    info = base['info'] if base else None
+    if not info or 'last_date' not in info:
+        logger.info(f"No incremental base for {market}, running full training")
+        return train_model(df, market, n_jobs, cross)
+    if info.get('incremental_updates', 0) >= Config.MAX_INCREMENTAL_UPDATES:
+        logger.info(f"{market} reached {Config.MAX_INCREMENTAL_UPDATES} incremental updates, running full training")
+        return train_model(df, market, n_jobs, cross)
+    
+    try:
+        recent_df = df.tail(Config.TRAINING_DAYS).reset_index(drop=True)
+        dates = recent_df['Date'].map(_day)
+        last_date = _day(info['last_date'])
+        
+        if dates.iloc[-1] <= last_date:
+            logger.info(f"No new results for {market} since {info['last_date']}")
+            return None
+        trained_rows = np.flatnonzero((dates == last_date).to_numpy())
+        if len(trained_rows) == 0:
+            logger.info(f"Last trained day of {market} left the window, running full training")
+            return train_model(df, market, n_jobs, cross)
+        
+        # New training pairs: features of day i -> jodi of day i + 1, starting with
+        # the last day the models were trained on
+        # Runs saved before the feature pipeline was bundled only have column names,
+        # which the pipeline's features are aligned to
+        pipeline = base.get('feature_pipeline') or FeaturePipeline().fit(recent_df)
+        feature_set = get_features(recent_df, market, pipeline, cross)
+        features = feature_set.to_frame().reindex(columns=base['feature_columns'], fill_value=0).to_numpy()
+        rows = pair_rows(feature_set, trained_rows[-1])
+        if len(rows) == 0:
+            logger.info(f"No new jodis for {market} since {info['last_date']}")
+            return None
+        
+        X_new = base['scaler'].transform(features[rows])
+        y_open = feature_set.targets[rows + 1, 0].astype(int)
+        y_close = feature_set.targets[rows + 1, 1].astype(int)
+        
+        open_model = _continue_boosting(base['open_model'], X_new, y_open, n_jobs)
+        close_model = _continue_boosting(base['close_model'], X_new, y_close, n_jobs)
+        
+        # Save the updated models as a new version; the rest of the run is shared
+        model_info = dict(info)
+        model_info.update({
+            'data_size': len(recent_df),
+            'last_date': _day(recent_df['Date'].iloc[-1]).date().isoformat(),
+            'incremental_updates': info.get('incremental_updates', 0) + 1
+        })
+        model_info = _save_run(market, {
+            'open_model': open_model,
+            'close_model': close_model,
+            'jodi_model': base['jodi_model'],
+            'scaler': base['scaler'],
+            'feature_columns': base['feature_columns'],
+            'feature_pipeline': base.get('feature_pipeline'),
+            'info': model_info
+        })
+        
+        logger.info(f"Models for {market} updated with {len(rows)} new rows (update {model_info['incremental_updates']})")
+        
+        return model_info
+    
+    except Exception as e:
+        logger.error(f"Error updating model for {market}: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def plan_cpu_budget(n_markets, cpu_budget=None):
+    """
+    Split a CPU budget between parallel market jobs and per-model threads
+    
+    Args:
+        n_markets: Number of markets to train
+        cpu_budget: Total cores available (defaults to Config.TRAINING_CPU_BUDGET)
+    
+    Returns:
+        Tuple (workers, threads): worker processes and `n_jobs` per model
+    """
+    cpu_budget = max(1, cpu_budget or Config.TRAINING_CPU_BUDGET)
+    workers = max(1, min(n_markets, cpu_budget))
+    threads = max(1, cpu_budget // workers)
+    return workers, threads
+
+def _train_model_args(args):
+    """Process pool entry point for `train_model` and `update_model`"""
+    market, df, n_jobs, incremental, cross = args
+    if incremental:
+        return market, update_model(df, market, n_jobs, cross)
+    return market, train_model(df, market, n_jobs, cross)
+
+def train_models_parallel(market_frames, cpu_budget=None, incremental=False, cross=None):
+    """
+    Train several markets at once within a global CPU budget
+    
+    Markets are independent, so each one is trained in its own worker process and
+    the cores left over per worker go to the models' own thread pools.
+    
+    Args:
+        market_frames: Dictionary of market name -> training DataFrame
+        cpu_budget: Total cores available (defaults to Config.TRAINING_CPU_BUDGET)
+        incremental: Update the existing models (`update_model`) instead of
+            training from scratch
+        cross: Optional CrossMarketMatrix built once from all markets' results and
+            shared by every market's pipeline
+    
+    Returns:
+        Dictionary of market name -> model info for the markets that trained
+    """
+    if not market_frames:
+        return {}
+    
+    workers, threads = plan_cpu_budget(len(market_frames), cpu_budget)
+    jobs = [(market, df, threads, incremental, cross) for market, df in market_frames.items()]
+    logger.info(f"Training {len(jobs)} markets with {workers} workers x {threads} threads")
+    
+    if workers == 1:
+        results = map(_train_model_args, jobs)
+        return {market: info for market, info in results if info}
+    
+    # Spawned workers avoid inheriting OpenMP thread pools and DB connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        results = list(executor.map(_train_model_args, jobs))
+    return {market: info for market, info in results if info}
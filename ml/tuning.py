@@ -0,0 +1,258 @@
+import os
+import json
+import logging
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import xgboost as xgb
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from config import Config
+from ml.feature_engineering import FeaturePipeline
+from ml.feature_store import get_features, training_pairs
+from ml.trainer import DEFAULT_RF_PARAMS, DEFAULT_XGB_PARAMS, plan_cpu_budget
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Path to save the best configuration per market
+TUNING_DIR = os.path.join("ml_models", "tuning")
+os.makedirs(TUNING_DIR, exist_ok=True)
+
+# Candidate values sampled for the open/close XGBoost models and the jodi RandomForest
+XGB_SEARCH_SPACE = {
+    'n_estimators': [50, 100, 200, 400],
+    'learning_rate': [0.03, 0.05, 0.1, 0.2],
+    'max_depth': [2, 3, 4, 5, 6, 8],
+    'min_child_weight': [1, 3, 5],
+    'subsample': [0.6, 0.8, 1.0],
+    'colsample_bytree': [0.5, 0.8, 1.0],
+}
+RF_SEARCH_SPACE = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [4, 6, 8, 10, 14, None],
+    'min_samples_leaf': [1, 2, 4, 8],
+    'max_features': ['sqrt', 'log2', 0.5],
+}
+
+# Successive halving: NUM_CONFIGS sampled configs are scored on 1 walk-forward fold,
+# the best 1/HALVING_ETA move on to HALVING_ETA times as many folds, and so on up to
+# NUM_FOLDS folds
+NUM_CONFIGS = 27
+HALVING_ETA = 3
+NUM_FOLDS = 9
+
+# Result rows predicted by each walk-forward fold
+FOLD_TEST_DAYS = 7
+
+# Probability assigned to classes a fold's model never saw, when scoring
+MIN_PROBABILITY = 1e-3
+
+
+def walk_forward_folds(n_rows, n_folds=NUM_FOLDS, test_size=FOLD_TEST_DAYS, train_size=Config.TRAINING_DAYS):
+    """
+    Time-ordered train/test splits, newest first
+
+    Every fold trains on the `train_size` rows just before its test block, as
+    `train_model` does on the latest window, and never sees later rows.
+
+    Returns:
+        List of (train_indices, test_indices) tuples
+    """
+    folds = []
+    for fold in range(n_folds):
+        test_end = n_rows - fold * test_size
+        test_start = test_end - test_size
+        train_start = max(0, test_start - train_size)
+        if test_start - train_start < 30:
+            break
+        folds.append((np.arange(train_start, test_start), np.arange(test_start, test_end)))
+    return folds
+
+
+def sample_configs(space, n, rng):
+    """Draw n different configurations from a search space"""
+    configs, seen = [], set()
+    for _ in range(n * 20):
+        config = {name: values[rng.integers(len(values))] for name, values in space.items()}
+        config = {name: (value.item() if isinstance(value, np.generic) else value) for name, value in config.items()}
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+        if len(configs) == n:
+            break
+    return configs
+
+
+def _log_likelihood(model, classes, X, y):
+    """Mean log-probability the model gives the true classes of `y`"""
+    probabilities = model.predict_proba(X)
+    position = {c: i for i, c in enumerate(classes)}
+    true_prob = np.array([
+        probabilities[row, position[label]] if label in position else 0.0
+        for row, label in enumerate(y)
+    ])
+    return float(np.log(np.maximum(true_prob, MIN_PROBABILITY)).mean())
+
+
+def _score_fold(kind, params, X, Y, train, test, n_jobs):
+    """Score one configuration on one walk-forward fold"""
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X[train])
+    X_test = scaler.transform(X[test])
+
+    if kind == 'rf':
+        model = RandomForestClassifier(**{**DEFAULT_RF_PARAMS, **params, 'n_jobs': n_jobs})
+        model.fit(X_train, Y[train, 2])
+        return _log_likelihood(model, model.classes_, X_test, Y[test, 2])
+
+    # The open and close models share one XGBoost configuration
+    scores = []
+    for column in (0, 1):
+        classes, y_train = np.unique(Y[train, column], return_inverse=True)
+        if len(classes) < 2:
+            scores.append(float(np.log(np.where(Y[test, column] == classes[0], 1.0, MIN_PROBABILITY)).mean()))
+            continue
+        model = xgb.XGBClassifier(**{**DEFAULT_XGB_PARAMS, **params, 'n_jobs': n_jobs})
+        model.fit(X_train, y_train)
+        scores.append(_log_likelihood(model, classes, X_test, Y[test, column]))
+    return float(np.mean(scores))
+
+
+def _score_config(args):
+    """Process pool entry point: mean score of one configuration over some folds"""
+    kind, params, X, Y, folds, n_jobs = args
+    return float(np.mean([_score_fold(kind, params, X, Y, train, test, n_jobs) for train, test in folds]))
+
+
+def successive_halving(kind, space, X, Y, folds, executor, n_jobs, rng, n_configs=NUM_CONFIGS):
+    """
+    Successive-halving search over one model's search space
+
+    Returns:
+        Tuple (best_params, best_score, n_folds_scored)
+    """
+    candidates = sample_configs(space, n_configs, rng)
+    n_folds = 1
+    while True:
+        rung_folds = folds[:n_folds]
+        jobs = [(kind, params, X, Y, rung_folds, n_jobs) for params in candidates]
+        scores = list(executor.map(_score_config, jobs))
+        ranked = [candidates[i] for i in np.argsort(scores)[::-1]]
+        logger.info(f"{kind}: scored {len(candidates)} configs on {len(rung_folds)} folds, best {max(scores):.4f}")
+
+        if len(candidates) == 1 or n_folds >= len(folds):
+            return ranked[0], float(max(scores)), len(rung_folds)
+        candidates = ranked[:max(1, len(candidates) // HALVING_ETA)]
+        n_folds = min(len(folds), n_folds * HALVING_ETA)
+
+
+def tune_market(df, market, executor, n_jobs=1, seed=42, cross=None):
+    """
+    Tune the open/close XGBoost and jodi RandomForest configurations of one market
+
+    Features come from the feature cache, so every configuration and fold reuses
+    the same matrix.
+
+    Args:
+        df: DataFrame with historical data (oldest first), longer than the
+            training window so there is room for walk-forward folds
+        market: Market name
+        executor: Process pool the configurations are scored in
+        n_jobs: Threads each model may use while fitting
+        seed: Seed of the configuration sampler
+        cross: Optional CrossMarketMatrix, as passed to `train_model`
+
+    Returns:
+        Dictionary with the best 'xgb' and 'rf' parameters and their scores, or None
+        if there is not enough history for a fold
+    """
+    X, Y = training_pairs(get_features(df, market, FeaturePipeline().fit(df, cross), cross))
+    folds = walk_forward_folds(len(X))
+    if not folds:
+        logger.warning(f"Not enough history to tune {market}")
+        return None
+
+    rng = np.random.default_rng(seed)
+    xgb_params, xgb_score, xgb_folds = successive_halving('xgb', XGB_SEARCH_SPACE, X, Y, folds, executor, n_jobs, rng)
+    rf_params, rf_score, rf_folds = successive_halving('rf', RF_SEARCH_SPACE, X, Y, folds, executor, n_jobs, rng)
+
+    best = {
+        'market': market,
+        'xgb': xgb_params,
+        'xgb_score': xgb_score,
+        'rf': rf_params,
+        'rf_score': rf_score,
+        'folds': max(xgb_folds, rf_folds),
+        'rows': len(X),
+        'tuned_at': datetime.utcnow().isoformat()
+    }
+    save_best_params(market, best)
+    return best
+
+
+def tune_markets(market_frames, cpu_budget=None, cross=None):
+    """
+    Tune every market within a global CPU budget
+
+    Configurations of a rung are scored in parallel worker processes; the cores
+    left per worker go to the models' own threads.
+
+    Args:
+        market_frames: Dictionary of market name -> history DataFrame
+        cpu_budget: Total cores available (defaults to Config.TRAINING_CPU_BUDGET)
+        cross: Optional CrossMarketMatrix shared by every market
+
+    Returns:
+        Dictionary of market name -> best configuration
+    """
+    workers, threads = plan_cpu_budget(NUM_CONFIGS, cpu_budget)
+    logger.info(f"Tuning {len(market_frames)} markets with {workers} workers x {threads} threads")
+
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for market, df in market_frames.items():
+            try:
+                best = tune_market(df, market, executor, threads, cross=cross)
+                if best:
+                    results[market] = best
+            except Exception as e:
+                logger.error(f"Error tuning {market}: {e}")
+    return results
+
+
+def tuning_path(market):
+    """Path of a market's best configuration"""
+    return os.path.join(TUNING_DIR, f"{market}.json")
+
+
+def save_best_params(market, best):
+    path = tuning_path(market)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(best, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_best_params(market):
+    """
+    Best configuration found for a market
+
+    Returns:
+        Dictionary with 'xgb' and 'rf' parameter dictionaries, or None if the market
+        was never tuned
+    """
+    path = tuning_path(market)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading tuned parameters for {market}: {e}")
+        return None
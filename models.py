@@ -92,11 +92,34 @@ class Result(db.Model):
     reverse_jodi = db.Column(db.String(10), nullable=True)
     is_holiday = db.Column(db.Boolean, default=False)
     prev_jodi_distance = db.Column(db.Float, nullable=True)
+    # Integer forms of the result, set by utils.calculate_derived_fields
+    open_panel = db.Column(db.SmallInteger, nullable=True)   # 0-999
+    open_ank = db.Column(db.SmallInteger, nullable=True)     # 0-9
+    jodi_num = db.Column(db.SmallInteger, nullable=True)     # 0-99
+    close_ank = db.Column(db.SmallInteger, nullable=True)    # 0-9
+    close_panel = db.Column(db.SmallInteger, nullable=True)  # 0-999
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
     __table_args__ = (
         db.UniqueConstraint('date', 'market', name='unique_date_market'),
+        db.Index('idx_result_market_jodi_num', 'market', 'jodi_num'),
+    )
+
+
+class MarketStat(db.Model):
+    """One cell of the per-market result statistics (see services.stats_service)"""
+    __tablename__ = 'market_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    market = db.Column(db.String(50), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)     # jodi, open_ank, close_ank, weekday, transition, total
+    period = db.Column(db.Integer, nullable=False)      # 0 for all time, else YYYYMM
+    value = db.Column(db.SmallInteger, nullable=False)  # jodi number, ank, weekday or prev*100+jodi
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('idx_market_stat_cell', 'market', 'kind', 'period', 'value', unique=True),
     )
 
 
@@ -111,6 +134,7 @@ class Prediction(db.Model):
     jodi_list = db.Column(db.JSON, nullable=True)     # List of 10 jodis
     patti_list = db.Column(db.JSON, nullable=True)    # List of 4 pattis
     confidence_score = db.Column(db.Float, nullable=True)
+    probabilities = db.Column(db.LargeBinary, nullable=True)  # float16 jodi/open/close probability vectors
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     
     __table_args__ = (
@@ -6,7 +6,9 @@ import os
 import traceback
 from app import app, db
 from models import Result, Prediction
-from utils import calculate_derived_fields
+from utils import calculate_derived_fields, calculate_digit_fields
+from services.data_service import load_market_history, sync_results_store, upsert_rows
+from ml.results_store import append_csv_rows, csv_has_results
 from ml.predictor import generate_predictions, calculate_confidence_score
 
 # Market URLs
@@ -114,21 +116,13 @@ def update_csv(results):
         print("No results to add to CSV")
         return
     
-    # Load existing CSV
-    if os.path.exists(CSV_FILE):
-        df = pd.read_csv(CSV_FILE)
-        print(f"Loaded existing CSV with {len(df)} rows")
-    else:
-        df = pd.DataFrame(columns=['Date', 'Market', 'Open', 'Jodi', 'Close'])
-        print("Created new CSV file")
-    
-    # Get existing date-market combinations
-    existing = set(zip(df['Date'], df['Market']))
+    # Look up the existing date-market combinations in the CSV's columnar mirror
+    existing = csv_has_results(CSV_FILE, [r['Date'] for r in results], [r['Market'] for r in results])
     
     # Filter out existing records
     new_results = []
-    for result in results:
-        if (result['Date'], result['Market']) not in existing:
+    for result, exists in zip(results, existing):
+        if not exists:
             derived_fields = calculate_derived_fields(result)
             result.update(derived_fields)
             new_results.append(result)
@@ -137,12 +131,8 @@ def update_csv(results):
         print("All results already exist in CSV")
         return
     
-    # Add new results to dataframe
-    new_df = pd.DataFrame(new_results)
-    updated_df = pd.concat([df, new_df], ignore_index=True)
-    
-    # Save updated CSV
-    updated_df.to_csv(CSV_FILE, index=False)
+    # Append new results to the CSV
+    append_csv_rows(CSV_FILE, pd.DataFrame(new_results))
     print(f"Added {len(new_results)} new results to CSV")
 
 def update_database(results):
@@ -151,7 +141,7 @@ def update_database(results):
         print("No results to add to database")
         return 0
     
-    count = 0
+    rows = []
     for result in results:
         try:
             # Parse date
@@ -163,51 +153,41 @@ def update_database(results):
                 derived_fields = calculate_derived_fields(result)
                 result.update(derived_fields)
             
-            # Check if result exists
-            existing = Result.query.filter_by(date=date_obj, market=result['Market']).first()
+            row = {
+                'date': date_obj,
+                'market': result['Market'],
+                'open': result['Open'],
+                'jodi': result['Jodi'],
+                'close': result['Close'],
+                'day_of_week': result['day_of_week'],
+                'is_weekend': bool(result['is_weekend']),
+                'is_holiday': bool(result['is_holiday']) if 'is_holiday' in result else False
+            }
             
-            if existing:
-                # Update existing result
-                existing.open = result['Open']
-                existing.jodi = result['Jodi']
-                existing.close = result['Close']
-                
-                # Update derived fields
-                for field in ['open_sum', 'close_sum', 'mirror_open', 'mirror_close', 'reverse_jodi']:
-                    if field in result:
-                        setattr(existing, field, result[field])
-                
-                print(f"Updated existing result: {result['Market']} on {result['Date']}")
-            else:
-                # Create new result
-                new_result = Result(
-                    date=date_obj,
-                    market=result['Market'],
-                    open=result['Open'],
-                    jodi=result['Jodi'],
-                    close=result['Close'],
-                    day_of_week=result['day_of_week'],
-                    is_weekend=bool(result['is_weekend']),
-                    is_holiday=bool(result['is_holiday']) if 'is_holiday' in result else False
-                )
-                
-                # Add derived fields
-                for field in ['open_sum', 'close_sum', 'mirror_open', 'mirror_close', 'reverse_jodi']:
-                    if field in result:
-                        setattr(new_result, field, result[field])
-                
-                db.session.add(new_result)
-                print(f"Added new result: {result['Market']} on {result['Date']}")
+            # Add derived fields
+            for field in ['open_sum', 'close_sum', 'mirror_open', 'mirror_close', 'reverse_jodi']:
+                if field in result:
+                    row[field] = result[field]
+            row.update(calculate_digit_fields(row))
             
-            db.session.commit()
-            count += 1
+            rows.append(row)
         except Exception as e:
-            print(f"Error updating database: {e}")
-            db.session.rollback()
+            print(f"Error preparing result: {e}")
+    
+    # Insert new results and update existing ones in one statement per batch
+    try:
+        count = upsert_rows(Result, rows)
+        db.session.commit()
+        sync_results_store(rows)
+    except Exception as e:
+        print(f"Error updating database: {e}")
+        db.session.rollback()
+        count = 0
     
     print(f"Updated {count} records in database")
     return count
 
+
 def generate_predictions():
     """Generate predictions for next day after latest results"""
     print("Generating predictions...")
@@ -234,31 +214,8 @@ def generate_predictions():
                 print(f"Prediction already exists for {market} on {prediction_date}")
                 continue
             
-            # Get all results for this market
-            results = Result.query.filter_by(market=market).all()
-            
-            # Convert to dataframe
-            data = []
-            for r in results:
-                row = {
-                    'Date': r.date.strftime('%d/%m/%Y'),
-                    'Market': r.market,
-                    'Open': r.open,
-                    'Jodi': r.jodi,
-                    'Close': r.close,
-                    'day_of_week': r.day_of_week,
-                    'is_weekend': r.is_weekend,
-                    'open_sum': r.open_sum,
-                    'close_sum': r.close_sum,
-                    'mirror_open': r.mirror_open,
-                    'mirror_close': r.mirror_close,
-                    'reverse_jodi': r.reverse_jodi,
-                    'is_holiday': r.is_holiday,
-                    'prev_jodi_distance': r.prev_jodi_distance
-                }
-                data.append(row)
-            
-            df = pd.DataFrame(data)
+            # Get all results for this market from the results mirror
+            df = load_market_history(market)
             
             # Generate prediction
             print(f"Generating prediction for {market} on {prediction_date}")
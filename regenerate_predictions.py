@@ -13,7 +13,7 @@ from sqlalchemy import text
 
 from app import app, db
 from models import Prediction, Result
-from ml.predictor import generate_predictions, calculate_confidence_score
+from ml.predictor import generate_predictions, calculate_confidence_score, pack_probabilities
 from config import Config
 
 def regenerate_predictions_for_all_markets():
@@ -29,17 +29,6 @@ def regenerate_predictions_for_all_markets():
     for market in markets:
         print(f"Processing market: {market}")
         
-        # First check if we already have predictions for tomorrow
-        existing_prediction = Prediction.query.filter_by(
-            date=tomorrow,
-            market=market
-        ).first()
-        
-        if existing_prediction:
-            print(f"Deleting existing prediction for {market} on {tomorrow}")
-            db.session.delete(existing_prediction)
-            db.session.commit()
-        
         # Get market results for training - use all 60 days data as requested
         results = Result.query.filter_by(market=market).order_by(Result.date.desc()).limit(Config.TRAINING_DAYS).all()
         
@@ -69,9 +58,27 @@ def regenerate_predictions_for_all_markets():
         
         results_df = pd.DataFrame(data)
         
-        # Generate new predictions
-        prediction_data = generate_predictions(results_df, market)
-        confidence_score = float(calculate_confidence_score(market, results_df))
+        # Generate new predictions (deterministic for the same market, date and data)
+        prediction_data = generate_predictions(results_df, market, tomorrow)
+        confidence_score = float(calculate_confidence_score(market, results_df, tomorrow))
+        
+        # Check if we already have predictions for tomorrow
+        existing_prediction = Prediction.query.filter_by(
+            date=tomorrow,
+            market=market
+        ).first()
+        
+        if existing_prediction:
+            if (existing_prediction.open_digits == prediction_data['open_digits'] and
+                    existing_prediction.close_digits == prediction_data['close_digits'] and
+                    existing_prediction.jodi_list == prediction_data['jodi_list'] and
+                    existing_prediction.patti_list == prediction_data['patti_list']):
+                print(f"Prediction for {market} on {tomorrow} is unchanged, skipping")
+                continue
+            
+            print(f"Deleting existing prediction for {market} on {tomorrow}")
+            db.session.delete(existing_prediction)
+            db.session.commit()
         
         # Create new prediction
         # Convert all NumPy/Pandas values to native Python types
@@ -83,6 +90,7 @@ def regenerate_predictions_for_all_markets():
         new_prediction.jodi_list = [str(j) for j in prediction_data['jodi_list']]
         new_prediction.patti_list = [str(p) for p in prediction_data['patti_list']]
         new_prediction.confidence_score = float(confidence_score)
+        new_prediction.probabilities = pack_probabilities(prediction_data)
         
         db.session.add(new_prediction)
         db.session.commit()
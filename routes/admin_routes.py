@@ -5,7 +5,9 @@ import datetime
 from app import db
 from models import User, Result, Prediction, Subscription, ForumPost
 from services.data_service import get_dashboard_stats, import_csv_data
-from services.prediction_service import train_models_for_all_markets, get_prediction_accuracy
+from services.prediction_service import (
+    train_models_for_all_markets, get_prediction_accuracy, generate_predictions_batch
+)
 from services.firebase_service import verify_firebase_token, initialize_firebase
 from config import Config
 import firebase_admin
@@ -232,8 +234,9 @@ def import_csv():
 
         try:
             # Import data
-            import_csv_data(file_path)
-            flash('Data imported successfully', 'success')
+            stats = import_csv_data(file_path)
+            flash(f"Data imported successfully: {stats['inserted']} new results, "
+                  f"{stats['existing']} already present", 'success')
         except Exception as e:
             flash(f'Import failed: {str(e)}', 'danger')
 
@@ -340,6 +343,7 @@ def edit_result():
 
         result.updated_at = datetime.datetime.now()
 
+        # The flush also refreshes the digit columns and the market statistics
         db.session.commit()
         flash('Result updated successfully', 'success')
     except Exception as e:
@@ -439,10 +443,8 @@ def import_results():
 def generate_predictions():
     """Generate predictions for all markets"""
     try:
-        # Run the generate_predictions.py script
-        from generate_predictions import main as gen_predictions
-        gen_predictions()
-        flash('Predictions generated successfully', 'success')
+        predictions = generate_predictions_batch()
+        flash(f'Predictions generated successfully for {len(predictions)} markets', 'success')
     except Exception as e:
         flash(f'Generation failed: {str(e)}', 'danger')
 
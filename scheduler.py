@@ -9,8 +9,12 @@ from flask import current_app
 
 from models import User, Result, Prediction
 from services.notification_service import send_trial_expiry_notification, send_prediction_match_notification
-from services.prediction_service import update_predictions_for_market, train_models_for_all_markets
+from services.prediction_service import (
+    update_predictions_for_market, train_models_for_all_markets, generate_predictions_batch,
+    tune_models_for_all_markets, evaluate_models_for_all_markets, refresh_market_states
+)
 from services.data_service import import_csv_data
+from ml.predictor import prune_prediction_cache
 from config import Config
 from utils import is_matching_prediction, get_ist_now, get_ist_date
 
@@ -48,6 +52,14 @@ def setup_scheduler(scheduler):
         replace_existing=True
     )
     
+    # Tune model hyperparameters overnight before the weekly training run
+    scheduler.add_job(
+        tune_ml_models,
+        CronTrigger(day_of_week='sat', hour=22, minute=0, timezone=ist_timezone),
+        id='tune_ml_models_weekly',
+        replace_existing=True
+    )
+    
     # Add continuous monitoring jobs for each market
     for market_name, market_config in Config.MARKETS.items():
         # Get market timing
@@ -109,6 +121,14 @@ def setup_scheduler(scheduler):
     
     # We've already set up ML model training on Sundays at 1:00 AM IST above
     
+    # Score the freshly trained models on their latest results
+    scheduler.add_job(
+        evaluate_ml_models,
+        CronTrigger(day_of_week='sun', hour=4, minute=0, timezone=ist_timezone),
+        id='evaluate_ml_models_weekly',
+        replace_existing=True
+    )
+    
     # Send trial expiry notifications daily at 10 AM
     scheduler.add_job(
         send_trial_expiry_notifications,
@@ -125,6 +145,14 @@ def setup_scheduler(scheduler):
         replace_existing=True
     )
     
+    # Bound the prediction cache daily
+    scheduler.add_job(
+        prune_prediction_cache_job,
+        CronTrigger(hour=3, minute=0),
+        id='prune_prediction_cache',
+        replace_existing=True
+    )
+    
     logger.info("Scheduler initialized with all jobs")
 
 
@@ -214,12 +242,14 @@ def import_results():
             except Exception as e:
                 logger.error(f"Error removing PID file {pid_file}: {str(e)}")
             
-        # After importing results, update predictions for markets that have new results
+        # After importing results, push them into the predictor states and update
+        # predictions for markets that have new results
         # Use app context to avoid Working outside of application context error
         try:
             from app import app
             with app.app_context():
-                update_predictions_for_new_results()
+                states = refresh_market_states()
+                update_predictions_for_new_results(states)
         except Exception as e:
             logger.error(f"Error updating predictions: {str(e)}")
         
@@ -436,52 +466,27 @@ def find_next_valid_day(market, start_date):
     # Fallback to next day if no valid day found within max_attempts
     return start_date + datetime.timedelta(days=1)
 
-def update_predictions_for_new_results():
+def update_predictions_for_new_results(states=None):
     """
     Update predictions for markets that have new results
+    
+    Args:
+        states: Optional dictionary of market -> MarketState refreshed by the import
     """
     try:
-        # Get all markets
-        markets = set(Result.query.with_entities(Result.market).distinct().all())
-        logger.info(f"Found {len(markets)} markets to process")
+        # Markets whose next valid day already has a prediction are skipped inside
+        # the batch, so only markets with new results get a new prediction
+        predictions = generate_predictions_batch(states=states)
         
-        for market_tuple in markets:
-            try:
-                market = market_tuple[0]
-                logger.info(f"Processing market: {market}")
-                
-                # Get the latest result for this market
-                latest_result = Result.query.filter_by(market=market).order_by(Result.date.desc()).first()
-                
-                if not latest_result:
-                    logger.warning(f"No results found for market {market}, skipping prediction update")
-                    continue
-                
-                logger.info(f"Latest result for {market} is from {latest_result.date}")
-                
-                # Find the next valid day when the market operates
-                next_valid_day = find_next_valid_day(market, latest_result.date)
-                logger.info(f"Next valid day for {market} is {next_valid_day}")
-                
-                # Check if we already have a prediction for this market for the next valid day
-                existing_prediction = Prediction.query.filter_by(date=next_valid_day, market=market).first()
-                
-                if not existing_prediction:
-                    # Update predictions for this market
-                    logger.info(f"Creating new prediction for {market} for {next_valid_day}")
-                    try:
-                        update_predictions_for_market(market)
-                        logger.info(f"Successfully created prediction for {market}")
-                    except Exception as market_err:
-                        logger.error(f"Error creating prediction for {market}: {str(market_err)}")
-                else:
-                    logger.info(f"Prediction already exists for {market} on {next_valid_day}")
-            except Exception as market_err:
-                logger.error(f"Error processing market {market_tuple}: {str(market_err)}")
-                # Continue with next market rather than failing everything
-                continue
+        for market in predictions:
+            logger.info(f"Successfully created prediction for {market}")
                 
         logger.info("Completed updating predictions for all markets")
+        
+        # Markets with a new prediction have new results, so refresh their models
+        # incrementally; the weekly job still rebuilds them from scratch
+        if predictions:
+            train_models_for_all_markets(markets=list(predictions), incremental=True)
     except Exception as e:
         logger.error(f"Error updating predictions for new results: {str(e)}")
 
@@ -501,6 +506,36 @@ def train_ml_models():
         logger.error(f"Error training ML models: {str(e)}")
 
 
+def tune_ml_models():
+    """
+    Search hyperparameters for all ML models
+    """
+    try:
+        logger.info("Starting ML model tuning")
+        # Use app context to avoid Working outside of application context error
+        from app import app
+        with app.app_context():
+            tune_models_for_all_markets()
+        logger.info("Completed ML model tuning")
+    except Exception as e:
+        logger.error(f"Error tuning ML models: {str(e)}")
+
+
+def evaluate_ml_models():
+    """
+    Evaluate all current ML models and write the reports
+    """
+    try:
+        logger.info("Starting ML model evaluation")
+        # Use app context to avoid Working outside of application context error
+        from app import app
+        with app.app_context():
+            evaluate_models_for_all_markets()
+        logger.info("Completed ML model evaluation")
+    except Exception as e:
+        logger.error(f"Error evaluating ML models: {str(e)}")
+
+
 def send_trial_expiry_notifications():
     """
     Send notifications to users whose trial is about to expire
@@ -572,3 +607,14 @@ def cleanup_old_data():
         logger.info("Completed old data cleanup")
     except Exception as e:
         logger.error(f"Error cleaning up old data: {str(e)}")
+
+
+def prune_prediction_cache_job():
+    """
+    Delete old entries of the deterministic prediction cache
+    """
+    try:
+        deleted = prune_prediction_cache()
+        logger.info(f"Pruned {deleted} cached predictions")
+    except Exception as e:
+        logger.error(f"Error pruning prediction cache: {str(e)}")
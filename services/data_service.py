@@ -1,75 +1,145 @@
 import pandas as pd
 import datetime
 import os
+from sqlalchemy.dialects import postgresql, sqlite
 from app import db
 from models import Result, User, Subscription, ForumPost
-from utils import calculate_derived_fields, parse_date
 from config import Config
+from ml.results_store import RESULTS_STORE_PATH, append_results_store, load_results_store, write_results_store
+from services.stats_service import (
+    get_market_stats, get_market_totals, get_monthly_counts, rebuild_market_stats, record_result_writes,
+    result_snapshots
+)
 
 
-def import_csv_data(csv_file_path):
-    """Import data from CSV file into the database"""
-    # Read CSV file
-    df = pd.read_csv(csv_file_path)
+# Rows read from an import CSV per chunk
+CSV_CHUNK_ROWS = 5000
+
+# Result columns of the historical CSV read as text; everything else is numeric
+CSV_TEXT_COLUMNS = ['Date', 'Market', 'Open', 'Jodi', 'Close', 'day_of_week',
+                    'mirror_open', 'mirror_close', 'reverse_jodi']
+
+# Digit mirror used for mirror_open / mirror_close
+MIRROR_DIGITS = str.maketrans('0123456789', '9876543210')
+
+
+def _digit_sums(values):
+    """Digit sum of every all-digit string, NaN elsewhere"""
+    is_digits = values.str.fullmatch(r'\d+', na=False)
+    sums = sum(digit * values.str.count(str(digit)).fillna(0) for digit in range(1, 10))
+    return sums.where(is_digits).astype('float64')
+
+
+def _csv_column(chunk, name, default=None):
+    return chunk[name] if name in chunk else pd.Series(default, index=chunk.index, dtype=object)
+
+
+def prepare_result_rows(chunk):
+    """
+    Turn one chunk of the historical CSV into Result column values
     
-    # Process each row
-    for _, row in df.iterrows():
-        try:
-            # Parse date
-            date_str = row['Date']
-            date_obj = parse_date(date_str)
-            
-            # Skip if result already exists
-            existing_result = Result.query.filter_by(
-                date=date_obj,
-                market=row['Market']
-            ).first()
-            
-            if existing_result:
-                continue
-            
-            # Convert 'Off' values to None
-            open_val = None if row['Open'] == 'Off' else row['Open']
-            jodi_val = None if row['Jodi'] == 'Off' else row['Jodi']
-            close_val = None if row['Close'] == 'Off' else row['Close']
-            
-            # Create result data dictionary
-            result_data = {
-                'date': date_obj,
-                'market': row['Market'],
-                'open': open_val,
-                'jodi': jodi_val,
-                'close': close_val,
-                'day_of_week': row['day_of_week'],
-                'is_weekend': bool(row['is_weekend']),
-                'is_holiday': bool(row['is_holiday']) if 'is_holiday' in row else False
-            }
-            
-            # Add numeric fields if present and not NaN
-            for field in ['open_sum', 'close_sum', 'prev_jodi_distance']:
-                if field in row and not pd.isna(row[field]):
-                    result_data[field] = float(row[field])
+    'Off' values become NULL and the derived fields are computed for the whole
+    chunk at once, as `calculate_derived_fields` does per row: digit sums fall back
+    to the derived value when the CSV has none, mirrors and the reverse jodi are
+    derived whenever the result allows it.
+    
+    Returns:
+        DataFrame with Result column names; rows with an unparseable date are dropped
+    """
+    rows = pd.DataFrame(index=chunk.index)
+    rows['date'] = pd.to_datetime(chunk['Date'], format='%d/%m/%Y', errors='coerce').dt.date
+    rows['market'] = chunk['Market'].str.strip()
+    for column in ('open', 'jodi', 'close'):
+        values = chunk[column.capitalize()].str.strip()
+        rows[column] = values.where(~values.isin(['Off', '']))
+    rows['day_of_week'] = _csv_column(chunk, 'day_of_week')
+    for column in ('is_weekend', 'is_holiday'):
+        rows[column] = pd.to_numeric(_csv_column(chunk, column, 0), errors='coerce').fillna(0).astype(bool)
+        
+    rows['open_sum'] = pd.to_numeric(_csv_column(chunk, 'open_sum'), errors='coerce').fillna(_digit_sums(rows['open']))
+    rows['close_sum'] = pd.to_numeric(_csv_column(chunk, 'close_sum'), errors='coerce').fillna(_digit_sums(rows['close']))
+    rows['prev_jodi_distance'] = pd.to_numeric(_csv_column(chunk, 'prev_jodi_distance'), errors='coerce')
+        
+    for column in ('open', 'close'):
+        values = rows[column]
+        derivable = values.str.fullmatch(r'\d{3}', na=False)
+        rows[f'mirror_{column}'] = values.str.translate(MIRROR_DIGITS).where(
+            derivable, _csv_column(chunk, f'mirror_{column}')
+        )
+    rows['reverse_jodi'] = rows['jodi'].str[::-1].where(
+        rows['jodi'].str.len() == 2, _csv_column(chunk, 'reverse_jodi')
+    )
+        
+    # Integer columns, as utils.calculate_digit_fields
+    jodi_num = pd.to_numeric(rows['jodi'].where(rows['jodi'].str.fullmatch(r'\d{2}', na=False)))
+    rows['jodi_num'] = jodi_num.astype('Int16')
+    for column, jodi_digit in (('open', jodi_num // 10), ('close', jodi_num % 10)):
+        is_panel = rows[column].str.fullmatch(r'\d{3}', na=False)
+        rows[f'{column}_panel'] = pd.to_numeric(rows[column].where(is_panel)).astype('Int16')
+        rows[f'{column}_ank'] = (_digit_sums(rows[column]) % 10).where(is_panel, jodi_digit).astype('Int16')
+        
+    return rows[rows['date'].notna() & rows['market'].notna()]
+
+
+def import_csv_data(csv_file_path, chunk_rows=CSV_CHUNK_ROWS, progress=None):
+    """
+    Import data from CSV file into the database
+    
+    The CSV is streamed in typed chunks. The (market, date) keys already in the
+    database are fetched once and anti-joined against every chunk, and the new rows
+    are inserted with one executemany per chunk; the statistics of the chunk's
+    markets are rebuilt in the same transaction. Existing results are left as
+    they are.
+    
+    Args:
+        csv_file_path: Path of a CSV in the historical data layout
+        chunk_rows: Rows read per chunk
+        progress: Optional callable(rows_read, rows_inserted) called after each chunk
+    
+    Returns:
+        Dictionary with the number of rows 'read', 'inserted', 'existing' and 'invalid'
+    """
+    existing = pd.DataFrame(
+        db.session.query(Result.market, Result.date).all(), columns=['market', 'date']
+    )
+    existing['existing'] = True
+    stats = {'read': 0, 'inserted': 0, 'existing': 0, 'invalid': 0}
+    inserted = []
+        
+    reader = pd.read_csv(
+        csv_file_path, chunksize=chunk_rows, keep_default_na=False,
+        dtype={column: str for column in CSV_TEXT_COLUMNS}
+    )
+    for chunk in reader:
+        rows = prepare_result_rows(chunk)
+        stats['read'] += len(chunk)
+        stats['invalid'] += len(chunk) - len(rows)
             
-            # Add string fields if present and not NaN
-            for field in ['mirror_open', 'mirror_close', 'reverse_jodi']:
-                if field in row and not pd.isna(row[field]):
-                    result_data[field] = str(row[field])
+        # Anti-join against the stored keys and the rows already imported; repeats
+        # within the chunk count as existing, as they would across chunks
+        rows = rows.merge(existing, on=['market', 'date'], how='left')
+        new_rows = rows[rows['existing'].isna()].drop(columns='existing').drop_duplicates(subset=['market', 'date'])
+        stats['existing'] += len(rows) - len(new_rows)
             
-            # Calculate any missing derived fields
-            derived_fields = calculate_derived_fields(result_data)
-            for key, value in derived_fields.items():
-                if key not in result_data or result_data[key] is None:
-                    result_data[key] = value
+        if len(new_rows):
+            records = new_rows.astype(object).where(new_rows.notna(), None).to_dict('records')
+            db.session.execute(db.insert(Result), records)
+            rebuild_market_stats(set(new_rows['market']))
+            db.session.commit()
+            existing = pd.concat([existing, new_rows[['market', 'date']].assign(existing=True)], ignore_index=True)
+            inserted.extend(new_rows[['market', 'date']].to_dict('records'))
             
-            # Create new result
-            new_result = Result(**result_data)
-            db.session.add(new_result)
+        stats['inserted'] += len(new_rows)
+        print(f"Imported {stats['inserted']} of {stats['read']} rows read from {csv_file_path}")
+        if progress is not None:
+            progress(stats['read'], stats['inserted'])
         
-        except Exception as e:
-            print(f"Error processing row: {row}, Error: {str(e)}")
-    
-    # Commit all changes
-    db.session.commit()
+    print(f"CSV import finished: {stats['inserted']} inserted, {stats['existing']} already present, "
+          f"{stats['invalid']} invalid")
+        
+    if stats['inserted']:
+        sync_results_store(inserted)
+    return stats
 
 
 def get_dashboard_stats():
@@ -107,11 +177,8 @@ def get_dashboard_stats():
     ).filter_by(status='success').scalar() or 0
     
     # Result stats
-    stats['total_results'] = Result.query.count()
-    stats['markets'] = db.session.query(
-        Result.market, db.func.count(Result.id)
-    ).group_by(Result.market).all()
-    stats['markets'] = {market: count for market, count in stats['markets']}
+    stats['markets'] = get_market_totals()
+    stats['total_results'] = sum(stats['markets'].values())
     
     # Forum stats
     stats['total_forum_posts'] = ForumPost.query.count()
@@ -141,3 +208,270 @@ def get_result_by_date(date, market=None):
         query = query.filter_by(market=market)
     
     return query.all()
+
+
+# Natural key of Result and Prediction rows, the columns of their unique
+# constraints (unique_date_market, unique_date_market_prediction)
+UPSERT_KEY = ('date', 'market')
+
+# Markers of a missing result value that an upsert may fill in
+MISSING_VALUES = (None, 'Off')
+
+
+def upsert_rows(model, rows, update=True, fill_columns=()):
+    """
+    Insert rows, or update the existing rows with the same market and date
+    
+    On PostgreSQL and SQLite this is one INSERT ... ON CONFLICT statement per batch
+    of rows with the same keys; other databases fall back to a lookup per row. For
+    Result rows the market statistics (services.stats_service) are updated in the
+    same transaction. The caller commits.
+    
+    Args:
+        model: Result or Prediction
+        rows: List of dictionaries of column values, each with 'market' and 'date'
+        update: Update existing rows (False keeps them untouched)
+        fill_columns: Columns only overwritten where the stored value is NULL or 'Off'
+    
+    Returns:
+        Number of rows written
+    """
+    if not rows:
+        return 0
+        
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        return _upsert_rows_orm(model, rows, update, fill_columns)
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    before = result_snapshots(rows) if model is Result else None
+        
+    # executemany needs the same columns in every row of a statement
+    batches = {}
+    for row in rows:
+        batches.setdefault(tuple(sorted(row)), []).append(row)
+        
+    for columns, batch in batches.items():
+        stmt = insert(model)
+        if not update:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(UPSERT_KEY))
+        else:
+            table = model.__table__
+            values = {}
+            for column in columns:
+                if column in UPSERT_KEY or column in ('id', 'created_at'):
+                    continue
+                if column in fill_columns:
+                    missing = table.c[column].is_(None)
+                    if isinstance(table.c[column].type, db.String):
+                        missing = db.or_(missing, table.c[column] == 'Off')
+                    values[column] = db.case((missing, stmt.excluded[column]), else_=table.c[column])
+                else:
+                    values[column] = stmt.excluded[column]
+            # Column onupdate defaults do not apply to ON CONFLICT updates
+            if 'updated_at' in table.c:
+                values['updated_at'] = datetime.datetime.utcnow()
+            stmt = stmt.on_conflict_do_update(index_elements=list(UPSERT_KEY), set_=values)
+        db.session.execute(stmt, batch)
+        
+    # ON CONFLICT writes bypass the session, so its statistics hooks do not see them
+    if model is Result:
+        record_result_writes(rows, before)
+    return len(rows)
+
+
+def _upsert_rows_orm(model, rows, update, fill_columns):
+    """`upsert_rows` for databases without ON CONFLICT"""
+    for row in rows:
+        existing = model.query.filter_by(market=row['market'], date=row['date']).first()
+        if existing is None:
+            db.session.add(model(**row))
+            continue
+        if not update:
+            continue
+        for key, value in row.items():
+            if key in UPSERT_KEY or key in ('id', 'created_at'):
+                continue
+            if key in fill_columns and getattr(existing, key) not in MISSING_VALUES:
+                continue
+            setattr(existing, key, value)
+    return len(rows)
+
+
+def get_result_statistics(market=None):
+    """
+    The statistics of `utils.calculate_statistics`, for the stored results
+    
+    Counts kept in the market_stats cells are read from there; the day and sum
+    distributions are GROUP BYs over the results.
+    
+    Args:
+        market: Optional market name
+    
+    Returns:
+        Dictionary of the same distributions the DataFrame version computes
+    """
+    def _counts(column):
+        query = db.session.query(column, db.func.count()).filter(column.isnot(None))
+        if market is not None:
+            query = query.filter(Result.market == market)
+        return dict(query.group_by(column).all())
+    
+    def _top(counts, label):
+        top = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:10]
+        return {label(value): count for value, count in top}
+    
+    stats = {}
+    totals = get_market_totals()
+    if market is not None:
+        totals = {market: totals[market]} if market in totals else {}
+    stats['market_distribution'] = totals
+    stats['total_records'] = sum(stats['market_distribution'].values())
+    stats['day_distribution'] = _counts(Result.day_of_week)
+    stats['open_sum_distribution'] = _counts(Result.open_sum)
+    stats['close_sum_distribution'] = _counts(Result.close_sum)
+    stats['common_jodis'] = _top(get_market_stats('jodi', market), lambda jodi: f"{jodi:02d}")
+    stats['common_transitions'] = _top(get_market_stats('transition', market),
+                                       lambda value: f"{value // 100:02d}-{value % 100:02d}")
+    
+    monthly = {}
+    for period, count in get_monthly_counts('jodi', market).items():
+        monthly[period % 100] = monthly.get(period % 100, 0) + count
+    stats['monthly_trends'] = monthly
+    
+    return stats
+
+
+# Result columns loaded for the ML pipeline, in the order of the historical CSV
+RESULT_FRAME_COLUMNS = {
+    'Date': Result.date,
+    'Market': Result.market,
+    'Open': Result.open,
+    'Jodi': Result.jodi,
+    'Close': Result.close,
+    'day_of_week': Result.day_of_week,
+    'is_weekend': Result.is_weekend,
+    'open_sum': Result.open_sum,
+    'close_sum': Result.close_sum,
+    'mirror_open': Result.mirror_open,
+    'mirror_close': Result.mirror_close,
+    'reverse_jodi': Result.reverse_jodi,
+    'is_holiday': Result.is_holiday,
+    'prev_jodi_distance': Result.prev_jodi_distance,
+    'open_panel': Result.open_panel,
+    'open_ank': Result.open_ank,
+    'jodi_num': Result.jodi_num,
+    'close_ank': Result.close_ank,
+    'close_panel': Result.close_panel
+}
+
+# Integer forms of the result, nullable where a value is missing or 'Off'
+DIGIT_FRAME_COLUMNS = ('open_panel', 'open_ank', 'jodi_num', 'close_ank', 'close_panel')
+
+
+def load_results_frame(markets=None, start_date=None, end_date=None, last_n=None):
+    """
+    Load results for one or many markets into a typed DataFrame in a single query
+    
+    Only the needed columns are selected and rows go straight into pandas without
+    building Result objects.
+    
+    Args:
+        markets: Market name or list of names (defaults to all markets)
+        start_date: Optional first date (inclusive)
+        end_date: Optional last date (inclusive)
+        last_n: Optional number of latest results kept per market
+    
+    Returns:
+        DataFrame sorted by market and date with a datetime64 'Date', categorical
+        'Market', float64 digit sums, boolean flags and nullable Int16 digit columns
+        (DIGIT_FRAME_COLUMNS). Result values (Open, Jodi, Close, ...) stay
+        zero-padded strings as the pipeline expects.
+    """
+    columns = [column.label(name) for name, column in RESULT_FRAME_COLUMNS.items()]
+    filters = []
+    if markets is not None:
+        markets = [markets] if isinstance(markets, str) else list(markets)
+        filters.append(Result.market.in_(markets))
+    if start_date is not None:
+        filters.append(Result.date >= start_date)
+    if end_date is not None:
+        filters.append(Result.date <= end_date)
+    
+    if last_n is not None:
+        row_number = db.func.row_number().over(
+            partition_by=Result.market, order_by=Result.date.desc()
+        ).label('row_number')
+        window = db.select(*columns, row_number).where(*filters).subquery()
+        query = db.select(*[window.c[name] for name in RESULT_FRAME_COLUMNS]).where(
+            window.c.row_number <= last_n
+        ).order_by(window.c.Market, window.c.Date)
+    else:
+        query = db.select(*columns).where(*filters).order_by(Result.market, Result.date)
+    
+    df = pd.read_sql(query, db.session.connection())
+    
+    df['Date'] = pd.to_datetime(df['Date'])
+    df['Market'] = df['Market'].astype('category')
+    for col in ('open_sum', 'close_sum', 'prev_jodi_distance'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in ('is_weekend', 'is_holiday'):
+        df[col] = df[col].fillna(False).astype(bool)
+    for col in DIGIT_FRAME_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int16')
+    return df
+
+
+def sync_results_store(rows=None):
+    """
+    Bring the columnar results mirror (ml.results_store) up to date with the database
+    
+    Called after every import so readers of the mirror see the same history as the
+    results table. Errors are reported but never fail the import.
+    
+    Args:
+        rows: The written rows, each with 'market' and 'date'. Their stored values
+            are appended to the mirror; without rows (or without a mirror yet) the
+            mirror is rewritten from the whole table.
+    
+    Returns:
+        Path of the written file, or None if it could not be written
+    """
+    try:
+        if rows is None or not os.path.exists(RESULTS_STORE_PATH):
+            return write_results_store(load_results_frame(), RESULTS_STORE_PATH)
+        if not len(rows):
+            return None
+        
+        keys = pd.DataFrame([(row['market'], row['date']) for row in rows], columns=['Market', 'Date'])
+        keys['Date'] = pd.to_datetime(keys['Date'])
+        keys = keys.drop_duplicates()
+        written = load_results_frame(
+            set(keys['Market']), start_date=keys['Date'].min().date(), end_date=keys['Date'].max().date()
+        )
+        written['Market'] = written['Market'].astype(str)
+        written = written.merge(keys, on=['Market', 'Date'])
+        return append_results_store(written, RESULTS_STORE_PATH)
+    except Exception as e:
+        print(f"Error syncing results store: {str(e)}")
+        return None
+
+
+def load_market_history(market):
+    """
+    A market's results (Date, Market, Open, Jodi, Close, is_holiday), oldest first
+    
+    Read from the memory-mapped results mirror, or from the database when the
+    mirror has not been written yet.
+    """
+    history = load_results_store(RESULTS_STORE_PATH)
+    if history is None:
+        return load_results_frame(market)
+    return history.to_frame(market)
+
+
+def split_by_market(df):
+    """Dictionary of market -> that market's rows of a `load_results_frame` frame"""
+    return {
+        market: market_df.reset_index(drop=True)
+        for market, market_df in df.groupby('Market', observed=True, sort=True)
+    }
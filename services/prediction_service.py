@@ -7,8 +7,14 @@ import os
 from app import db
 from models import Result, Prediction, MLModel
 from config import Config
-from ml.predictor import generate_predictions
-from ml.trainer import train_model
+from ml.predictor import generate_predictions_from_state, generate_predictions_for_markets, pack_probabilities
+from ml.market_state import MarketState
+from ml.cross_market import CrossMarketMatrix
+from ml.trainer import train_models_parallel
+from ml.tuning import tune_markets
+from ml.inference import predict_probabilities
+from ml.model_evaluation import EVALUATION_DAYS, evaluate_registry, importance_registry, low_importance_features
+from services.data_service import load_results_frame, split_by_market, sync_results_store, upsert_rows
 from utils import calculate_derived_fields
 
 
@@ -37,35 +43,18 @@ def update_result(result_data):
     date = result_data.get('date')
     market = result_data.get('market')
     
-    # Check if result already exists
-    existing_result = Result.query.filter_by(date=date, market=market).first()
+    # Result columns plus derived fields, written in one upsert
+    row = {key: value for key, value in result_data.items() if key in Result.__table__.c and key != 'id'}
+    row.update(calculate_derived_fields(result_data))
     
-    if existing_result:
-        # Update existing result
-        for key, value in result_data.items():
-            if hasattr(existing_result, key) and key != 'id':
-                setattr(existing_result, key, value)
-        
-        # Calculate derived fields
-        derived_fields = calculate_derived_fields(result_data)
-        for key, value in derived_fields.items():
-            setattr(existing_result, key, value)
-        
-        existing_result.updated_at = datetime.datetime.utcnow()
-        db.session.commit()
-        return existing_result
-    else:
-        # Create new result
-        new_result = Result(**result_data)
-        
-        # Calculate derived fields
-        derived_fields = calculate_derived_fields(result_data)
-        for key, value in derived_fields.items():
-            setattr(new_result, key, value)
-        
-        db.session.add(new_result)
-        db.session.commit()
-        return new_result
+    upsert_rows(Result, [row])
+    db.session.commit()
+    sync_results_store([row])
+    
+    # Reload so an instance already in the session reflects the upsert
+    return db.session.execute(
+        db.select(Result).filter_by(date=date, market=market).execution_options(populate_existing=True)
+    ).scalar_one()
 
 
 def is_market_operating(market_name, check_date):
@@ -96,6 +85,72 @@ def find_next_valid_day(market, start_date):
     # Fallback to next day if no valid day found within max_attempts
     return start_date + datetime.timedelta(days=1)
 
+def load_market_state(market, end_date):
+    """
+    Load a market's predictor state and apply any results newer than its snapshot
+    
+    The snapshot is rebuilt from the training window when it is missing, has an old
+    version, or when a result already in the window was edited after it was saved.
+    """
+    state = MarketState.load(market)
+    
+    if state is not None and state.last_date is not None:
+        edited = Result.query.filter(
+            Result.market == market,
+            Result.date <= state.last_date,
+            Result.updated_at > state.synced_at
+        ).first()
+        
+        if edited is None:
+            new_results = Result.query.filter(
+                Result.market == market,
+                Result.date > state.last_date,
+                Result.date <= end_date
+            ).order_by(Result.date).all()
+            
+            for r in new_results:
+                state.push(r.date, r.jodi)
+            
+            if new_results:
+                state.save()
+            return state
+    
+    # Get training data (last 60 days before latest result), oldest first
+    start_date = end_date - datetime.timedelta(days=Config.TRAINING_DAYS)
+    training_df = load_results_frame(market, start_date=start_date, end_date=end_date)
+    
+    state = MarketState.from_dataframe(training_df, market)
+    if len(state):
+        state.save()
+    return state
+
+
+def refresh_market_states(markets=None):
+    """
+    Apply newly imported results to the saved predictor states
+    
+    Called after every results import so the states are current before anything
+    predicts from them.
+    
+    Args:
+        markets: List of market names (defaults to all markets with results)
+    
+    Returns:
+        Dictionary of market -> MarketState
+    """
+    latest_query = db.session.query(Result.market, db.func.max(Result.date)).group_by(Result.market)
+    if markets is not None:
+        latest_query = latest_query.filter(Result.market.in_(markets))
+    
+    states = {}
+    for market, latest_date in latest_query.all():
+        try:
+            states[market] = load_market_state(market, latest_date)
+        except Exception as e:
+            print(f"Error refreshing predictor state for {market}: {str(e)}")
+    return states
+
+
 def update_predictions_for_market(market):
     """Update predictions for a specific market"""
     try:
@@ -117,54 +172,32 @@ def update_predictions_for_market(market):
             print(f"Predictions already exist for {market} on {next_valid_day}")
             return existing_prediction
         
-        # Get training data (last 60 days before latest result)
-        end_date = latest_result.date
-        start_date = end_date - datetime.timedelta(days=Config.TRAINING_DAYS)
-        training_data = Result.query.filter(
-            Result.market == market,
-            Result.date >= start_date,
-            Result.date <= end_date
-        ).order_by(Result.date).all()
-        
-        print(f"Found {len(training_data)} training records for {market}")
+        # Bring the market's sliding-window state up to date with the latest results
+        state = load_market_state(market, latest_result.date)
         
-        # Convert to DataFrame for ML processing
-        training_df = pd.DataFrame([{
-            'Date': r.date.strftime('%d/%m/%Y'),
-            'Market': r.market,
-            'Open': r.open,
-            'Jodi': r.jodi,
-            'Close': r.close,
-            'day_of_week': r.day_of_week,
-            'is_weekend': r.is_weekend,
-            'open_sum': r.open_sum,
-            'close_sum': r.close_sum,
-            'mirror_open': r.mirror_open,
-            'mirror_close': r.mirror_close,
-            'reverse_jodi': r.reverse_jodi,
-            'is_holiday': r.is_holiday,
-            'prev_jodi_distance': r.prev_jodi_distance
-        } for r in training_data])
+        print(f"Found {len(state)} training records for {market}")
         
         # Skip if not enough data
-        if len(training_df) < 30:
+        if len(state) < 30:
             print(f"Not enough training data for {market}, need at least 30 records")
             # For testing, let's relax this constraint
-            if len(training_df) < 10:
+            if len(state) < 10:
                 print(f"Less than 10 records, skipping prediction for {market}")
                 return None
             else:
-                print(f"Using limited data ({len(training_df)} records) for testing purposes")
+                print(f"Using limited data ({len(state)} records) for testing purposes")
         
-        # Generate predictions using ML model
-        print(f"Generating predictions for {market} using {len(training_df)} records")
-        predictions = generate_predictions(training_df, market)
+        # Generate predictions from the incremental pattern statistics, blended with
+        # the trained models when the market has them
+        print(f"Generating predictions for {market} using {len(state)} records")
+        model_probabilities = load_model_probabilities([market]).get(market)
+        predictions = generate_predictions_from_state(state, next_valid_day, model_probabilities)
         
         if not predictions:
             print(f"Failed to generate predictions for {market}")
             return None
             
-        print(f"Prediction results: {predictions}")
+        print(f"Prediction results: {predictions.get('jodi_list')}, confidence {predictions.get('confidence_score')}")
         
         # Create new prediction record
         new_prediction = Prediction(
@@ -174,7 +207,8 @@ def update_predictions_for_market(market):
             close_digits=predictions.get('close_digits'),
             jodi_list=predictions.get('jodi_list'),
             patti_list=predictions.get('patti_list'),
-            confidence_score=predictions.get('confidence_score')
+            confidence_score=predictions.get('confidence_score'),
+            probabilities=pack_probabilities(predictions)
         )
         
         db.session.add(new_prediction)
@@ -187,154 +221,360 @@ def update_predictions_for_market(market):
         return None
 
 
-def train_models_for_all_markets():
-    """Train ML models for all markets"""
-    # Get list of all markets
-    markets = set(Result.query.with_entities(Result.market).distinct().all())
+def generate_predictions_batch(markets=None, states=None):
+    """
+    Generate and store predictions for many markets at once
+    
+    Every market predicts the next valid day after its latest result from its
+    MarketState, and the new Prediction rows are written in one statement. Markets
+    that already have a prediction for their target date are skipped.
+    
+    Args:
+        markets: List of market names (defaults to all markets with results)
+        states: Optional dictionary of market -> MarketState already brought up to
+            date (e.g. by `refresh_market_states` after an import); the states of
+            other markets are loaded here
     
-    for market_tuple in markets:
-        market = market_tuple[0]
+    Returns:
+        Dictionary of market -> predictions that were saved
+    """
+    latest_query = db.session.query(Result.market, db.func.max(Result.date)).group_by(Result.market)
+    if markets is not None:
+        latest_query = latest_query.filter(Result.market.in_(markets))
+    latest_dates = dict(latest_query.all())
+    
+    target_dates = {
+        market: find_next_valid_day(market, latest_date)
+        for market, latest_date in latest_dates.items()
+    }
+    
+    if not target_dates:
+        return {}
+    
+    # Skip markets that already have a prediction for their target date
+    existing = db.session.query(Prediction.market, Prediction.date).filter(
+        Prediction.market.in_(list(target_dates)),
+        Prediction.date.in_(set(target_dates.values()))
+    ).all()
+    for market, date in existing:
+        if target_dates.get(market) == date:
+            del target_dates[market]
+    
+    if not target_dates:
+        print("Predictions already exist for all requested markets")
+        return {}
+    
+    states = dict(states or {})
+    missing = [market for market in target_dates if market not in states]
+    if missing:
+        states.update(refresh_market_states(missing))
+    
+    market_states = {}
+    for market in target_dates:
+        state = states.get(market)
+        if state is None or len(state) < 10:
+            print(f"Less than 10 records, skipping prediction for {market}")
+            continue
+        market_states[market] = state
+    
+    print(f"Generating predictions for {len(market_states)} markets")
+    model_probabilities = load_model_probabilities(list(market_states))
+    predictions = generate_predictions_for_markets(market_states, target_dates, model_probabilities=model_probabilities)
+    
+    new_predictions = []
+    for market, market_predictions in predictions.items():
+        if not market_predictions:
+            print(f"Failed to generate predictions for {market}")
+            continue
         
-        try:
-            print(f"Training models for market: {market}")
-            
-            # Get training data for this market (last 60 days)
-            end_date = datetime.date.today()
-            start_date = end_date - datetime.timedelta(days=Config.TRAINING_DAYS)
-            
-            training_data = Result.query.filter(
-                Result.market == market,
-                Result.date >= start_date,
-                Result.date <= end_date
-            ).order_by(Result.date).all()
-            
-            print(f"Found {len(training_data)} records for {market}")
-            
-            # Skip if not enough data
-            if len(training_data) < 30:
-                print(f"Not enough data for {market}, need at least 30 records")
-                # For testing, let's relax this constraint
-                if len(training_data) < 10:
-                    continue
-            
-            # Convert to DataFrame for ML processing
-            training_df = pd.DataFrame([{
-                'Date': r.date.strftime('%d/%m/%Y'),
-                'Market': r.market,
-                'Open': r.open,
-                'Jodi': r.jodi,
-                'Close': r.close,
-                'day_of_week': r.day_of_week,
-                'is_weekend': r.is_weekend,
-                'open_sum': r.open_sum,
-                'close_sum': r.close_sum,
-                'mirror_open': r.mirror_open,
-                'mirror_close': r.mirror_close,
-                'reverse_jodi': r.reverse_jodi,
-                'is_holiday': r.is_holiday,
-                'prev_jodi_distance': r.prev_jodi_distance
-            } for r in training_data])
-            
-            # Train models for this market
-            print(f"Training ML models for {market} with {len(training_df)} records")
-            models = train_model(training_df, market)
-            
-            # Save model info in database
-            for model_type, model_info in models.items():
-                # Check if model already exists
-                existing_model = MLModel.query.filter_by(
-                    market=market, model_type=model_type
-                ).first()
+        new_predictions.append({
+            'date': target_dates[market],
+            'market': market,
+            'open_digits': market_predictions.get('open_digits'),
+            'close_digits': market_predictions.get('close_digits'),
+            'jodi_list': market_predictions.get('jodi_list'),
+            'patti_list': market_predictions.get('patti_list'),
+            'confidence_score': market_predictions.get('confidence_score'),
+            'probabilities': pack_probabilities(market_predictions),
+            'created_at': datetime.datetime.utcnow()
+        })
+    
+    if new_predictions:
+        # Predictions written concurrently since the check above are kept
+        upsert_rows(Prediction, new_predictions, update=False)
+        db.session.commit()
+    
+    print(f"Successfully saved predictions for {len(new_predictions)} markets")
+    return {p['market']: predictions[p['market']] for p in new_predictions}
+
+
+def load_training_frames(markets=None, days=Config.TRAINING_DAYS, min_records=10):
+    """
+    Load recent results of each market as training DataFrames
+    
+    All markets are loaded in one query, which also feeds the cross-market matrix
+    every market's pipeline shares, even when only some markets are trained.
+    
+    Args:
+        markets: Optional list of markets (defaults to every market with results)
+        days: Number of days of history to load
+        min_records: Markets with fewer results are skipped
+    
+    Returns:
+        Tuple (training_frames, cross): dictionary of market -> DataFrame (oldest
+        first) and the CrossMarketMatrix of all markets
+    """
+    # Get training data for every market in one query
+    end_date = datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=days)
+    print(f"Loading training data for {'all' if markets is None else len(markets)} markets")
+    results_df = load_results_frame(None, start_date, end_date)
+    cross = CrossMarketMatrix.from_frame(results_df)
+    training_frames = {}
+    
+    for market, market_df in split_by_market(results_df).items():
+        if markets is not None and market not in markets:
+            continue
+        print(f"Found {len(market_df)} records for {market}")
+        
+        # Skip if not enough data
+        if len(market_df) < 30:
+            print(f"Not enough data for {market}, need at least 30 records")
+            # For testing, let's relax this constraint
+            if len(market_df) < min_records:
+                continue
+        
+        training_frames[market] = market_df
+    
+    return training_frames, cross
+
+
+def train_models_for_all_markets(markets=None, incremental=False):
+    """
+    Train ML models for all markets
+    
+    Args:
+        markets: Optional list of markets (defaults to every market with results)
+        incremental: Continue boosting the existing models with new results only
+            instead of retraining from scratch
+    """
+    # Get training data for every market (last 60 days)
+    training_frames, cross = load_training_frames(markets)
+    
+    # Train all markets in parallel within the training CPU budget
+    print(f"{'Updating' if incremental else 'Training'} ML models for {len(training_frames)} markets")
+    trained = train_models_parallel(training_frames, incremental=incremental, cross=cross)
+    
+    # Register every trained model in one transaction
+    try:
+        training_date = datetime.datetime.utcnow()
+        existing_models = {
+            (m.market, m.model_type): m
+            for m in MLModel.query.filter(MLModel.market.in_(list(trained))).all()
+        }
+        
+        for market, models in trained.items():
+            for model_type in ('open', 'close', 'jodi'):
+                model_path = models[f'{model_type}_model_path']
+                accuracy = float(models[f'{model_type}_accuracy'])
+                existing_model = existing_models.get((market, model_type))
                 
                 if existing_model:
                     # Update existing model
-                    existing_model.model_path = model_info['path']
-                    existing_model.accuracy = model_info['accuracy']
-                    existing_model.training_date = datetime.datetime.utcnow()
+                    existing_model.model_path = model_path
+                    existing_model.accuracy = accuracy
+                    existing_model.training_date = training_date
                 else:
                     # Create new model record
-                    new_model = MLModel(
+                    db.session.add(MLModel(
                         market=market,
                         model_type=model_type,
-                        model_path=model_info['path'],
-                        accuracy=model_info['accuracy'],
-                        training_date=datetime.datetime.utcnow()
-                    )
-                    db.session.add(new_model)
-            
-            db.session.commit()
-            print(f"Successfully trained models for {market}")
-        except Exception as e:
-            print(f"Error training models for {market}: {str(e)}")
+                        model_path=model_path,
+                        accuracy=accuracy,
+                        training_date=training_date
+                    ))
+        
+        db.session.commit()
+        print(f"Successfully trained models for {len(trained)} markets")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error registering trained models: {str(e)}")
     
     return True
 
 
+def tune_models_for_all_markets(markets=None):
+    """
+    Search model hyperparameters for all markets on a longer history
+    
+    The best configuration of each market is saved for `train_model` to use from the
+    next training run on.
+    """
+    training_frames, cross = load_training_frames(markets, days=Config.TUNING_DAYS, min_records=30)
+    print(f"Tuning ML models for {len(training_frames)} markets")
+    tuned = tune_markets(training_frames, cross=cross)
+    print(f"Successfully tuned models for {len(tuned)} markets")
+    return tuned
+
+
+def evaluate_models_for_all_markets(markets=None, plots=False):
+    """
+    Score the current ML models of all markets on the results after their training
+    
+    Only results dated after each run's last training day are scored; the frames
+    reach back far enough to build their features. Reports are written to
+    ml.model_evaluation.REPORT_DIR as JSON and Parquet.
+    
+    Args:
+        markets: Optional list of markets (defaults to every market with results)
+        plots: Also render confusion matrix plots
+    
+    Returns:
+        DataFrame with one row of metrics per market and model type
+    """
+    training_frames, cross = load_training_frames(markets, days=Config.TRAINING_DAYS + EVALUATION_DAYS)
+    print(f"Evaluating ML models for {len(training_frames)} markets")
+    summary, paths = evaluate_registry(training_frames, cross=cross, plots=plots)
+    print(f"Evaluation reports written to {paths['json']}")
+    return summary
+
+
+def analyze_feature_importance_for_all_markets(markets=None):
+    """
+    Permutation importance and group ablation of the current ML models of all markets
+    
+    Like `evaluate_models_for_all_markets`, only results after each run's training
+    window are scored. The tables are written to ml.model_evaluation.REPORT_DIR.
+    
+    Args:
+        markets: Optional list of markets (defaults to every market with results)
+    
+    Returns:
+        Tuple (importance DataFrame, ablation DataFrame)
+    """
+    training_frames, cross = load_training_frames(markets, days=Config.TRAINING_DAYS + EVALUATION_DAYS)
+    print(f"Analysing feature importance for {len(training_frames)} markets")
+    importance, ablation, paths = importance_registry(training_frames, cross=cross)
+    if not importance.empty:
+        print(f"Features no model relies on: {low_importance_features(importance)}")
+    for kind, path in paths.items():
+        print(f"Feature {kind} table written to {path}")
+    return importance, ablation
+
+
+def get_model_probabilities(market, cross=None):
+    """
+    Next-day class probabilities from a market's trained models
+    
+    Models are served from the in-memory model cache, which is refreshed when the
+    market's MLModel rows report a newer training run.
+    
+    Args:
+        market: Market name
+        cross: CrossMarketMatrix of all markets' latest results (loaded when not
+            given; pass one to share it between markets)
+    
+    Returns:
+        Dictionary with 'open', 'close' and 'jodi' probability arrays, or None
+    """
+    training_date = db.session.query(db.func.max(MLModel.training_date)).filter(
+        MLModel.market == market,
+        MLModel.is_active == True
+    ).scalar()
+    
+    training_df = load_results_frame(market, last_n=Config.TRAINING_DAYS)
+    
+    if training_df.empty:
+        return None
+    
+    if cross is None:
+        # The latest two results of every market cover same-day and previous-day
+        # cross-market features
+        cross = CrossMarketMatrix.from_frame(load_results_frame(last_n=2))
+    
+    return predict_probabilities(training_df, market, training_date, cross)
+
+
+def load_model_probabilities(markets):
+    """
+    Trained model probabilities of the markets that have usable models
+    
+    Markets without models, or whose models fail, are left out so their
+    predictions fall back to the pattern statistics alone.
+    
+    Args:
+        markets: List of market names
+    
+    Returns:
+        Dictionary of market -> probabilities (see `get_model_probabilities`)
+    """
+    if not markets:
+        return {}
+    
+    try:
+        cross = CrossMarketMatrix.from_frame(load_results_frame(last_n=2))
+    except Exception as e:
+        print(f"Error loading cross-market features: {str(e)}")
+        return {}
+    
+    probabilities = {}
+    for market in markets:
+        try:
+            market_probabilities = get_model_probabilities(market, cross)
+        except Exception as e:
+            print(f"Error loading model probabilities for {market}: {str(e)}")
+            continue
+        if market_probabilities is not None:
+            probabilities[market] = market_probabilities
+    return probabilities
+
+
 def get_prediction_accuracy():
     """Calculate prediction accuracy across all markets"""
     # Get predictions from the last 30 days
     end_date = datetime.date.today()
     start_date = end_date - datetime.timedelta(days=30)
     
-    predictions = Prediction.query.filter(
-        Prediction.date >= start_date,
-        Prediction.date < end_date
-    ).all()
+    date_filter = (Prediction.date >= start_date, Prediction.date < end_date)
+    result_join = db.and_(Result.market == Prediction.market, Result.date == Prediction.date)
     
     accuracy_stats = {
-        'total': len(predictions),
+        'total': Prediction.query.filter(*date_filter).count(),
         'open_matches': 0,
         'close_matches': 0,
         'jodi_matches': 0,
         'markets': {}
     }
     
-    for prediction in predictions:
-        # Get corresponding result
-        result = Result.query.filter_by(
-            date=prediction.date, market=prediction.market
-        ).first()
-        
-        if not result or not result.jodi:
-            continue
-        
-        # Initialize market stats if needed
-        if prediction.market not in accuracy_stats['markets']:
-            accuracy_stats['markets'][prediction.market] = {
-                'total': 0,
-                'open_matches': 0,
-                'close_matches': 0,
-                'jodi_matches': 0
-            }
-        
-        # Update market total
-        accuracy_stats['markets'][prediction.market]['total'] += 1
-        
-        # Check open prediction
-        if result.open and prediction.open_digits:
-            open_str = result.open
-            if len(open_str) == 3:
-                predicted_open = prediction.open_digits
-                actual_open = [int(open_str[0]), int(open_str[2])]
-                if predicted_open == actual_open:
-                    accuracy_stats['open_matches'] += 1
-                    accuracy_stats['markets'][prediction.market]['open_matches'] += 1
-        
-        # Check close prediction
-        if result.close and prediction.close_digits:
-            close_str = result.close
-            if len(close_str) == 3:
-                predicted_close = prediction.close_digits
-                actual_close = [int(close_str[0]), int(close_str[2])]
-                if predicted_close == actual_close:
-                    accuracy_stats['close_matches'] += 1
-                    accuracy_stats['markets'][prediction.market]['close_matches'] += 1
-        
-        # Check jodi prediction
-        if result.jodi and prediction.jodi_list:
-            if result.jodi in prediction.jodi_list:
-                accuracy_stats['jodi_matches'] += 1
-                accuracy_stats['markets'][prediction.market]['jodi_matches'] += 1
+    # The JSON columns hold json.dumps text of string digits ('["1", "3"]'), so the
+    # actual digits are rendered into that same text and compared in the database
+    def _digits_text(panel):
+        first = db.cast(panel // 100, db.String)
+        last = db.cast(panel % 10, db.String)
+        return db.literal('["') + first + '", "' + last + '"]'
+    
+    def _matches(condition):
+        return db.func.sum(db.case((condition, 1), else_=0))
+    
+    market_rows = db.session.query(
+        Prediction.market,
+        db.func.count(),
+        _matches(db.cast(Prediction.open_digits, db.Text) == _digits_text(Result.open_panel)),
+        _matches(db.cast(Prediction.close_digits, db.Text) == _digits_text(Result.close_panel)),
+        _matches(db.cast(Prediction.jodi_list, db.Text).like(db.literal('%"') + Result.jodi + '"%'))
+    ).join(Result, result_join).filter(
+        *date_filter, Result.jodi_num.isnot(None)
+    ).group_by(Prediction.market).all()
+    
+    for market, total, open_matches, close_matches, jodi_matches in market_rows:
+        accuracy_stats['markets'][market] = {
+            'total': total,
+            'open_matches': open_matches or 0,
+            'close_matches': close_matches or 0,
+            'jodi_matches': jodi_matches or 0
+        }
+        for key in ('open_matches', 'close_matches', 'jodi_matches'):
+            accuracy_stats[key] += accuracy_stats['markets'][market][key]
     
     # Calculate overall percentages
     if accuracy_stats['total'] > 0:
@@ -0,0 +1,389 @@
+from collections import Counter
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import Result, MarketStat
+from utils import calculate_digit_fields
+
+
+# Statistics kept per market; every cell counts the results with one value:
+#   total       all results (value 0)
+#   jodi        jodi number 0-99
+#   open_ank    open ank 0-9
+#   close_ank   close ank 0-9
+#   weekday     weekday 0-6 (Monday first) of results with a jodi
+#   transition  previous jodi * 100 + jodi, over consecutive results with a jodi
+STAT_KINDS = ('total', 'jodi', 'open_ank', 'close_ank', 'weekday', 'transition')
+
+# Period of the all-time cells; the other periods are YYYYMM months
+ALL_TIME = 0
+
+# Natural key of a MarketStat cell (unique index idx_market_stat_cell)
+STAT_KEY = ('market', 'kind', 'period', 'value')
+
+# Result columns the statistics are computed from
+SNAPSHOT_COLUMNS = ('id', 'market', 'date', 'jodi_num', 'open_ank', 'close_ank')
+
+# Result columns `calculate_digit_fields` derives the integer columns from
+RESULT_COLUMNS = ('open', 'jodi', 'close')
+
+
+def _period(date):
+    return date.year * 100 + date.month
+
+
+def _add(deltas, market, kind, date, value, sign):
+    """Count one value in the all-time cell and in its month's cell"""
+    deltas[(market, kind, ALL_TIME, value)] += sign
+    deltas[(market, kind, _period(date), value)] += sign
+
+
+def _add_cells(deltas, snapshot, sign):
+    """Count a result in every statistic except the transitions"""
+    market, date = snapshot['market'], snapshot['date']
+    _add(deltas, market, 'total', date, 0, sign)
+    for kind, column in (('jodi', 'jodi_num'), ('open_ank', 'open_ank'), ('close_ank', 'close_ank')):
+        if snapshot[column] is not None:
+            _add(deltas, market, kind, date, snapshot[column], sign)
+    if snapshot['jodi_num'] is not None:
+        _add(deltas, market, 'weekday', date, date.weekday(), sign)
+
+
+def _add_transition(deltas, market, previous, following, sign):
+    """Count the step between two (date, jodi_num) pairs, in the month of the later one"""
+    if previous is None or following is None:
+        return
+    _add(deltas, market, 'transition', following[0], previous[1] * 100 + following[1], sign)
+
+
+def _neighbour(connection, market, date, exclude_ids, after=False):
+    """(date, jodi_num) of the market's nearest result with a jodi before (or after) `date`, skipping `exclude_ids`"""
+    table = Result.__table__
+    query = db.select(table.c.date, table.c.jodi_num).where(
+        table.c.market == market,
+        table.c.jodi_num.isnot(None)
+    )
+    if exclude_ids:
+        query = query.where(table.c.id.notin_(exclude_ids))
+    if after:
+        query = query.where(table.c.date > date).order_by(table.c.date)
+    else:
+        query = query.where(table.c.date < date).order_by(table.c.date.desc())
+    row = connection.execute(query.limit(1)).first()
+    return tuple(row) if row else None
+
+
+def _add_chain(deltas, market, chain, sign):
+    """Count the steps along (date, jodi_num) pairs in date order; None ends are skipped"""
+    for previous, following in zip(chain, chain[1:]):
+        _add_transition(deltas, market, previous, following, sign)
+
+
+def _relink_market(connection, deltas, market, olds, news):
+    """
+    Transition deltas of one market's changed results
+    
+    The changed dates are sorted and split into runs with no unchanged result
+    between them. Around each run the unchanged neighbours are the same before
+    and after the changes, so the run's old steps are uncounted and its new
+    steps counted.
+    """
+    linked = [(-1, old) for old in olds if old['jodi_num'] is not None]
+    linked += [(1, new) for new in news if new['jodi_num'] is not None]
+    if not linked:
+        return
+    
+    # The database holds the new state; every unchanged row is the same in the old one
+    changed_ids = [new['id'] for new in news]
+    dates = sorted({snapshot['date'] for _, snapshot in linked})
+    runs, run, following = [], [], None
+    for date in dates:
+        if run and following is not None and following[0] < date:
+            runs.append((run, following))
+            run = []
+        run.append(date)
+        following = _neighbour(connection, market, date, changed_ids, after=True)
+    runs.append((run, following))
+    
+    for run, following in runs:
+        previous = _neighbour(connection, market, run[0], changed_ids)
+        first, last = run[0], run[-1]
+        for sign in (-1, 1):
+            steps = sorted(
+                (snapshot['date'], snapshot['jodi_num'])
+                for snapshot_sign, snapshot in linked
+                if snapshot_sign == sign and first <= snapshot['date'] <= last
+            )
+            _add_chain(deltas, market, [previous] + steps + [following], sign)
+
+
+def _write_deltas(connection, deltas):
+    """Add non-zero deltas to their cells, creating missing cells"""
+    rows = [dict(zip(STAT_KEY, key), count=count) for key, count in deltas.items() if count]
+    if not rows:
+        return 0
+    
+    table = MarketStat.__table__
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(STAT_KEY),
+            set_={'count': table.c['count'] + stmt.excluded['count']}
+        )
+        connection.execute(stmt, rows)
+        return len(rows)
+    
+    for row in rows:
+        cell = db.and_(*[table.c[key] == row[key] for key in STAT_KEY])
+        updated = connection.execute(table.update().where(cell).values(count=table.c['count'] + row['count']))
+        if updated.rowcount == 0:
+            connection.execute(table.insert(), [row])
+    return len(rows)
+
+
+def apply_result_changes(changes, connection=None, rebuild=()):
+    """
+    Update the statistics for changed results, in the current transaction
+    
+    Every change moves its counts by one, and the transitions are re-linked
+    once per run of neighbouring changed results of a market.
+    
+    Args:
+        changes: List of (old, new) snapshots (dictionaries of SNAPSHOT_COLUMNS);
+            old is None for an inserted result, new None for a deleted one. The
+            database must already hold the new state, and each result may appear
+            in one change only.
+        connection: Connection to write with (defaults to the session's)
+        rebuild: Markets to rebuild instead, for changes without known old values
+    
+    Returns:
+        Number of cells written
+    """
+    connection = connection if connection is not None else db.session.connection()
+    rebuild = set(rebuild)
+    
+    by_market = {}
+    for old, new in changes:
+        for side, snapshot in ((0, old), (1, new)):
+            if snapshot is not None and snapshot['market'] not in rebuild:
+                by_market.setdefault(snapshot['market'], ([], []))[side].append(snapshot)
+    
+    deltas = Counter()
+    for market, (olds, news) in by_market.items():
+        for sign, snapshots in ((-1, olds), (1, news)):
+            for snapshot in snapshots:
+                _add_cells(deltas, snapshot, sign)
+        _relink_market(connection, deltas, market, olds, news)
+    
+    return _write_deltas(connection, deltas) + rebuild_market_stats(rebuild, connection)
+
+
+def rebuild_market_stats(markets=None, connection=None):
+    """
+    Recount the statistics of whole markets from the results table
+    
+    Used for bulk imports and as the fallback of the incremental updates. The
+    caller commits.
+    
+    Args:
+        markets: Market names (defaults to every market with results or statistics)
+        connection: Connection to write with (defaults to the session's)
+    
+    Returns:
+        Number of cells written
+    """
+    connection = connection if connection is not None else db.session.connection()
+    results = Result.__table__
+    table = MarketStat.__table__
+    if markets is None:
+        markets = set(connection.execute(db.select(results.c.market).distinct()).scalars())
+        markets |= set(connection.execute(db.select(table.c.market).distinct()).scalars())
+    
+    written = 0
+    for market in sorted(markets):
+        rows = connection.execute(
+            db.select(*[results.c[column] for column in SNAPSHOT_COLUMNS])
+            .where(results.c.market == market)
+            .order_by(results.c.date)
+        ).mappings()
+    
+        deltas = Counter()
+        previous = None
+        for row in rows:
+            _add_cells(deltas, row, 1)
+            if row['jodi_num'] is not None:
+                current = (row['date'], row['jodi_num'])
+                _add_transition(deltas, market, previous, current, 1)
+                previous = current
+    
+        connection.execute(table.delete().where(table.c.market == market))
+        cells = [dict(zip(STAT_KEY, key), count=count) for key, count in deltas.items() if count]
+        if cells:
+            connection.execute(table.insert(), cells)
+        written += len(cells)
+    return written
+
+
+def result_snapshots(rows):
+    """
+    Statistics snapshots of the stored results for the rows' markets and dates
+    
+    Returns:
+        Dictionary of (market, date) -> snapshot, for the stored rows only
+    """
+    keys = {(row['market'], row['date']) for row in rows}
+    if not keys:
+        return {}
+    
+    table = Result.__table__
+    stored = db.session.connection().execute(
+        db.select(*[table.c[column] for column in SNAPSHOT_COLUMNS])
+        .where(db.tuple_(table.c.market, table.c.date).in_(sorted(keys)))
+    ).mappings()
+    return {(row['market'], row['date']): dict(row) for row in stored}
+
+
+def record_result_writes(rows, before):
+    """
+    Bring the statistics up to date after Result rows were written without the ORM
+    
+    Args:
+        rows: The written rows, each with 'market' and 'date'
+        before: `result_snapshots(rows)` taken before the write
+    """
+    after = result_snapshots(rows)
+    changes = [(before.get(key), after.get(key)) for key in set(before) | set(after)]
+    changes = [(old, new) for old, new in changes if old != new]
+    if changes:
+        apply_result_changes(changes)
+
+
+def _snapshot(result):
+    return {column: getattr(result, column) for column in SNAPSHOT_COLUMNS}
+
+
+def _previous_snapshot(result):
+    """Snapshot of a loaded Result as stored, or None if an old value was never loaded"""
+    state = inspect(result)
+    snapshot = {}
+    for column in SNAPSHOT_COLUMNS:
+        history = state.attrs[column].history
+        if history.deleted:
+            snapshot[column] = history.deleted[0]
+        elif history.added:
+            return None
+        else:
+            snapshot[column] = getattr(result, column)
+    return snapshot
+
+
+def _refresh_digit_fields(result):
+    """Keep the integer columns in step with the result strings"""
+    fields = calculate_digit_fields({column: getattr(result, column) for column in RESULT_COLUMNS})
+    for column, value in fields.items():
+        if getattr(result, column) != value:
+            setattr(result, column, value)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_result_changes(session, flush_context, instances):
+    """Note the Result inserts, edits and deletes of a flush, with their stored values"""
+    changes, rebuild = [], set()
+    with session.no_autoflush:
+        for result in session.new:
+            if isinstance(result, Result):
+                _refresh_digit_fields(result)
+                changes.append((None, result))
+        for result in session.dirty:
+            if isinstance(result, Result) and session.is_modified(result):
+                _refresh_digit_fields(result)
+                old = _previous_snapshot(result)
+                if old is None:
+                    rebuild.add(result.market)
+                else:
+                    changes.append((old, result))
+        for result in session.deleted:
+            if isinstance(result, Result):
+                old = _previous_snapshot(result)
+                if old is None:
+                    rebuild.add(result.market)
+                else:
+                    changes.append((old, None))
+    session.info['result_stat_changes'] = (changes, rebuild)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_result_changes(session, flush_context):
+    """Update the statistics in the flush's transaction, once the rows are written"""
+    changes, rebuild = session.info.pop('result_stat_changes', ([], set()))
+    changes = [(old, _snapshot(new) if new is not None else None) for old, new in changes]
+    changes = [(old, new) for old, new in changes if old != new]
+    if changes or rebuild:
+        apply_result_changes(changes, session.connection(), rebuild)
+
+
+def get_market_stats(kind, market=None, start_date=None, end_date=None):
+    """
+    Counts of one statistic, read from the precomputed cells
+    
+    Args:
+        kind: One of STAT_KINDS
+        market: Market name (None adds up every market)
+        start_date: Optional first date; windows are widened to whole months
+        end_date: Optional last date
+    
+    Returns:
+        Dictionary of value -> count (transition values are previous jodi * 100 + jodi)
+    """
+    if kind not in STAT_KINDS:
+        raise ValueError(f"Unknown statistic: {kind}")
+    
+    query = db.session.query(MarketStat.value, db.func.sum(MarketStat.count)).filter(MarketStat.kind == kind)
+    if market is not None:
+        query = query.filter(MarketStat.market == market)
+    if start_date is None and end_date is None:
+        query = query.filter(MarketStat.period == ALL_TIME)
+    else:
+        query = query.filter(MarketStat.period != ALL_TIME)
+        if start_date is not None:
+            query = query.filter(MarketStat.period >= _period(start_date))
+        if end_date is not None:
+            query = query.filter(MarketStat.period <= _period(end_date))
+    
+    return {int(value): int(count) for value, count in query.group_by(MarketStat.value).all() if count}
+
+
+def get_monthly_counts(kind, market=None):
+    """
+    Counts of one statistic per month, over all its values
+    
+    Args:
+        kind: One of STAT_KINDS
+        market: Market name (None adds up every market)
+    
+    Returns:
+        Dictionary of YYYYMM -> count
+    """
+    if kind not in STAT_KINDS:
+        raise ValueError(f"Unknown statistic: {kind}")
+    
+    query = db.session.query(MarketStat.period, db.func.sum(MarketStat.count)).filter(
+        MarketStat.kind == kind,
+        MarketStat.period != ALL_TIME
+    )
+    if market is not None:
+        query = query.filter(MarketStat.market == market)
+    
+    return {int(period): int(count) for period, count in query.group_by(MarketStat.period).all() if count}
+
+
+def get_market_totals():
+    """Number of stored results per market"""
+    rows = db.session.query(MarketStat.market, MarketStat.count).filter(
+        MarketStat.kind == 'total',
+        MarketStat.period == ALL_TIME,
+        MarketStat.count > 0
+    ).all()
+    return dict(rows)
@@ -0,0 +1,70 @@
+import sys
+import types
+import datetime
+import pandas as pd
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import DeclarativeBase
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+def _app_module():
+    """Just the `app` and `db` of app.py, on an in-memory SQLite database"""
+    module = types.ModuleType('app')
+    module.db = SQLAlchemy(model_class=Base)
+    module.app = Flask('app')
+    module.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    module.db.init_app(module.app)
+    return module
+
+
+# app.py also wires up the blueprints, scheduler and push notifications; models
+# and services only need its extensions
+sys.modules.setdefault('app', _app_module())
+
+
+@pytest.fixture
+def db():
+    """Empty database with every table, inside an application context"""
+    from app import app, db
+    import models
+    import services.stats_service
+
+    with app.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def model_dirs(tmp_path, monkeypatch):
+    """Registry, feature cache and tuning files under a temporary directory"""
+    from ml import feature_store, model_registry, tuning
+
+    monkeypatch.setattr(model_registry, 'LEGACY_MODEL_DIR', str(tmp_path))
+    monkeypatch.setattr(model_registry, 'REGISTRY_DIR', str(tmp_path / 'registry'))
+    monkeypatch.setattr(feature_store, 'FEATURE_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(tuning, 'TUNING_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def history():
+    """Builder of daily results whose jodis cycle through every digit, with an 'Off' day every `off_every` days"""
+    def build(days, off_every=7, start=datetime.date(2024, 1, 1), market='Kalyan'):
+        dates = [start + datetime.timedelta(days=i) for i in range(days)]
+        jodis = ['Off' if i % off_every == off_every - 1 else f"{(i * 37) % 100:02d}" for i in range(days)]
+        return pd.DataFrame({
+            'Date': [d.strftime('%d/%m/%Y') for d in dates],
+            'Market': market,
+            'Jodi': jodis,
+            'day_of_week': [d.strftime('%A') for d in dates],
+            'open_sum': [float(i % 28) for i in range(days)],
+            'close_sum': [float((i * 5) % 28) for i in range(days)]
+        })
+    return build
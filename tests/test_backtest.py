@@ -0,0 +1,74 @@
+import datetime
+import pandas as pd
+import pytest
+from ml import backtest
+from utils import is_matching_prediction
+
+# What the stubbed predictor always predicts (string digits, as the real one returns)
+FIXED_PREDICTION = {
+    'open_digits': ['1', '3'],
+    'close_digits': ['4', '6'],
+    'jodi_list': ['69', '05'],
+    'patti_list': ['123'],
+}
+
+
+def _write_history(path):
+    """40 days of one market: 30 warm-up days, 5 days matching FIXED_PREDICTION, 5 missing it"""
+    rows = []
+    start = datetime.date(2024, 1, 1)
+    for i in range(40):
+        if i < 30:
+            result = ('555', '55', '555')
+        elif i < 35:
+            result = ('123', '69', '456')
+        else:
+            result = ('789', '70', '000')
+        date = start + datetime.timedelta(days=i)
+        rows.append({'Date': date.strftime('%d/%m/%Y'), 'Market': 'Kalyan',
+                     'Open': result[0], 'Jodi': result[1], 'Close': result[2]})
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def test_string_digits_match_int_actuals():
+    matches = is_matching_prediction(FIXED_PREDICTION, {'open': '123', 'close': '456', 'jodi': '69'})
+    assert matches == {'open': True, 'close': True, 'jodi': True, 'patti_open': True, 'patti_close': False}
+
+    # Int digits, as older callers passed them, still compare the same way
+    int_prediction = dict(FIXED_PREDICTION, open_digits=[1, 3], close_digits=[4, 7])
+    matches = is_matching_prediction(int_prediction, {'open': '123', 'close': '456', 'jodi': '05'})
+    assert (matches['open'], matches['close'], matches['jodi']) == (True, False, True)
+
+    # 'Off' results are not scored
+    assert 'open' not in is_matching_prediction(FIXED_PREDICTION, {'open': 'Off', 'jodi': '69'})
+
+
+def test_replay_hit_rates(tmp_path, monkeypatch):
+    csv_path = tmp_path / 'history.csv'
+    _write_history(csv_path)
+    monkeypatch.setattr(backtest, 'predictions_from_engine', lambda engine, rng: dict(FIXED_PREDICTION))
+
+    history = backtest.load_history(str(csv_path))
+    daily = backtest.backtest_market('Kalyan', history, window=60, min_history=30)
+    assert len(daily) == 10
+    assert daily['open'].tolist() == [True] * 5 + [False] * 5
+
+    summary = backtest.summarize(daily)
+    for market in ('Kalyan', 'All'):
+        row = summary.loc[market]
+        assert row['days'] == 10
+        assert row['open_hit_rate'] == pytest.approx(50.0)
+        assert row['close_hit_rate'] == pytest.approx(50.0)
+        assert row['jodi_hit_rate'] == pytest.approx(50.0)
+        assert row['patti_open_hit_rate'] == pytest.approx(50.0)
+        assert row['patti_close_hit_rate'] == pytest.approx(0.0)
+
+
+def test_replay_is_deterministic(tmp_path):
+    csv_path = tmp_path / 'history.csv'
+    _write_history(csv_path)
+    history = backtest.load_history(str(csv_path))
+
+    first = backtest.backtest_market('Kalyan', history)
+    second = backtest.backtest_market('Kalyan', history)
+    pd.testing.assert_frame_equal(first, second)
@@ -0,0 +1,67 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from ml.cross_market import CrossMarketMatrix, market_order
+
+MARKETS = ['Main Bazar', 'Kalyan', 'Time Bazar', 'Other']
+
+
+def _results(days, seed):
+    """Shuffled results of several markets with missing days and 'Off' jodis"""
+    rng = np.random.default_rng(seed)
+    start = datetime.date(2024, 1, 1)
+    rows = []
+    for market in MARKETS:
+        for i in range(days):
+            if rng.random() < 0.2:
+                continue
+            jodi = 'Off' if rng.random() < 0.1 else f"{rng.integers(0, 100):02d}"
+            rows.append((start + datetime.timedelta(days=i), market, jodi))
+    rows = [rows[i] for i in rng.permutation(len(rows))]
+    return pd.DataFrame({
+        'Date': [d.strftime('%d/%m/%Y') for d, _, _ in rows],
+        'Market': [m for _, m, _ in rows],
+        'Jodi': [j for _, _, j in rows]
+    }), rows
+
+
+def test_markets_are_ordered_by_close_time():
+    assert market_order(MARKETS) == ['Time Bazar', 'Kalyan', 'Main Bazar', 'Other']
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_pivot_aligns_every_result_with_its_date_and_market(seed):
+    df, rows = _results(30, seed)
+    cross = CrossMarketMatrix.from_frame(df)
+    assert cross.markets == market_order(MARKETS)
+    assert list(cross.dates) == sorted({np.datetime64(d, 'D') for d, _, _ in rows})
+
+    expected = np.full(cross.digits.shape, -1)
+    for date, market, jodi in rows:
+        if jodi != 'Off':
+            i = list(cross.dates).index(np.datetime64(date, 'D'))
+            expected[i, cross.markets.index(market)] = [int(jodi[0]), int(jodi[1])]
+    np.testing.assert_array_equal(cross.digits, expected)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_features_only_use_results_known_at_close(seed):
+    df, rows = _results(30, seed)
+    cross = CrossMarketMatrix.from_frame(df)
+    dates = [datetime.date(2024, 1, 1) + datetime.timedelta(days=i) for i in range(32)]
+    others = ['Time Bazar', 'Main Bazar', 'Other']
+    features = cross.features('Kalyan', dates).reshape(len(dates), len(others), 2)
+
+    # Time Bazar closes before Kalyan, so its same-day result is known; Main Bazar
+    # and unconfigured markets close later, so only earlier days count
+    for i, date in enumerate(dates):
+        for j, other in enumerate(others):
+            same_day = other == 'Time Bazar'
+            known = sorted((d, jodi) for d, market, jodi in rows
+                           if market == other and jodi != 'Off' and (d <= date if same_day else d < date))
+            expected = [int(known[-1][1][0]), int(known[-1][1][1])] if known else [-1, -1]
+            assert features[i, j].tolist() == expected, (date, other)
+
+    names = cross.feature_names('Kalyan')
+    assert names == [f'cross_{other}_{side}' for other in others for side in ('open', 'close')]
@@ -0,0 +1,139 @@
+import datetime
+import pandas as pd
+import pytest
+from models import MarketStat, Prediction, Result
+from ml.results_store import load_results_store, segment_paths
+from services import data_service
+from services.data_service import DIGIT_FRAME_COLUMNS, load_results_frame, upsert_rows
+from services.stats_service import rebuild_market_stats
+from utils import calculate_statistics
+
+
+def _add(db, market, day, open_, jodi, close):
+    db.session.add(Result(date=datetime.date(2024, 1, day), market=market, open=open_, jodi=jodi, close=close))
+
+
+def test_results_frame_has_integer_digit_columns(db):
+    _add(db, 'Kalyan', 1, '123', '69', '450')
+    _add(db, 'Kalyan', 2, 'Off', 'Off', 'Off')
+    _add(db, 'Milan', 1, '007', '70', '999')
+    db.session.commit()
+
+    df = load_results_frame()
+    for col in DIGIT_FRAME_COLUMNS:
+        assert df[col].dtype == 'Int16'
+    assert df[list(DIGIT_FRAME_COLUMNS)].iloc[0].tolist() == [123, 6, 69, 9, 450]
+    assert df[list(DIGIT_FRAME_COLUMNS)].iloc[1].isna().all()
+    assert df[list(DIGIT_FRAME_COLUMNS)].iloc[2].tolist() == [7, 7, 70, 7, 999]
+
+    # The strings are still there for the pipeline
+    assert df['Jodi'].tolist() == ['69', 'Off', '70']
+
+
+def _row(day, jodi, open_='123', close='450', market='Kalyan'):
+    return {'date': datetime.date(2024, 1, day), 'market': market, 'open': open_, 'jodi': jodi, 'close': close}
+
+
+def test_upsert_rows_inserts_and_updates_on_the_unique_constraint(db):
+    assert upsert_rows(Result, [_row(1, '69'), _row(2, 'Off', 'Off', 'Off')]) == 2
+    db.session.commit()
+
+    # Existing rows are updated in place, new ones inserted
+    upsert_rows(Result, [_row(1, '70'), _row(3, '11'), _row(1, '12', market='Milan')])
+    db.session.commit()
+    stored = {(r.market, r.date.day): r.jodi for r in Result.query.all()}
+    assert stored == {('Kalyan', 1): '70', ('Kalyan', 2): 'Off', ('Kalyan', 3): '11', ('Milan', 1): '12'}
+
+    # fill_columns only replace missing values
+    upsert_rows(Result, [_row(1, '99'), _row(2, '45')], fill_columns=('jodi',))
+    db.session.commit()
+    assert [r.jodi for r in Result.query.filter_by(market='Kalyan').order_by(Result.date)] == ['70', '45', '11']
+
+
+def test_upsert_rows_can_keep_existing_predictions(db):
+    prediction = {'date': datetime.date(2024, 1, 1), 'market': 'Kalyan', 'jodi_list': ['12']}
+    upsert_rows(Prediction, [prediction])
+    upsert_rows(Prediction, [dict(prediction, jodi_list=['34'])], update=False)
+    db.session.commit()
+    assert [p.jodi_list for p in Prediction.query.all()] == [['12']]
+
+
+def test_sync_results_store_appends_written_rows(db, tmp_path, monkeypatch):
+    path = str(tmp_path / 'results.arrow')
+    monkeypatch.setattr(data_service, 'RESULTS_STORE_PATH', path)
+    upsert_rows(Result, [_row(1, '69'), _row(2, '70')])
+    db.session.commit()
+    data_service.sync_results_store()
+    assert segment_paths(path) == []
+
+    rows = [_row(2, '71'), _row(3, '11')]
+    upsert_rows(Result, rows)
+    db.session.commit()
+    data_service.sync_results_store(rows)
+
+    assert len(segment_paths(path)) == 1
+    assert load_results_store(path).jodi.tolist() == [69, 71, 11]
+    assert data_service.load_market_history('Kalyan')['Jodi'].tolist() == ['69', '71', '11']
+
+
+def test_result_statistics_match_the_dataframe_version(db):
+    rows = [_row(1, '69'), _row(2, 'Off', 'Off', 'Off'), _row(3, '69', '160', '577'),
+            _row(1, '70', '007', '999', market='Milan')]
+    for row in rows:
+        row['day_of_week'] = row['date'].strftime('%A')
+        row['open_sum'] = float(sum(map(int, row['open']))) if row['open'].isdigit() else None
+        row['close_sum'] = float(sum(map(int, row['close']))) if row['close'].isdigit() else None
+        db.session.add(Result(**row))
+    db.session.commit()
+
+    df = pd.DataFrame({
+        'Date': [row['date'].strftime('%d/%m/%Y') for row in rows],
+        'Market': [row['market'] for row in rows],
+        'day_of_week': [row['day_of_week'] for row in rows],
+        'open_sum': [row['open_sum'] for row in rows],
+        'close_sum': [row['close_sum'] for row in rows],
+        'jodi': [row['jodi'] if row['jodi'] != 'Off' else None for row in rows]
+    })
+    assert calculate_statistics() == calculate_statistics(df)
+    assert calculate_statistics(market='Milan')['common_jodis'] == {'70': 1}
+
+
+RESULT_FIELDS = [column.name for column in Result.__table__.columns if column.name not in ('id', 'created_at', 'updated_at')]
+
+
+def _stored_results():
+    return sorted(tuple(getattr(result, name) for name in RESULT_FIELDS) for result in Result.query.all())
+
+
+def _import_fresh(db, csv_path, chunk_rows):
+    """Import the CSV into a table holding only the one pre-existing result"""
+    Result.query.delete()
+    MarketStat.query.delete()
+    db.session.add(Result(date=datetime.date(2021, 1, 4), market='Time Bazar', open='000', jodi='00', close='000'))
+    rebuild_market_stats()
+    db.session.commit()
+    progress = []
+    stats = data_service.import_csv_data(csv_path, chunk_rows, lambda *counts: progress.append(counts))
+    cells = sorted((s.market, s.kind, s.period, s.value, s.count) for s in MarketStat.query.all() if s.count)
+    return stats, progress, _stored_results(), cells
+
+
+def test_chunked_csv_import_matches_a_single_shot_import(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_service, 'RESULTS_STORE_PATH', str(tmp_path / 'results.arrow'))
+    lines = open('enhanced_satta_data.csv').read().splitlines()[:301]
+    # A repeated row and a row with an unparseable date
+    lines += [lines[10], 'not a date' + lines[20][10:]]
+    csv_path = tmp_path / 'import.csv'
+    csv_path.write_text('\n'.join(lines) + '\n')
+
+    chunked = _import_fresh(db, str(csv_path), 37)
+    single = _import_fresh(db, str(csv_path), 10000)
+
+    assert chunked[0] == single[0] == {'read': 302, 'inserted': 299, 'existing': 2, 'invalid': 1}
+    assert len(chunked[1]) == 9 and chunked[1][-1] == (302, 299)
+    assert chunked[2:] == single[2:]
+
+    # The pre-existing result was left as it was
+    kept = Result.query.filter_by(market='Time Bazar', date=datetime.date(2021, 1, 4)).one()
+    assert (kept.open, kept.jodi, kept.close) == ('000', '00', '000')
+    assert Result.query.filter_by(market='Time Bazar', date=datetime.date(2021, 1, 5)).one().jodi_num == 60
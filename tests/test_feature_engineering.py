@@ -0,0 +1,94 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from ml.feature_engineering import DAYS, FeaturePipeline
+
+
+def _baseline_features(recent_df):
+    """The feature frame train_model built before the feature pipeline"""
+    feature_df = recent_df[[col for col in recent_df.columns if col != 'is_holiday']].copy()
+    for col in feature_df.columns:
+        if feature_df[col].dtype == np.float64 or feature_df[col].dtype == np.int64:
+            feature_df[col] = feature_df[col].fillna(0)
+        else:
+            feature_df[col] = feature_df[col].fillna('')
+
+    feature_df['jodi_numeric'] = feature_df['Jodi'].apply(lambda x: int(str(x).zfill(2)) if x and not pd.isna(x) else 0)
+    feature_df['prev_jodi'] = feature_df['jodi_numeric'].shift(1)
+    feature_df['jodi_distance'] = abs(feature_df['jodi_numeric'] - feature_df['prev_jodi'])
+    feature_df['jodi_first_digit'] = feature_df['Jodi'].apply(lambda x: int(str(x).zfill(2)[0]) if x and not pd.isna(x) else 0)
+    feature_df['jodi_second_digit'] = feature_df['Jodi'].apply(lambda x: int(str(x).zfill(2)[1]) if x and not pd.isna(x) else 0)
+    feature_df['prev_jodi_first'] = feature_df['jodi_first_digit'].shift(1)
+    feature_df['prev_jodi_second'] = feature_df['jodi_second_digit'].shift(1)
+    feature_df['is_flip'] = (
+        (feature_df['jodi_first_digit'] == feature_df['prev_jodi_second']) &
+        (feature_df['jodi_second_digit'] == feature_df['prev_jodi_first'])
+    ).astype(int)
+    feature_df['near_miss_first'] = abs(feature_df['jodi_first_digit'] - feature_df['prev_jodi_first'])
+    feature_df['near_miss_second'] = abs(feature_df['jodi_second_digit'] - feature_df['prev_jodi_second'])
+    feature_df['is_near_miss'] = (
+        (feature_df['near_miss_first'] <= 1) &
+        (feature_df['near_miss_second'] <= 1) &
+        ((feature_df['near_miss_first'] > 0) | (feature_df['near_miss_second'] > 0))
+    ).astype(int)
+    for digit in range(10):
+        feature_df[f'first_digit_{digit}_freq'] = feature_df['jodi_first_digit'].rolling(
+            window=7, min_periods=1
+        ).apply(lambda x: (x == digit).sum())
+        feature_df[f'second_digit_{digit}_freq'] = feature_df['jodi_second_digit'].rolling(
+            window=7, min_periods=1
+        ).apply(lambda x: (x == digit).sum())
+    feature_df['jodi_7day_avg'] = feature_df['jodi_numeric'].rolling(window=7, min_periods=1).mean()
+    feature_df['jodi_7day_std'] = feature_df['jodi_numeric'].rolling(window=7, min_periods=1).std()
+    feature_df['jodi_trend'] = feature_df['jodi_numeric'].diff()
+    for col in feature_df.columns:
+        if feature_df[col].dtype == np.float64 or feature_df[col].dtype == np.int64:
+            feature_df[col] = feature_df[col].fillna(0)
+
+    if 'day_of_week' in feature_df.columns and feature_df['day_of_week'].dtype == object:
+        for day in feature_df['day_of_week'].unique():
+            feature_df[f'day_{day}'] = (feature_df['day_of_week'] == day).astype(int)
+        feature_df = feature_df.drop('day_of_week', axis=1)
+    return feature_df.drop([col for col in feature_df.columns if feature_df[col].dtype == object], axis=1)
+
+
+def _history(days, seed):
+    rng = np.random.default_rng(seed)
+    start = datetime.date(2024, 1, 1) + datetime.timedelta(days=int(rng.integers(0, 7)))
+    dates = [start + datetime.timedelta(days=i) for i in range(days)]
+    return pd.DataFrame({
+        'Date': [d.strftime('%d/%m/%Y') for d in dates],
+        'Market': 'Kalyan',
+        'Jodi': [f"{j:02d}" for j in rng.integers(0, 100, size=days)],
+        'day_of_week': [d.strftime('%A') for d in dates],
+        'open_sum': rng.integers(0, 28, size=days).astype(float),
+        'close_sum': rng.integers(0, 28, size=days).astype(float)
+    })
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_features_are_identical_to_the_baseline_builder(seed):
+    df = _history(60, seed)
+    baseline = _baseline_features(df)
+    pipeline = FeaturePipeline().fit(df)
+
+    assert pipeline.columns == list(baseline.columns)
+    np.testing.assert_array_equal(pipeline.transform(df), baseline.to_numpy(dtype=float))
+    np.testing.assert_allclose(pipeline.transform_one(df), baseline.to_numpy(dtype=float)[-1], atol=1e-9)
+
+    restored = FeaturePipeline.from_config(pipeline.get_config())
+    np.testing.assert_array_equal(restored.transform(df), pipeline.transform(df))
+
+
+def test_pipelines_saved_without_fitted_days_keep_the_calendar_order():
+    df = _history(30, 0)
+    pipeline = FeaturePipeline().fit(df)
+    del pipeline.days
+    config = pipeline.get_config()
+    del config['days']
+
+    for old in (pipeline, FeaturePipeline.from_config(config)):
+        assert old.columns[-len(DAYS):] == [f'day_{day}' for day in DAYS]
+        days = old.transform_frame(df)[[f'day_{day}' for day in DAYS]]
+        assert (days.idxmax(axis=1) == 'day_' + df['day_of_week']).all()
@@ -0,0 +1,87 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from ml import feature_store
+from ml.feature_engineering import FeaturePipeline
+from ml.feature_store import FEATURE_LOOKBACK, _compute, _extend, cross_hashes, get_features
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(feature_store, 'FEATURE_CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _history(days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = [datetime.date(2024, 1, 1) + datetime.timedelta(days=i) for i in range(days)]
+    jodis = [f"{j:02d}" if rng.random() > 0.1 else 'Off' for j in rng.integers(0, 100, size=days)]
+    return pd.DataFrame({
+        'Date': [d.strftime('%d/%m/%Y') for d in dates],
+        'Market': 'Kalyan',
+        'Jodi': jodis,
+        'day_of_week': [d.strftime('%A') for d in dates],
+        'open_sum': rng.integers(0, 28, size=days).astype(float),
+        'close_sum': rng.integers(0, 28, size=days).astype(float)
+    })
+
+
+def _assert_same_features(feature_set, expected):
+    assert feature_set.key == expected.key
+    assert feature_set.columns == expected.columns
+    np.testing.assert_allclose(feature_set.features, expected.features, atol=1e-9)
+    np.testing.assert_array_equal(feature_set.targets, expected.targets)
+
+
+def _features(df, pipeline):
+    df = df.reset_index(drop=True)
+    return df, cross_hashes(df, pipeline, None)
+
+
+@pytest.mark.parametrize('start, end', [(0, 130), (5, 125), (5, 130), (40, 100), (100 - FEATURE_LOOKBACK - 1, 130)])
+def test_extend_matches_a_full_recompute(start, end):
+    df = _history(130)
+    pipeline = FeaturePipeline().fit(df)
+    cached_df, cached_hashes = _features(df.iloc[:100], pipeline)
+    cached = _compute(cached_df, cached_hashes, pipeline)
+
+    frame, hashes = _features(df.iloc[start:end], pipeline)
+    extended = _extend(cached, frame, hashes, pipeline)
+    assert extended is not None
+    _assert_same_features(extended, _compute(frame, hashes, pipeline))
+
+
+def test_extend_refuses_frames_it_cannot_continue():
+    df = _history(130)
+    pipeline = FeaturePipeline().fit(df)
+    cached_df, cached_hashes = _features(df.iloc[:100], pipeline)
+    cached = _compute(cached_df, cached_hashes, pipeline)
+
+    # Too little overlap left to cover the lookback, a frame starting outside the
+    # cache, and a cached row that was edited
+    for frame in (df.iloc[100 - FEATURE_LOOKBACK:130], df.iloc[110:130]):
+        assert _extend(cached, *_features(frame, pipeline), pipeline) is None
+    edited = df.iloc[10:120].copy()
+    edited.loc[50, 'Jodi'] = '00' if edited.loc[50, 'Jodi'] != '00' else '01'
+    assert _extend(cached, *_features(edited, pipeline), pipeline) is None
+
+
+def test_get_features_serves_and_extends_the_cache(cache_dir, monkeypatch):
+    df = _history(130, seed=1)
+    pipeline = FeaturePipeline().fit(df)
+    first = get_features(df.iloc[:100], 'Kalyan', pipeline)
+    assert get_features(df.iloc[:100], 'Kalyan', pipeline).key == first.key
+
+    # The next day's window continues the cached one instead of being recomputed
+    computed = []
+    monkeypatch.setattr(feature_store, '_compute', lambda *args: computed.append(args) or _compute(*args))
+    slid = get_features(df.iloc[1:101], 'Kalyan', pipeline)
+    assert computed == []
+    frame, hashes = _features(df.iloc[1:101], pipeline)
+    _assert_same_features(slid, _compute(frame, hashes, pipeline))
+    assert feature_store.load_cached_features('Kalyan').key == slid.key
+
+    # An unrelated frame is rebuilt
+    get_features(_history(60, seed=2), 'Kalyan', pipeline)
+    assert len(computed) == 1
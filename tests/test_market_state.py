@@ -0,0 +1,59 @@
+import datetime
+import numpy as np
+import pandas as pd
+from ml.market_state import MarketState
+
+ENGINE_ARRAYS = ('first_digit_hist', 'second_digit_hist', 'jodi_counts', 'distances',
+                 'sum_patti_counts', 'diff_patti_counts')
+
+
+def _history(days, seed=0):
+    """Results on random days (weekend and longer gaps included), some of them 'Off'"""
+    rng = np.random.default_rng(seed)
+    dates = datetime.date(2024, 1, 1) + np.cumsum(rng.choice([1, 1, 1, 2, 3, 9], size=days)) * datetime.timedelta(days=1)
+    jodis = [f"{j:02d}" if rng.random() > 0.1 else 'Off' for j in rng.integers(0, 100, size=days)]
+    return pd.DataFrame({'Date': [d.strftime('%d/%m/%Y') for d in dates], 'Jodi': jodis})
+
+
+def _assert_same_state(state, expected):
+    assert list(state.dates) == list(expected.dates)
+    assert list(state.jodis) == list(expected.jodis)
+    for name in ENGINE_ARRAYS:
+        np.testing.assert_array_equal(getattr(state.engine, name), getattr(expected.engine, name), err_msg=name)
+    np.testing.assert_array_equal(np.asarray(state.engine.recent_jodis), np.asarray(expected.engine.recent_jodis))
+    assert state.engine.latest_jodi == expected.engine.latest_jodi
+
+
+def test_push_matches_rebuild_over_calendar_window():
+    df = _history(200)
+    state = MarketState('Kalyan', window=60)
+    for i, row in enumerate(df.itertuples(index=False)):
+        assert state.push(row.Date, row.Jodi)
+        _assert_same_state(state, MarketState.from_dataframe(df.iloc[:i + 1], 'Kalyan', window=60))
+
+
+def test_window_keeps_last_sixty_calendar_days():
+    df = _history(120, seed=1)
+    state = MarketState.from_dataframe(df, 'Kalyan', window=60)
+    last = state.last_date
+    assert all(last - date <= datetime.timedelta(days=60) for date in state.dates)
+    assert len(state) <= 60
+
+    # The dropped rows are exactly those older than the window
+    dates = pd.to_datetime(df['Date'], format='%d/%m/%Y').dt.date
+    assert len(state) == min(60, int((dates >= last - datetime.timedelta(days=60)).sum()))
+
+
+def test_snapshot_round_trip(tmp_path):
+    df = _history(90, seed=2)
+    state = MarketState.from_dataframe(df, 'Kalyan')
+    path = state.save(str(tmp_path / 'state.npz'))
+
+    loaded = MarketState.load('Kalyan', path)
+    _assert_same_state(loaded, state)
+
+    # The loaded state keeps sliding like the original
+    next_date = state.last_date + datetime.timedelta(days=1)
+    for target in (state, loaded):
+        target.push(next_date, '45')
+    _assert_same_state(loaded, state)
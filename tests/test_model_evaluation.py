@@ -0,0 +1,50 @@
+import numpy as np
+from ml import feature_store, model_evaluation, trainer
+from ml.inference import ModelBundle
+from ml.model_registry import current_bundle_path
+
+
+def test_evaluation_rows_come_after_the_training_rows(model_dirs, history):
+    df = history(100)
+    trainer.train_model(df.head(80), 'Kalyan')
+    X_train, _ = feature_store.training_pairs(feature_store.load_cached_features('Kalyan'))
+    bundle = ModelBundle('Kalyan', current_bundle_path('Kalyan'))
+    assert bundle.info['last_date'] == '2024-03-20'
+
+    # Nothing is held out until results come in after the training window
+    X, Y = model_evaluation.test_matrix(df.head(80), 'Kalyan', bundle)
+    assert len(X) == len(Y) == 0
+
+    X, Y = model_evaluation.test_matrix(df, 'Kalyan', bundle)
+    held_out = [int(jodi) for jodi in df['Jodi'].iloc[80:] if jodi != 'Off']
+    assert Y[:, 2].tolist() == held_out
+    assert not any((X_train == row).all(axis=1).any() for row in X)
+
+    report = model_evaluation.evaluate_market('Kalyan', df)
+    assert report['rows'] == len(held_out)
+    assert np.isfinite(report['jodi']['accuracy'])
+
+
+def test_importance_is_measured_on_held_out_rows(model_dirs, history):
+    df = history(100)
+    # A constant column: shuffling or ablating it cannot change any prediction
+    df['close_sum'] = 5.0
+    trainer.train_model(df.head(80), 'Kalyan')
+    assert model_evaluation.permutation_importance('Kalyan', df.head(80), cpu_budget=1) is None
+
+    importance = model_evaluation.permutation_importance('Kalyan', df, n_repeats=2, cpu_budget=1)
+    columns = ModelBundle('Kalyan', current_bundle_path('Kalyan')).feature_columns
+    assert len(importance) == len(model_evaluation.MODEL_TARGETS) * len(columns)
+    constant = importance[importance['feature'] == 'close_sum']
+    assert (constant['importance_mean'] == 0).all() and (constant['importance_std'] == 0).all()
+    assert 'close_sum' in model_evaluation.low_importance_features(importance)
+
+    ablation = model_evaluation.group_ablation('Kalyan', df, cpu_budget=1)
+    groups = model_evaluation.feature_groups(columns)
+    assert len(ablation) == len(model_evaluation.MODEL_TARGETS) * len(groups)
+    # Ablation and permutation share the held-out baseline
+    baselines = importance.groupby('model_type')['baseline'].first()
+    assert (ablation['baseline'] == ablation['model_type'].map(baselines)).all()
+
+    tables = model_evaluation.importance_registry({'Kalyan': df}, cpu_budget=1, output_dir=str(model_dirs))
+    assert (tables[0]['market'] == 'Kalyan').all() and len(tables[1]) == len(ablation)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from xgboost import XGBClassifier
+from ml.model_export import CompactModel, export_compact
+
+
+@pytest.fixture(scope='module')
+def bundle():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 12)) * rng.uniform(0.5, 20, size=12)
+    scaler = StandardScaler().fit(X)
+    scaled = scaler.transform(X)
+
+    # Digits depend on the features so the trees have real splits; the jodis
+    # only use some of the 100 classes
+    open_digits = (np.abs(scaled[:, 0] * 3 + scaled[:, 1]) * 2).astype(int) % 10
+    close_digits = rng.integers(0, 10, size=len(X))
+    jodis = rng.choice([3, 17, 42, 58, 70, 99], size=len(X))
+    return {
+        'open_model': XGBClassifier(n_estimators=20, max_depth=3).fit(scaled, open_digits),
+        'close_model': XGBClassifier(n_estimators=20, max_depth=3).fit(scaled, close_digits),
+        'jodi_model': RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(scaled, jodis),
+        'scaler': scaler,
+        'feature_columns': [f'f{i}' for i in range(X.shape[1])],
+        'info': {'market': 'Kalyan'},
+        'rows': rng.normal(size=(50, 12)) * rng.uniform(0.5, 20, size=12)
+    }
+
+
+def test_compact_model_matches_the_estimators(bundle, tmp_path):
+    model = CompactModel(export_compact(str(tmp_path / 'model.compact.npz'), bundle))
+    assert model.feature_columns == bundle['feature_columns']
+    assert model.info == {'market': 'Kalyan'}
+
+    for row in bundle['rows']:
+        x = bundle['scaler'].transform(row[None, :])
+        np.testing.assert_allclose(model.scale_row(row), x[0])
+
+        probabilities = model.predict_probabilities(row)
+        jodi = np.zeros(100)
+        jodi[bundle['jodi_model'].classes_] = bundle['jodi_model'].predict_proba(x)[0]
+        np.testing.assert_allclose(probabilities['jodi'], jodi, atol=1e-6)
+        for name in ('open', 'close'):
+            np.testing.assert_allclose(probabilities[name], bundle[f'{name}_model'].predict_proba(x)[0], atol=1e-6)
+
+
+def test_forest_walk_handles_threshold_ties(bundle, tmp_path):
+    model = CompactModel(export_compact(str(tmp_path / 'model.compact.npz'), bundle))
+    forest = bundle['jodi_model']
+
+    # Rows sitting exactly on split thresholds must take the same branch as sklearn
+    tree = forest.estimators_[0].tree_
+    splits = np.flatnonzero(tree.children_left != -1)[:len(bundle['rows'])]
+    x = bundle['scaler'].transform(bundle['rows'][:len(splits)])
+    x[np.arange(len(splits)), tree.feature[splits]] = tree.threshold[splits]
+    for row in x:
+        np.testing.assert_allclose(model.forest_probabilities(row), forest.predict_proba(row[None, :])[0], atol=1e-6)
@@ -0,0 +1,25 @@
+from ml import model_registry
+
+
+def _legacy_run(model_dir, market, timestamp):
+    paths = [model_dir / f"{market}_{kind}_{timestamp}.pkl" for kind in model_registry.LEGACY_KINDS]
+    for path in paths:
+        path.write_bytes(b'')
+    return paths
+
+
+def test_legacy_pickles_removed_once_registry_has_a_version(tmp_path, monkeypatch):
+    registry_dir = tmp_path / 'registry'
+    monkeypatch.setattr(model_registry, 'REGISTRY_DIR', str(registry_dir))
+    monkeypatch.setattr(model_registry, 'LEGACY_MODEL_DIR', str(tmp_path))
+
+    old_runs = _legacy_run(tmp_path, 'Kalyan', '20240101_120000') + _legacy_run(tmp_path, 'Kalyan', '20240201_120000')
+    others = _legacy_run(tmp_path, 'Kalyan_open', '20240101_120000') + _legacy_run(tmp_path, 'Milan', '20240101_120000')
+
+    objects = {key: None for key in model_registry.BUNDLE_KEYS}
+    objects['info'] = {'open_accuracy': 0.1}
+    version, path = model_registry.save_bundle('Kalyan', objects)
+
+    assert model_registry.current_version('Kalyan') == version
+    assert not any(p.exists() for p in old_runs)
+    assert all(p.exists() for p in others)
@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+from ml.pattern_engine import NEAR_MISS_KERNEL, NUM_JODIS, SMOOTHING, PatternEngine, encode_jodis, encode_pattis, top_k
+from ml.predictor import JODI_LIST_SIZE, predictions_from_engine
+
+
+def _baseline_counts(jodis, pattis=None):
+    """The string-keyed dictionaries the predictor built before the pattern engine"""
+    first_digit, second_digit, jodi_freq, patti_freq = {}, {}, {}, {}
+    distances, near_miss = {}, {}
+    for i in range(1, len(jodis)):
+        jodi, prev_jodi = jodis[i], jodis[i - 1]
+        if jodi is not None:
+            first_digit[int(jodi[0])] = first_digit.get(int(jodi[0]), 0) + 1
+            second_digit[int(jodi[1])] = second_digit.get(int(jodi[1]), 0) + 1
+            jodi_freq[jodi] = jodi_freq.get(jodi, 0) + 1
+            days_ago = len(jodis) - i
+            if days_ago <= 7:
+                jodi_freq[jodi] += 0.5 * (8 - days_ago) / 7
+            if prev_jodi is not None:
+                key = f"{prev_jodi}:dist:{abs(int(jodi) - int(prev_jodi))}"
+                distances[key] = distances.get(key, 0) + 1
+            for d1_diff in range(-4, 5):
+                for d2_diff in range(-4, 5):
+                    if d1_diff == 0 and d2_diff == 0:
+                        continue
+                    if abs(d1_diff) <= 1 and abs(d2_diff) <= 1:
+                        weight = 0.3
+                    elif abs(d1_diff) <= 2 and abs(d2_diff) <= 2:
+                        weight = 0.2
+                    else:
+                        weight = 0.1
+                    near = f"{(int(jodi[0]) + d1_diff) % 10}{(int(jodi[1]) + d2_diff) % 10}"
+                    key = f"{jodi}->near:{near}"
+                    near_miss[key] = near_miss.get(key, 0) + weight
+                    jodi_freq[near] = jodi_freq.get(near, 0) + weight * 0.5
+        if pattis is not None and pattis[i] is not None:
+            patti = ''.join(sorted(pattis[i]))
+            patti_freq[patti] = patti_freq.get(patti, 0) + 1
+        elif jodi is not None:
+            for middle, weight in (((int(jodi[0]) + int(jodi[1])) % 10, 0.8),
+                                   (abs(int(jodi[0]) - int(jodi[1])) % 10, 0.6)):
+                patti = ''.join(sorted(f"{jodi[0]}{middle}{jodi[1]}"))
+                patti_freq[patti] = patti_freq.get(patti, 0) + weight
+    return {'first_digit': first_digit, 'second_digit': second_digit, 'jodi_freq': jodi_freq,
+            'patti_freq': patti_freq, 'distances': distances,
+            'near_miss': near_miss}
+
+
+def _sequence(size, seed, missing=0.1):
+    rng = np.random.default_rng(seed)
+    jodis = [f"{j:02d}" if rng.random() > missing else None for j in rng.integers(0, 100, size=size)]
+    pattis = [f"{p:03d}" if rng.random() > 0.5 else None for p in rng.integers(0, 1000, size=size)]
+    return jodis, pattis
+
+
+def _engine(jodis, pattis=None):
+    return PatternEngine.from_sequence(encode_jodis(jodis), encode_pattis(pattis) if pattis else None)
+
+
+def _dense(counts, parse, shape):
+    array = np.zeros(shape)
+    for key, value in counts.items():
+        array[parse(key)] += value
+    return array
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('with_pattis', [False, True])
+def test_engine_matches_the_baseline_dictionaries(seed, with_pattis):
+    jodis, pattis = _sequence(60, seed)
+    pattis = pattis if with_pattis else None
+    engine = _engine(jodis, pattis)
+    baseline = _baseline_counts(jodis, pattis)
+
+    np.testing.assert_array_equal(engine.first_digit_hist, _dense(baseline['first_digit'], int, 10))
+    np.testing.assert_array_equal(engine.second_digit_hist, _dense(baseline['second_digit'], int, 10))
+    np.testing.assert_allclose(engine.jodi_scores(), _dense(baseline['jodi_freq'], int, 100))
+    np.testing.assert_allclose(engine.patti_weights, _dense(baseline['patti_freq'], int, 1000))
+
+    np.testing.assert_array_equal(
+        engine.distances, _dense(baseline['distances'], lambda key: tuple(map(int, key.split(':dist:'))), (100, 100)))
+
+
+def test_near_miss_weights_match_the_baseline():
+    jodis, _ = _sequence(60, 3, missing=0)
+    engine = _engine(jodis)
+    near_miss = _baseline_counts(jodis)['near_miss']
+
+    for latest in range(100):
+        expected = np.zeros(100)
+        for key, value in near_miss.items():
+            if key.startswith(f"{latest:02d}->near:"):
+                expected[int(key.split('->near:')[1])] += value
+        np.testing.assert_allclose(engine.jodi_counts[latest] * NEAR_MISS_KERNEL[latest], expected)
+
+
+def test_update_adds_and_removes_observations():
+    jodis, pattis = _sequence(40, 4)
+    codes, patti_codes = encode_jodis(jodis), encode_pattis(pattis)
+    engine = PatternEngine.from_sequence(codes[:-1], patti_codes[:-1])
+    engine.update(codes[-2], codes[-1], patti_codes[-1])
+    expected = PatternEngine.from_sequence(codes, patti_codes)
+    for name in ('first_digit_hist', 'jodi_counts', 'distances',
+                 'patti_counts', 'sum_patti_counts', 'diff_patti_counts'):
+        np.testing.assert_array_equal(getattr(engine, name), getattr(expected, name), err_msg=name)
+
+    engine.update(codes[-2], codes[-1], patti_codes[-1], sign=-1)
+    np.testing.assert_array_equal(engine.distances, PatternEngine.from_sequence(codes[:-1]).distances)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_top_k_matches_a_full_sort(seed):
+    rng = np.random.default_rng(seed)
+    # Few distinct values, so ties across the partition boundary are common
+    scores = rng.integers(0, 4, size=100).astype(float)
+    exclude = rng.choice(100, size=10, replace=False)
+    for k in (0, 1, 4, 10, 99, 150):
+        for skip in (None, exclude):
+            expected = sorted((index for index in range(100) if scores[index] > 0
+                               and (skip is None or index not in skip)),
+                              key=lambda index: (-scores[index], index))[:k]
+            assert top_k(scores, k, skip).tolist() == expected
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_jodi_probabilities_rank_the_jodi_list(seed):
+    jodis, _ = _sequence(60, seed)
+    engine = _engine(jodis)
+    probabilities = engine.jodi_probabilities()
+
+    assert probabilities.shape == (NUM_JODIS,)
+    assert probabilities.sum() == pytest.approx(1.0)
+    assert probabilities.min() >= SMOOTHING / NUM_JODIS
+
+    # The jodi list is the most likely jodis, and the confidence their total mass
+    predictions = predictions_from_engine(engine, np.random.default_rng(0))
+    top = top_k(probabilities, JODI_LIST_SIZE)
+    assert predictions['jodi_list'] == [f"{jodi:02d}" for jodi in top]
+    assert predictions['confidence_score'] == pytest.approx(probabilities[top].sum(), abs=1e-4)
+    assert min(probabilities[top]) >= max(np.delete(probabilities, top))
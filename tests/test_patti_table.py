@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from ml.pattern_engine import encode_pattis
+from ml.patti_table import (
+    NUM_PATTIS, PATTI_ANK, PATTI_CONTAINS, PATTI_INDEX_BY_KEY, PATTI_STRINGS, PATTIS_BY_ANK,
+    patti_scores, random_pattis
+)
+
+
+def _valid_pattis():
+    """Every 3-digit panel written in ascending order with 0 counted as 10"""
+    order = lambda digit: 10 if digit == 0 else digit
+    return {
+        f"{a}{b}{c}" for a in range(10) for b in range(10) for c in range(10)
+        if order(a) <= order(b) <= order(c)
+    }
+
+
+def test_table_holds_exactly_the_valid_pattis():
+    valid = _valid_pattis()
+    assert NUM_PATTIS == len(valid) == 220
+    assert set(PATTI_STRINGS) == valid
+
+    for ank in range(10):
+        expected = {patti for patti in valid if sum(map(int, patti)) % 10 == ank}
+        assert len(expected) == 22
+        assert set(PATTI_STRINGS[PATTIS_BY_ANK[ank]]) == expected
+        assert (PATTI_ANK[PATTIS_BY_ANK[ank]] == ank).all()
+
+    for i, patti in enumerate(PATTI_STRINGS):
+        assert PATTI_CONTAINS[i].tolist() == [str(d) in patti for d in range(10)]
+
+
+def test_stored_pattis_map_back_to_their_table_entry():
+    # Results store pattis in any digit order; the sorted-digit key finds the panel
+    for i, patti in enumerate(PATTI_STRINGS):
+        for stored in {patti, patti[::-1], patti[1:] + patti[0]}:
+            assert PATTI_INDEX_BY_KEY[encode_pattis([stored])[0]] == i
+    assert (PATTI_INDEX_BY_KEY >= 0).sum() == NUM_PATTIS
+
+
+@pytest.mark.parametrize('ank', [None, 0, 7])
+def test_random_pattis_are_distinct_valid_pattis(ank):
+    pattis = random_pattis(np.random.default_rng(0), 10, ank)
+    assert len(set(pattis)) == 10
+    assert set(pattis) <= _valid_pattis()
+    if ank is not None:
+        assert all(sum(map(int, patti)) % 10 == ank for patti in pattis)
+
+
+def test_patti_scores_rank_every_patti():
+    weights = np.zeros(1000)
+    weights[encode_pattis(['127'])[0]] = 5
+    open_prob = np.eye(10)[3]
+    scores = patti_scores(weights, open_prob, np.full(10, 0.1))
+    assert scores.shape == (NUM_PATTIS,)
+    assert scores.sum() == pytest.approx(1.0)
+    assert scores.min() > 0
+    assert PATTI_STRINGS[scores.argmax()] == '127'
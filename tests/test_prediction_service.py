@@ -0,0 +1,71 @@
+import datetime
+import numpy as np
+from ml import market_state, predictor
+from models import Prediction, Result
+from services.data_service import upsert_rows
+from services.prediction_service import generate_predictions_batch, get_prediction_accuracy, update_predictions_for_market
+
+
+def test_prediction_accuracy_compares_string_digits_with_the_integer_columns(db):
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    before = yesterday - datetime.timedelta(days=1)
+    db.session.add_all([
+        Result(date=yesterday, market='Kalyan', open='123', jodi='69', close='450'),
+        Result(date=before, market='Kalyan', open='Off', jodi='Off', close='Off'),
+        Result(date=yesterday, market='Milan', open='007', jodi='70', close='999'),
+        # Predictions store their digits as strings
+        Prediction(date=yesterday, market='Kalyan', open_digits=['1', '3'], close_digits=['4', '0'],
+                   jodi_list=['12', '69']),
+        Prediction(date=before, market='Kalyan', open_digits=['1', '3'], jodi_list=['69']),
+        Prediction(date=yesterday, market='Milan', open_digits=['0', '8'], close_digits=['9', '9'],
+                   jodi_list=['07'])
+    ])
+    db.session.commit()
+
+    accuracy = get_prediction_accuracy()
+    assert accuracy['total'] == 3
+    assert (accuracy['open_matches'], accuracy['close_matches'], accuracy['jodi_matches']) == (1, 2, 1)
+
+    # 'Off' results are not scored
+    kalyan = accuracy['markets']['Kalyan']
+    assert (kalyan['total'], kalyan['open_accuracy'], kalyan['close_accuracy'], kalyan['jodi_accuracy']) == (1, 100, 100, 100)
+    milan = accuracy['markets']['Milan']
+    assert (milan['total'], milan['open_matches'], milan['close_matches'], milan['jodi_matches']) == (1, 0, 1, 0)
+
+
+def _prediction_fields(prediction):
+    return (prediction.date, prediction.open_digits, prediction.close_digits, prediction.jodi_list,
+            prediction.patti_list, prediction.confidence_score)
+
+
+def test_batch_predictions_match_per_market_predictions(db, model_dirs, monkeypatch):
+    monkeypatch.setattr(market_state, 'STATE_DIR', str(model_dirs))
+    monkeypatch.setattr(predictor, 'PREDICTION_CACHE_DIR', str(model_dirs))
+    rng = np.random.default_rng(0)
+    start = datetime.date.today() - datetime.timedelta(days=45)
+    markets = ['Kalyan', 'Milan Day', 'Rajdhani Night']
+    for market in markets:
+        for i in range(45):
+            jodi = 'Off' if i % 9 == 8 else f"{rng.integers(0, 100):02d}"
+            db.session.add(Result(date=start + datetime.timedelta(days=i), market=market, jodi=jodi))
+    db.session.commit()
+
+    expected = {market: _prediction_fields(update_predictions_for_market(market)) for market in markets}
+    Prediction.query.delete()
+    # The next-day prediction of one market already exists and is kept as it is
+    kept = Prediction(date=expected['Kalyan'][0], market='Kalyan', jodi_list=['00'])
+    db.session.add(kept)
+    db.session.commit()
+
+    saved = generate_predictions_batch()
+    assert sorted(saved) == ['Milan Day', 'Rajdhani Night']
+    for market in saved:
+        assert _prediction_fields(Prediction.query.filter_by(market=market).one()) == expected[market]
+    assert Prediction.query.filter_by(market='Kalyan').one().jodi_list == ['00']
+
+    assert generate_predictions_batch() == {}
+    # Rows written concurrently after the existence check are not overwritten either
+    upsert_rows(Prediction, [{'date': kept.date, 'market': 'Kalyan', 'jodi_list': ['11']}], update=False)
+    db.session.commit()
+    assert Prediction.query.filter_by(market='Kalyan').one().jodi_list == ['00']
+    assert Prediction.query.count() == len(markets)
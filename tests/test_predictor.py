@@ -0,0 +1,79 @@
+import os
+import time
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from ml import predictor
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(predictor, 'PREDICTION_CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _window(rows=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Jodi': [f"{j:02d}" for j in rng.integers(0, 100, size=rows)]})
+
+
+def test_same_inputs_give_same_prediction(cache_dir):
+    target = datetime.date(2025, 3, 4)
+    first = predictor.generate_predictions(_window(), 'Kalyan', target)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # Recomputed from scratch, not read back from the cache
+    for path in cache_dir.iterdir():
+        path.unlink()
+    assert predictor.generate_predictions(_window(), 'Kalyan', target) == first
+
+    # Another window is another cache entry
+    predictor.generate_predictions(_window(seed=1), 'Kalyan', target)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_confidence_score_is_seeded_by_target_date():
+    target = datetime.date(2025, 3, 4)
+    scores = {predictor.calculate_confidence_score('Kalyan', target_date=target) for _ in range(5)}
+    assert len(scores) == 1
+    assert 0.7 <= scores.pop() <= 0.9
+
+
+def test_prune_prediction_cache(tmp_path):
+    now = time.time()
+    for i in range(6):
+        path = tmp_path / f"{i}.json"
+        path.write_text('{}')
+        age_days = 40 if i == 0 else i
+        os.utime(path, (now - age_days * 86400, now - age_days * 86400))
+    (tmp_path / 'keep.tmp').write_text('')
+
+    deleted = predictor.prune_prediction_cache(max_age_days=30, max_files=3, cache_dir=str(tmp_path))
+
+    # 0 is too old; of the rest only the three newest stay
+    assert deleted == 3
+    assert sorted(os.listdir(tmp_path)) == ['1.json', '2.json', '3.json', 'keep.tmp']
+
+
+def test_model_probabilities_are_blended(cache_dir):
+    target = datetime.date(2025, 3, 4)
+    heuristic = predictor.generate_predictions(_window(), 'Kalyan', target)
+
+    # Without usable model output the prediction is the heuristic one
+    assert predictor.generate_predictions(_window(), 'Kalyan', target, None) == heuristic
+    flat = {'open': np.zeros(10), 'close': np.zeros(10), 'jodi': np.zeros(100)}
+    unusable = predictor.generate_predictions(_window(), 'Kalyan', target, flat)
+    for key in ('jodi_list', 'jodi_probabilities', 'open_probabilities', 'close_probabilities'):
+        assert unusable[key] == heuristic[key]
+
+    # A confident model pulls its classes up
+    jodi = np.zeros(100)
+    jodi[42] = 1.0
+    digits = np.zeros(10)
+    digits[7] = 1.0
+    model = {'open': digits, 'close': digits, 'jodi': jodi}
+    blended = predictor.generate_predictions(_window(), 'Kalyan', target, model)
+    assert '42' in blended['jodi_list']
+    assert blended['jodi_probabilities'] != heuristic['jodi_probabilities']
+    assert len(os.listdir(cache_dir)) == 3
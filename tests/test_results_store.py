@@ -0,0 +1,96 @@
+import datetime
+import numpy as np
+import pandas as pd
+from ml import results_store
+from ml.results_store import (
+    MISSING, append_csv_rows, append_results_store, csv_has_results, csv_store_path,
+    load_results_store, segment_paths, write_results_store
+)
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=['Date', 'Market', 'Open', 'Jodi', 'Close'])
+
+
+def test_appended_rows_replace_and_extend_the_store(tmp_path):
+    path = str(tmp_path / 'results.arrow')
+    write_results_store(_frame([
+        ('01/01/2024', 'Kalyan', '123', '69', '450'),
+        ('02/01/2024', 'Kalyan', 'Off', 'Off', 'Off'),
+        ('01/01/2024', 'Milan', '007', '70', '999'),
+    ]), path)
+
+    append_results_store(_frame([
+        ('02/01/2024', 'Kalyan', '111', '34', '222'),
+        ('03/01/2024', 'Kalyan', '333', '99', '444'),
+        ('01/01/2024', 'Time Bazar', '555', '55', '555'),
+    ]), path)
+    assert len(segment_paths(path)) == 1
+
+    history = load_results_store(path)
+    assert history.markets == ['Kalyan', 'Milan', 'Time Bazar']
+    assert history.jodi.tolist() == [69, 34, 99, 70, 55]
+    kalyan = history.to_frame('Kalyan')
+    assert kalyan['Open'].tolist() == ['123', '111', '333']
+
+    # A full write drops the segments
+    write_results_store(_frame([('01/01/2024', 'Kalyan', 'Off', 'Off', 'Off')]), path)
+    assert segment_paths(path) == []
+    assert load_results_store(path).jodi.tolist() == [MISSING]
+
+
+def test_segments_are_compacted(tmp_path):
+    path = str(tmp_path / 'results.arrow')
+    write_results_store(_frame([('01/01/2024', 'Kalyan', '123', '00', '450')]), path)
+    start = datetime.date(2024, 1, 2)
+    for i in range(5):
+        day = (start + datetime.timedelta(days=i)).strftime('%d/%m/%Y')
+        append_results_store(_frame([(day, 'Kalyan', '123', f"{i + 1:02d}", '450')]), path, max_segments=3)
+
+    # Three segments, then one compaction that folds them in, then one more segment
+    assert len(segment_paths(path)) == 1
+    assert load_results_store(path).jodi.tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_contains(tmp_path):
+    path = str(tmp_path / 'results.arrow')
+    write_results_store(_frame([
+        ('01/01/2024', 'Kalyan', '123', '69', '450'),
+        ('05/01/2024', 'Kalyan', '123', '69', '450'),
+        ('03/01/2024', 'Milan', '123', '69', '450'),
+    ]), path)
+    history = load_results_store(path)
+    dates = pd.to_datetime(['2024-01-01', '2024-01-03', '2024-01-03', '2024-01-05', '2024-01-01'])
+    markets = ['Kalyan', 'Kalyan', 'Milan', 'Kalyan', 'Unknown']
+    np.testing.assert_array_equal(history.contains(dates, markets), [True, False, True, True, False])
+
+
+def test_csv_mirror(tmp_path, monkeypatch):
+    csv_path = str(tmp_path / 'history.csv')
+    pd.DataFrame({
+        'Date': ['01/01/2024', '02/01/2024'], 'Market': ['Kalyan', 'Kalyan'],
+        'Open': ['123', '456'], 'Jodi': ['69', '57'], 'Close': ['450', '890'], 'is_holiday': [0, 0]
+    }).to_csv(csv_path, index=False)
+
+    assert csv_has_results(csv_path, ['01/01/2024', '03/01/2024'], ['Kalyan', 'Kalyan']).tolist() == [True, False]
+
+    # The mirror is used as long as it is current
+    monkeypatch.setattr(results_store.pd, 'read_csv', _fail_read_csv(pd.read_csv))
+    append_csv_rows(csv_path, pd.DataFrame({
+        'Date': ['03/01/2024'], 'Market': ['Kalyan'], 'Open': ['111'], 'Jodi': ['34'], 'Close': ['222'], 'extra': [1]
+    }))
+    assert csv_has_results(csv_path, ['03/01/2024'], ['Kalyan']).tolist() == [True]
+    monkeypatch.undo()
+
+    df = pd.read_csv(csv_path, dtype=str)
+    assert df.columns.tolist() == ['Date', 'Market', 'Open', 'Jodi', 'Close', 'is_holiday']
+    assert df['Jodi'].tolist() == ['69', '57', '34']
+    assert segment_paths(csv_store_path(csv_path))
+
+
+def _fail_read_csv(read_csv):
+    """read_csv that only allows reading the header"""
+    def _read_csv(*args, **kwargs):
+        assert kwargs.get('nrows') == 0, "the whole CSV was parsed"
+        return read_csv(*args, **kwargs)
+    return _read_csv
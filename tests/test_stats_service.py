@@ -0,0 +1,85 @@
+import datetime
+import numpy as np
+from models import MarketStat, Result
+from services.data_service import upsert_rows
+from utils import calculate_digit_fields
+from services.stats_service import get_market_stats, get_monthly_counts, rebuild_market_stats
+
+START = datetime.date(2024, 1, 1)
+
+
+def _cells(db):
+    return {(s.market, s.kind, s.period, s.value): s.count for s in MarketStat.query.all() if s.count}
+
+
+def _assert_matches_rebuild(db):
+    maintained = _cells(db)
+    rebuild_market_stats()
+    db.session.flush()
+    assert maintained == _cells(db)
+
+
+def _row(rng, market, day):
+    jodi = f"{rng.integers(0, 100):02d}" if rng.random() > 0.2 else 'Off'
+    open_ = f"{rng.integers(0, 1000):03d}" if jodi != 'Off' else 'Off'
+    return {'date': START + datetime.timedelta(days=int(day)), 'market': market,
+            'open': open_, 'jodi': jodi, 'close': f"{rng.integers(0, 1000):03d}"}
+
+
+def test_flushed_batches_match_a_rebuild(db):
+    rng = np.random.default_rng(0)
+    for market in ('Kalyan', 'Milan'):
+        for day in rng.choice(120, size=60, replace=False):
+            db.session.add(Result(**_row(rng, market, day)))
+    db.session.commit()
+    _assert_matches_rebuild(db)
+
+    # Several inserts, edits and deletes of a market in one flush
+    for _ in range(5):
+        results = Result.query.all()
+        taken = {(result.market, result.date) for result in results}
+        free = [day for day in range(400) if ('Kalyan', START + datetime.timedelta(days=day)) not in taken]
+        days = iter(rng.choice(free, size=12, replace=False))
+        for result in rng.choice(results, size=8, replace=False):
+            if rng.random() < 0.4:
+                db.session.delete(result)
+            else:
+                result.jodi = _row(rng, result.market, 0)['jodi']
+                if result.market == 'Kalyan' and rng.random() < 0.3:
+                    result.date = START + datetime.timedelta(days=int(next(days)))
+        for day in days:
+            db.session.add(Result(**_row(rng, 'Kalyan', day)))
+        db.session.commit()
+        _assert_matches_rebuild(db)
+
+
+def _upsert_row(rng, market, day):
+    # Writers of the upsert path fill in the integer columns themselves
+    row = _row(rng, market, day)
+    row.update(calculate_digit_fields(row))
+    return row
+
+
+def test_upserted_batches_match_a_rebuild(db):
+    rng = np.random.default_rng(1)
+    upsert_rows(Result, [_upsert_row(rng, 'Kalyan', day) for day in range(0, 90, 2)])
+    db.session.commit()
+    _assert_matches_rebuild(db)
+
+    # Overwrites interleaved with new days, and repeated rows
+    rows = [_upsert_row(rng, 'Kalyan', day) for day in rng.choice(100, size=30, replace=False)]
+    upsert_rows(Result, rows + rows[:3])
+    db.session.commit()
+    _assert_matches_rebuild(db)
+
+
+def test_readers(db):
+    for day, jodi in enumerate(['12', '34', 'Off', '12', '35']):
+        db.session.add(Result(date=START + datetime.timedelta(days=day), market='Kalyan',
+                              open='Off', jodi=jodi, close='Off'))
+    db.session.commit()
+
+    assert get_market_stats('jodi', 'Kalyan') == {12: 2, 34: 1, 35: 1}
+    assert get_market_stats('total') == {0: 5}
+    assert get_market_stats('transition', 'Kalyan') == {1234: 1, 3412: 1, 1235: 1}
+    assert get_monthly_counts('jodi') == {202401: 4}
@@ -0,0 +1,61 @@
+import numpy as np
+from ml import feature_store, trainer
+from ml.model_registry import current_bundle_path, load_bundle
+
+
+def test_windows_with_off_days_train(model_dirs, history):
+    df = history(80)
+    assert (df.tail(60)['Jodi'] == 'Off').any()
+
+    info = trainer.train_model(df, 'Kalyan')
+    assert info is not None
+    assert info['last_date'] == '2024-03-20'
+
+    bundle = load_bundle(current_bundle_path('Kalyan'))
+    # Every training pair has a next-day jodi: 59 day pairs minus the 'Off' days
+    pairs = feature_store.training_pairs(feature_store.load_cached_features('Kalyan'))[1]
+    assert (pairs[:, 2] >= 0).all()
+    assert len(pairs) == 59 - (df.tail(59)['Jodi'] == 'Off').sum()
+    assert bundle['jodi_model'].n_features_in_ == len(bundle['feature_columns'])
+
+
+def test_plan_cpu_budget_never_exceeds_the_budget(monkeypatch):
+    for cpu_budget in range(1, 17):
+        for n_markets in range(0, 40):
+            workers, threads = trainer.plan_cpu_budget(n_markets, cpu_budget)
+            assert 1 <= workers <= max(1, n_markets)
+            assert threads >= 1
+            assert workers * threads <= cpu_budget
+
+    monkeypatch.setattr(trainer.Config, 'TRAINING_CPU_BUDGET', 6)
+    assert trainer.plan_cpu_budget(4) == (4, 1)
+    assert trainer.plan_cpu_budget(2) == (2, 3)
+
+
+def test_incremental_update_adds_rounds_without_refitting(model_dirs, history, monkeypatch):
+    df = history(90)
+    trainer.train_model(df.head(80), 'Kalyan')
+    base = load_bundle(current_bundle_path('Kalyan'))
+    base_trees = {name: base[name].get_booster().get_dump() for name in ('open_model', 'close_model')}
+    base_rounds = {name: base[name].get_booster().num_boosted_rounds() for name in base_trees}
+
+    def refit(*args, **kwargs):
+        raise AssertionError("update_model fell back to a full training run")
+    monkeypatch.setattr(trainer, 'train_model', refit)
+
+    info = trainer.update_model(df, 'Kalyan')
+    assert info['last_date'] == '2024-03-30'
+    assert info['incremental_updates'] == 1
+    updated = load_bundle(current_bundle_path('Kalyan'))
+    for name, trees in base_trees.items():
+        booster = updated[name].get_booster()
+        assert booster.num_boosted_rounds() == base_rounds[name] + trainer.INCREMENTAL_ROUNDS
+        # The trees boosted before are kept as they were
+        assert booster.get_dump()[:len(trees)] == trees
+
+    # The scaler and the jodi model are reused untouched
+    np.testing.assert_array_equal(updated['scaler'].mean_, base['scaler'].mean_)
+    X = base['scaler'].transform(np.zeros((1, len(base['feature_columns']))))
+    np.testing.assert_array_equal(updated['jodi_model'].predict_proba(X), base['jodi_model'].predict_proba(X))
+
+    assert trainer.update_model(df, 'Kalyan') is None
@@ -0,0 +1,44 @@
+import json
+import types
+import zlib
+import numpy as np
+from ml import tuning
+
+
+def _score(args):
+    """A distinct deterministic score per configuration, shifted by the number of folds"""
+    kind, params, X, Y, folds, n_jobs = args
+    return -zlib.crc32(json.dumps(params, sort_keys=True).encode()) / 2 ** 32 - 0.01 * len(folds)
+
+
+def test_successive_halving_keeps_the_best_config(monkeypatch):
+    scored = []
+    monkeypatch.setattr(tuning, '_score_config', lambda args: scored.append(args) or _score(args))
+    executor = types.SimpleNamespace(map=map)
+    folds = tuning.walk_forward_folds(150)
+    assert len(folds) == tuning.NUM_FOLDS
+
+    best, score, n_folds = tuning.successive_halving(
+        'xgb', tuning.XGB_SEARCH_SPACE, None, None, folds, executor, 1, np.random.default_rng(0))
+
+    sampled = tuning.sample_configs(tuning.XGB_SEARCH_SPACE, tuning.NUM_CONFIGS, np.random.default_rng(0))
+    expected = max(sampled, key=lambda params: _score(('xgb', params, None, None, folds, 1)))
+    assert best == expected
+    assert score == _score(('xgb', expected, None, None, folds, 1))
+    assert n_folds == len(folds)
+
+    # 27 configs on 1 fold, the best 9 on 3 folds, the best 3 on all 9
+    rungs = [len(args[4]) for args in scored]
+    assert rungs == [1] * 27 + [3] * 9 + [9] * 3
+    assert expected in [args[1] for args in scored[-3:]]
+
+
+def test_walk_forward_folds_never_train_on_later_rows():
+    folds = tuning.walk_forward_folds(150)
+    for train, test in folds:
+        assert train.max() < test.min()
+        assert len(test) == tuning.FOLD_TEST_DAYS
+        assert 30 <= len(train) <= tuning.Config.TRAINING_DAYS
+    tests = np.concatenate([test for _, test in folds])
+    assert len(np.unique(tests)) == len(tests)
+    assert tuning.walk_forward_folds(35) == []
@@ -5,6 +5,7 @@ from app import app, db
 from models import Result, Prediction
 from ml.predictor import generate_predictions, calculate_confidence_score
 from ml.trainer import train_model
+from services.prediction_service import load_model_probabilities
 import logging
 
 # Set up logging
@@ -109,11 +110,12 @@ def generate_predictions_for_market(market):
         
         df = pd.DataFrame(data)
         
-        # Generate prediction
-        prediction_data = generate_predictions(df, market)
+        # Generate prediction, blended with the models trained above
+        model_probabilities = load_model_probabilities([market]).get(market)
+        prediction_data = generate_predictions(df, market, next_day, model_probabilities)
         
         # Calculate confidence score
-        confidence_score = calculate_confidence_score(market)
+        confidence_score = calculate_confidence_score(market, target_date=next_day)
         
         # Create new prediction
         new_prediction = Prediction(
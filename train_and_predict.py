@@ -4,7 +4,7 @@ import datetime
 from app import app, db
 from models import Result, Prediction, MLModel
 from services.prediction_service import train_models_for_all_markets, update_predictions_for_market
-from ml.feature_engineering import engineer_features
+from ml.results_store import load_results_store
 from config import Config
 
 def main():
@@ -12,8 +12,12 @@ def main():
     print("Starting model training and prediction generation...")
     
     with app.app_context():
-        # Get markets
-        markets = set(Result.query.with_entities(Result.market).distinct().all())
+        # Get markets from the results mirror, or the database before it exists
+        history = load_results_store()
+        if history is not None:
+            markets = list(history.markets)
+        else:
+            markets = [m[0] for m in Result.query.with_entities(Result.market).distinct().all()]
         
         print(f"Found {len(markets)} markets: {markets}")
         
@@ -26,8 +30,7 @@ def main():
             print(f"Error training models: {e}")
         
         # Generate predictions for all markets
-        for market_tuple in markets:
-            market = market_tuple[0]
+        for market in markets:
             try:
                 print(f"Generating predictions for {market}...")
                 prediction = update_predictions_for_market(market)
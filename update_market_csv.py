@@ -6,6 +6,7 @@ import os
 import traceback
 import time
 import logging
+from ml.results_store import csv_has_results
 import sys
 
 # Setup logging
@@ -171,32 +172,27 @@ def update_csv_with_results(results):
     """Update CSV with new results"""
     logger.info(f"Updating CSV with {len(results)} results")
     
-    # Load existing CSV if it exists
-    if os.path.exists(CSV_FILE):
-        df = pd.read_csv(CSV_FILE)
-        logger.info(f"Loaded existing CSV with {len(df)} rows")
-    else:
-        # Create new dataframe
-        df = pd.DataFrame(columns=['Date', 'Market', 'Open', 'Jodi', 'Close',
-                                  'day_of_week', 'is_weekend', 'open_sum', 'close_sum',
-                                  'mirror_open', 'mirror_close', 'reverse_jodi', 'is_holiday'])
-        logger.info("Created new CSV file")
-    
-    # Get existing date-market combinations
-    if not df.empty:
-        existing = set(zip(df['Date'], df['Market']))
-    else:
-        existing = set()
+    # Get existing date-market combinations from the CSV's columnar mirror, so
+    # the CSV is only parsed when there is something to add
+    existing = csv_has_results(CSV_FILE, [r['Date'] for r in results], [r['Market'] for r in results])
     
     # Filter out existing records
-    new_results = []
-    for result in results:
-        if (result['Date'], result['Market']) not in existing:
-            new_results.append(result)
+    new_results = [result for result, exists in zip(results, existing) if not exists]
     
     logger.info(f"Adding {len(new_results)} new records to CSV")
     
     if new_results:
+        # Load existing CSV if it exists
+        if os.path.exists(CSV_FILE):
+            df = pd.read_csv(CSV_FILE)
+            logger.info(f"Loaded existing CSV with {len(df)} rows")
+        else:
+            # Create new dataframe
+            df = pd.DataFrame(columns=['Date', 'Market', 'Open', 'Jodi', 'Close',
+                                      'day_of_week', 'is_weekend', 'open_sum', 'close_sum',
+                                      'mirror_open', 'mirror_close', 'reverse_jodi', 'is_holiday'])
+            logger.info("Created new CSV file")
+        
         # Convert new results to dataframe
         new_df = pd.DataFrame(new_results)
         
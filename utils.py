@@ -56,8 +56,18 @@ def parse_date(date_str):
     return datetime.datetime.strptime(date_str, "%d/%m/%Y").date()
 
 
-def calculate_statistics(results_df):
-    """Calculate statistics from results dataframe"""
+def calculate_statistics(results_df=None, market=None):
+    """
+    Calculate statistics from results dataframe
+    
+    Without a dataframe the stored results are counted in the database instead
+    (`services.data_service.get_result_statistics`), optionally for one market.
+    """
+    if results_df is None:
+        # Imported here: the services import this module
+        from services.data_service import get_result_statistics
+        return get_result_statistics(market)
+    
     stats = {}
     
     # Total records
@@ -76,6 +86,12 @@ def calculate_statistics(results_df):
     # Most common jodis
     stats['common_jodis'] = results_df['jodi'].value_counts().head(10).to_dict()
     
+    # Most common steps from a jodi to the market's next jodi
+    jodis = results_df[results_df['jodi'].astype(str).str.fullmatch(r'\d{2}')]
+    jodis = jodis.assign(day=pd.to_datetime(jodis['Date'], format='%d/%m/%Y')).sort_values(['Market', 'day'])
+    steps = jodis['jodi'] + '-' + jodis.groupby('Market')['jodi'].shift(-1)
+    stats['common_transitions'] = steps.dropna().value_counts().head(10).to_dict()
+    
     # Monthly trends
     results_df['month'] = pd.to_datetime(results_df['Date'], format='%d/%m/%Y').dt.month
     stats['monthly_trends'] = results_df.groupby('month')['jodi'].count().to_dict()
@@ -83,9 +99,38 @@ def calculate_statistics(results_df):
     return stats
 
 
+def calculate_digit_fields(row):
+    """
+    Integer columns of a result row: open/close panel numbers, their anks (panel
+    digit sum mod 10, else the jodi digit) and the jodi number
+    
+    Values that are missing, 'Off' or not all digits give None. Rows without any of
+    the lowercase result keys give an empty dictionary.
+    """
+    if not any(key in row for key in ('open', 'jodi', 'close')):
+        return {}
+    
+    def _number(value, width):
+        # CSV readers may hand over numbers that lost their leading zeros
+        if isinstance(value, (int, np.integer, float, np.floating)) and not pd.isna(value) and value == int(value):
+            value = str(int(value)).zfill(width)
+        if isinstance(value, str) and len(value) == width and value.isdigit():
+            return int(value)
+        return None
+    
+    jodi_num = _number(row.get('jodi'), 2)
+    fields = {'jodi_num': jodi_num}
+    for side, jodi_digit in (('open', jodi_num // 10 if jodi_num is not None else None),
+                             ('close', jodi_num % 10 if jodi_num is not None else None)):
+        panel = _number(row.get(side), 3)
+        fields[f'{side}_panel'] = panel
+        fields[f'{side}_ank'] = sum(int(digit) for digit in f'{panel:03d}') % 10 if panel is not None else jodi_digit
+    return fields
+
+
 def calculate_derived_fields(row):
     """Calculate derived fields for a result row"""
-    derived = {}
+    derived = calculate_digit_fields(row)
     
     # Skip calculation if the row has 'Off' values
     if row.get('open') == 'Off' or row.get('close') == 'Off' or row.get('jodi') == 'Off':
@@ -119,22 +164,27 @@ def calculate_derived_fields(row):
 
 
 def is_matching_prediction(prediction, result):
-    """Check if prediction matches result"""
+    """
+    Check if prediction matches result
+    
+    Predicted digits may be strings ('3', as the predictor stores them) or ints;
+    both sides are compared as ints.
+    """
     matches = {}
     
     # Check open digits
     if prediction.get('open_digits') and result.get('open'):
         open_str = result.get('open')
-        if len(open_str) == 3:
-            predicted_open = prediction.get('open_digits')
+        if len(open_str) == 3 and open_str.isdigit():
+            predicted_open = [int(digit) for digit in prediction.get('open_digits')]
             actual_open = [int(open_str[0]), int(open_str[2])]
             matches['open'] = predicted_open == actual_open
     
     # Check close digits
     if prediction.get('close_digits') and result.get('close'):
         close_str = result.get('close')
-        if len(close_str) == 3:
-            predicted_close = prediction.get('close_digits')
+        if len(close_str) == 3 and close_str.isdigit():
+            predicted_close = [int(digit) for digit in prediction.get('close_digits')]
             actual_close = [int(close_str[0]), int(close_str[2])]
             matches['close'] = predicted_close == actual_close
     